@@ -0,0 +1,66 @@
+"""Check the import time of lhfs modules
+
+Each module is imported in a new interpreter, the best time of some runs is
+compared with its budget. Importing the ctl command must not import the
+heavy dependencies, they are imported by the sub commands which use them.
+
+Usage: python benchmarks/import_time.py [--runs N]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+# module: budget in milliseconds
+BUDGETS = {
+    'lhfs.common.conf': 60,
+    'lhfs.core.objects': 80,
+    'lhfs.cmd.ctl': 150,
+}
+HEAVY_MODULES = ['tornado', 'bs4', 'prettytable', 'paramiko', 'gevent',
+                 'zerorpc', 'PIL']
+
+TIMER = """
+import sys, time
+start = time.perf_counter()
+import {module}
+print((time.perf_counter() - start) * 1000)
+print(','.join(sorted(set(m.split('.')[0] for m in sys.modules))))
+"""
+
+
+def measure(module):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [root] + [p for p in [env.get('PYTHONPATH')] if p])
+    output = subprocess.check_output(
+        [sys.executable, '-c', TIMER.format(module=module)], env=env,
+        text=True)
+    elapsed, modules = output.strip().splitlines()[-2:]
+    return float(elapsed), set(modules.split(','))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    failed = False
+    for module, budget in BUDGETS.items():
+        elapsed, modules = min(measure(module) for _ in range(args.runs))
+        status = 'ok' if elapsed <= budget else 'SLOW'
+        print(f'{module:24} {elapsed:8.1f} ms  (budget {budget} ms)  '
+              f'{status}')
+        if elapsed > budget:
+            failed = True
+        if module == 'lhfs.cmd.ctl':
+            loaded = sorted(set(HEAVY_MODULES) & modules)
+            if loaded:
+                print(f'{module} imports heavy modules: {", ".join(loaded)}')
+                failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
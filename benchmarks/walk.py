@@ -0,0 +1,115 @@
+"""Compare the tree walker with easy2use.fs.find
+
+Find the files matching a partern and stat them, like the search without
+the filename index. A tree of files is created if --root is not given.
+With --latency, each os.scandir() call sleeps first, to simulate the round
+trip of network-backed storage.
+
+Usage: python benchmarks/walk.py [--root PATH] [--partern *.py]
+                                 [--workers 1,4,8,16] [--drop-caches]
+                                 [--latency MS]
+"""
+import argparse
+import fnmatch
+import os
+import random
+import string
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from easy2use import fs  # noqa: E402
+
+from lhfs.core import walker  # noqa: E402
+
+
+def make_tree(root, dirs=400, files=250):
+    random.seed(0)
+    for index in range(dirs):
+        dir_path = os.path.join(root, f'd{index % 20}', f'd{index}')
+        os.makedirs(dir_path)
+        for _ in range(files):
+            name = ''.join(random.choices(string.ascii_lowercase, k=10))
+            suffix = random.choice(['.py', '.txt', '.jpg'])
+            open(os.path.join(dir_path, name + suffix), 'w').close()
+
+
+def add_scandir_latency(latency):
+    scandir = os.scandir
+
+    def slow_scandir(*args, **kwargs):
+        time.sleep(latency)
+        return scandir(*args, **kwargs)
+
+    os.scandir = slow_scandir
+
+
+def drop_caches():
+    subprocess.run(['sync'])
+    try:
+        with open('/proc/sys/vm/drop_caches', 'w') as f:
+            f.write('3\n')
+    except OSError as e:
+        print(f'drop caches failed: {e}')
+
+
+def find_with_easy2use(root, partern):
+    return [os.stat(os.path.join(dir_path, name))
+            for dir_path, name in fs.find(root, partern)]
+
+
+def find_with_walker(root, partern, workers):
+    scan = walker.match_scan(lambda name: fnmatch.fnmatch(name, partern))
+    return [entry_stat
+            for _, _, matched in walker.TreeWalker(workers).walk(root,
+                                                                 scan=scan)
+            for _, entry_stat in matched]
+
+
+def timeit(func, args, runs, cold):
+    best = None
+    for _ in range(runs):
+        if cold:
+            drop_caches()
+        start = time.perf_counter()
+        count = len(func(*args))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--root')
+    parser.add_argument('--partern', default='*.py')
+    parser.add_argument('--workers', default='1,4,8,16')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--drop-caches', action='store_true',
+                        help='drop page cache before each run, needs root')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='milliseconds to sleep before each scandir')
+    args = parser.parse_args()
+
+    root = args.root
+    if not root:
+        root = tempfile.mkdtemp()
+        make_tree(root)
+    if args.latency:
+        add_scandir_latency(args.latency / 1000)
+    elapsed, count = timeit(find_with_easy2use, (root, args.partern),
+                            args.runs, args.drop_caches)
+    print(f'{"easy2use.fs.find":20} {elapsed * 1000:9.1f} ms  {count} matched')
+    for workers in [int(w) for w in args.workers.split(',')]:
+        elapsed, count = timeit(find_with_walker,
+                                (root, args.partern, workers),
+                                args.runs, args.drop_caches)
+        print(f'{f"walker workers={workers}":20} {elapsed * 1000:9.1f} ms  '
+              f'{count} matched')
+
+
+if __name__ == '__main__':
+    main()
@@ -4,9 +4,6 @@ import mimetypes
 import os
 import sys
 
-import bs4
-import prettytable
-
 from easy2use.common import colorstr
 from easy2use.globals import cli
 from easy2use.globals import log
@@ -18,8 +15,6 @@ from lhfs.common import exception
 from lhfs.common import utils
 from lhfs.common import constants
 
-from lhfs import server
-
 CONF = None
 LOG = logging.getLogger(__name__)
 
@@ -47,6 +42,8 @@ class NodeLists(cli.SubCli):
     ]
 
     def __call__(self, args):
+        import prettytable
+
         LOG.debug('master rpc address %s', args.master)
         rpc_client = utils.get_rpc_client(args.master)
         rows = ['hostname', 'type', 'transport', 'status', 'heartbeat']
@@ -69,6 +66,11 @@ class Ls(cli.SubCli):
         cli.Arg('--host', help='The host to list, default is master host'),
         cli.Arg('-m', '--master', default='http://localhost:9527',
                 help='Master rpc address'),
+        cli.Arg('-s', '--sort', choices=['name', 'size', 'mtime', 'type'],
+                help='Sort the items by the field'),
+        cli.Arg('-r', '--reverse', action='store_true',
+                help='Sort in descending order'),
+        cli.Arg('-n', '--limit', type=int, help='List the first N items'),
         cli.Arg('path', nargs='?', default='/', help='default path: /'),
     ]
 
@@ -86,7 +88,13 @@ class Ls(cli.SubCli):
         rpc_client = utils.get_rpc_client(node.transport)
         line = '{} {:30} {:>10} {}'
         try:
-            for item in rpc_client.ls(args.path):
+            if args.sort or args.limit:
+                items = rpc_client.ls_page(
+                    args.path, sort=args.sort or 'name',
+                    reverse=args.reverse, limit=args.limit)['children']
+            else:
+                items = rpc_client.ls(args.path)
+            for item in items:
                 item_dict = item.to_dict(human=True)
                 print(line.format(item.folder and 'd' or '-',
                                   item.name, item_dict['size'],
@@ -98,7 +106,8 @@ class Ls(cli.SubCli):
 class Du(cli.SubCli):
     NAME = 'du'
     ARGUMENTS = [
-        cli.Arg('--host')
+        cli.Arg('--host'),
+        cli.Arg('--path', help='Show the recursive size of the path'),
     ]
 
     def __call__(self, args):
@@ -118,6 +127,10 @@ class Du(cli.SubCli):
             print_error(e)
             return 1
 
+        if args.path:
+            return self.print_path_usage(nodes, args.path)
+        import prettytable
+
         rows = ['hostname', 'total', 'used', 'percent']
         pt = prettytable.PrettyTable(rows)
         for node in nodes:
@@ -131,6 +144,32 @@ class Du(cli.SubCli):
                         usage.get('percent')])
         print(pt)
 
+    def print_path_usage(self, nodes, path):
+        import prettytable
+
+        rows = ['hostname', 'name', 'size', 'allocated', 'files', 'dirs']
+        pt = prettytable.PrettyTable(rows)
+        pt.align.update({'name': 'l', 'size': 'r', 'allocated': 'r'})
+        for node in nodes:
+            if node.status != constants.ACTIVE:
+                LOG.warning('Node %s is inactive, skip.', node.hostname)
+                continue
+            rpc_client = utils.get_rpc_client(node.transport)
+            try:
+                result = rpc_client.du(path)
+            except Exception as e:
+                LOG.error('du %s on %s failed: %s', path, node.hostname, e)
+                continue
+            for item in result['children'] + [dict(result, name=path)]:
+                pt.add_row([node.hostname, item['name'],
+                            utils.human_size(item['size']),
+                            utils.human_size(item['allocated']),
+                            item['files'], item['dirs']])
+            if result['errors']:
+                LOG.warning('%s errors on %s', result['errors'],
+                            node.hostname)
+        print(pt)
+
 
 class CollectStatic(cli.SubCli):
     NAME = 'collect-static'
@@ -141,6 +180,8 @@ class CollectStatic(cli.SubCli):
     ]
 
     def __call__(self, args):
+        import bs4
+
         with open(args.file) as f:
             html = bs4.BeautifulSoup(f.read(), features="html.parser")
         static_files = []
@@ -185,6 +226,9 @@ class Serve(cli.SubCli):
     ]
 
     def __call__(self, args):
+        # tornado and the managers are only needed by the server
+        from lhfs import server
+
         if system.OS.is_windows():
             # NOTE(fjboy) For windows host, MIME type of .js file is
             # 'text/plain', so add this type before start http server.
@@ -198,11 +242,17 @@ class Serve(cli.SubCli):
             service = server.LightHttpFSSlave(fs_root=CONF.lhfs.root,
                                               ssh_user=args.ssh_user,
                                               ssh_password=args.ssh_password)
-            service.start()
+            try:
+                service.start()
+            finally:
+                service.stop()
         else:
             service = server.LightHttpFS(fs_root=CONF.lhfs.root,
                                          password=args.password)
-            service.start(develop=args.develop)
+            try:
+                service.start(develop=args.develop)
+            finally:
+                service.stop()
 
 
 def main():
@@ -21,7 +21,8 @@ def registe_stop_signal(service):
 
     def handle_signal(signum, frame):
         LOG.info('receive signal: %s', signum)
-        service.stop()
+        # the service is stopped after start() returns
+        raise SystemExit(0)
 
     signal.signal(signal.SIGINT, handle_signal)
     # signal.signal(signal.SIGHUP, handle_signal)
@@ -72,21 +73,29 @@ def main():
         raise exception.InvalidRootPath(root=args.root, reason='not exists')
 
     from gevent import monkey
-    monkey.patch_all()
+    # the walker, index and stat threads must be native threads, so
+    # that the blocking file system calls run in parallel
+    monkey.patch_all(thread=False)
 
     if args.slave:
         service = server.LightHttpFSSlave(fs_root=CONF.lhfs.root,
                                           ssh_user=args.ssh_user,
                                           ssh_password=args.ssh_password)
         registe_stop_signal(service)
-        service.start()
+        try:
+            service.start()
+        finally:
+            service.stop()
     else:
         service = server.LightHttpFS(fs_root=CONF.lhfs.root,
                                      password=args.password,
                                      theme=args.theme)
-        service.start(develop=DEVELOPMENT)
         if not DEVELOPMENT:
             registe_stop_signal(service)
+        try:
+            service.start(develop=DEVELOPMENT)
+        finally:
+            service.stop()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,155 @@
+import logging
+import zlib
+
+from tornado import web
+
+from lhfs.common import conf
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CONF = conf.CONF
+LOG = logging.getLogger(__name__)
+
+
+class GzipCompressor(object):
+
+    def __init__(self, level):
+        self._compressobj = zlib.compressobj(level, zlib.DEFLATED,
+                                             16 + zlib.MAX_WBITS)
+
+    def compress(self, data, finishing):
+        return self._compressobj.compress(data) + self._compressobj.flush(
+            zlib.Z_FINISH if finishing else zlib.Z_SYNC_FLUSH)
+
+
+class BrotliCompressor(object):
+
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=min(level, 11))
+
+    def compress(self, data, finishing):
+        return self._compressor.process(data) + (
+            self._compressor.finish() if finishing
+            else self._compressor.flush())
+
+
+class ZstdCompressor(object):
+
+    def __init__(self, level):
+        self._compressobj = zstandard.ZstdCompressor(
+            level=level).compressobj()
+
+    def compress(self, data, finishing):
+        return self._compressobj.compress(data) + self._compressobj.flush(
+            zstandard.COMPRESSOBJ_FLUSH_FINISH if finishing
+            else zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+
+COMPRESSORS = {'gzip': GzipCompressor}
+if brotli:
+    COMPRESSORS['br'] = BrotliCompressor
+if zstandard:
+    COMPRESSORS['zstd'] = ZstdCompressor
+
+
+def parse_accept_encoding(accept_encoding):
+    """Return the encodings which are acceptable
+    E.g. 'gzip, br;q=0.8, zstd;q=0' -> {'gzip', 'br'}
+    """
+    encodings = set()
+    for item in (accept_encoding or '').split(','):
+        encoding, _, params = item.strip().partition(';')
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                if float(params[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if encoding:
+            encodings.add(encoding.strip().lower())
+    return encodings
+
+
+def is_compressible_type(content_type):
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if not content_type:
+        return False
+    for allowed in CONF.api.compress_types.split(','):
+        allowed = allowed.strip().lower()
+        if allowed.endswith('/*'):
+            if content_type.startswith(allowed[:-1]):
+                return True
+        elif content_type == allowed:
+            return True
+    return False
+
+
+def choose_encoding(accept_encoding, content_type, content_length=None):
+    """Choose the encoding to compress response, return None if the
+    response should not be compressed.
+    """
+    if not CONF.api.compress_response:
+        return None
+    if content_length is not None and \
+       int(content_length) < CONF.api.compress_min_length:
+        return None
+    if not is_compressible_type(content_type):
+        return None
+    acceptable = parse_accept_encoding(accept_encoding)
+    for encoding in CONF.api.compress_encodings.split(','):
+        encoding = encoding.strip()
+        if encoding in acceptable and encoding in COMPRESSORS:
+            return encoding
+    return None
+
+
+class CompressContentEncoding(web.OutputTransform):
+    """Compress the response with gzip, br or zstd
+
+    The encoding is negotiated with header Accept-Encoding, each chunk is
+    compressed and flushed, so that the response is never fully buffered.
+    """
+
+    def __init__(self, request):
+        self._accept_encoding = request.headers.get('Accept-Encoding', '')
+        self._compressor = None
+
+    def transform_first_chunk(self, status_code, headers, chunk, finishing):
+        if 'Vary' in headers:
+            headers['Vary'] += ', Accept-Encoding'
+        else:
+            headers['Vary'] = 'Accept-Encoding'
+        # partial content must be the bytes of the original body
+        if status_code not in (200, 201) or 'Content-Encoding' in headers:
+            return status_code, headers, chunk
+        content_length = headers.get('Content-Length')
+        if content_length is None and finishing:
+            content_length = len(chunk)
+        encoding = choose_encoding(self._accept_encoding,
+                                   headers.get('Content-Type'),
+                                   content_length)
+        if not encoding:
+            return status_code, headers, chunk
+
+        self._compressor = COMPRESSORS[encoding](CONF.api.compress_level)
+        headers['Content-Encoding'] = encoding
+        chunk = self.transform_chunk(chunk, finishing)
+        if finishing:
+            headers['Content-Length'] = str(len(chunk))
+        elif 'Content-Length' in headers:
+            del headers['Content-Length']
+        return status_code, headers, chunk
+
+    def transform_chunk(self, chunk, finishing):
+        if self._compressor:
+            chunk = self._compressor.compress(chunk, finishing)
+        return chunk
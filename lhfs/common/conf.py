@@ -1,3 +1,4 @@
+import functools
 import os
 import socket
 
@@ -6,25 +7,88 @@ from easy2use.globals import cfg
 CONF = cfg.CONF
 DEFAULT_HOST = socket.gethostname()
 
+
+@functools.lru_cache(maxsize=None)
+def get_host_ip():
+    """Get the ip of the interface of default route
+
+    Unlike gethostbyname(gethostname()), no DNS query is needed, connecting
+    an udp socket sends no packet.
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as udp_socket:
+        try:
+            udp_socket.connect(('10.254.254.254', 1))
+            return udp_socket.getsockname()[0]
+        except OSError:
+            return '127.0.0.1'
+
+
 default_options = [
     cfg.BooleanOption('debug', default=False),
     cfg.IntOption('workers', default=None),
     cfg.Option('log_file', default=None),
     cfg.IntOption('heartbeat_interval', default=10),
     cfg.IntOption('heartbeat_alive', default=60),
+    cfg.IntOption('disk_usage_max_age', default=60),
 ]
 api_options = [
     cfg.Option('host', default='{my_ip}'),
     cfg.IntOption('port', default=80),
+    cfg.IntOption('download_chunk_size', default=64 * 1024),
+    cfg.BooleanOption('use_sendfile', default=True),
+    cfg.IntOption('drop_cache_min_size', default=64 * 1024 * 1024),
+    cfg.IntOption('upload_max_size', default=10 * 1024 * 1024 * 1024),
+    cfg.IntOption('upload_session_ttl', default=24 * 3600),
+    cfg.IntOption('upload_cleanup_interval', default=600),
+    cfg.IntOption('proxy_window_size', default=4 * 1024 * 1024),
+    cfg.IntOption('proxy_timeout', default=60),
+    cfg.BooleanOption('compress_response', default=True),
+    cfg.Option('compress_encodings', default='zstd,br,gzip'),
+    cfg.IntOption('compress_level', default=6),
+    cfg.IntOption('compress_min_length', default=1024),
+    cfg.Option('compress_types',
+               default='text/*,application/json,application/x-ndjson,'
+                       'application/javascript,application/xml,'
+                       'application/x-sh,image/svg+xml'),
+    cfg.IntOption('ndjson_batch_size', default=500),
+    cfg.IntOption('stat_max_paths', default=1000),
+    cfg.IntOption('search_max_limit', default=10000),
+    cfg.IntOption('search_timeout', default=60),
+    cfg.Option('thumb_sizes', default='64,128,256,512'),
+    cfg.IntOption('thumb_cache_bytes', default=512 * 1024 * 1024),
+    cfg.IntOption('thumb_workers', default=2),
 ]
 lhfs_options = [
-    cfg.Option('host', default=socket.gethostname()),
-    cfg.Option('my_ip', default=socket.gethostbyname(DEFAULT_HOST)),
+    cfg.Option('host', default=DEFAULT_HOST),
+    # the ip of the interface of default route if it is not set, it is
+    # resolved when the configs are loaded, see load_configs()
+    cfg.Option('my_ip', default=None),
     cfg.Option('rpc_host', default='{my_ip}'),
     cfg.IntOption('rpc_port', default=9527),
     cfg.Option('root', default='./'),
+    cfg.Option('data_dir', default=os.path.join(os.path.expanduser('~'),
+                                                '.lhfs')),
     cfg.Option('rpc_driver', default='xmlrpc'),
     cfg.Option('master_rpc', default='http://{my_ip}:{rpc_port}'),
+    cfg.Option('data_host', default='{my_ip}'),
+    cfg.IntOption('data_port', default=0),
+    cfg.Option('data_token', default=None),
+    cfg.IntOption('sftp_max_channels', default=8),
+    cfg.IntOption('sftp_idle_timeout', default=300),
+    cfg.IntOption('listing_cache_entries', default=256),
+    cfg.IntOption('listing_cache_bytes', default=64 * 1024 * 1024),
+    cfg.IntOption('du_workers', default=8),
+    cfg.IntOption('du_cache_entries', default=100000),
+    cfg.IntOption('du_cache_ttl', default=600),
+    cfg.IntOption('stat_workers', default=8),
+    cfg.IntOption('walk_workers', default=8),
+    cfg.IntOption('search_fanout_workers', default=16),
+    cfg.IntOption('grep_workers', default=2),
+    cfg.IntOption('grep_max_size', default=16 * 1024 * 1024),
+    cfg.BooleanOption('index_enabled', default=True),
+    cfg.IntOption('index_rebuild_interval', default=24 * 3600),
+    cfg.BooleanOption('index_watch', default=True),
+    cfg.IntOption('index_watch_delay', default=200),
 ]
 
 web_options = {
@@ -34,12 +98,19 @@ web_options = {
 }
 
 
+def get_my_ip():
+    return CONF.lhfs.my_ip or get_host_ip()
+
+
 def load_configs():
     for file in ['/etc/lhfs/lhfs.conf', './etc/lhfs.conf']:
         if not os.path.exists(file):
             continue
         CONF.load(file)
         break
+    # the host ip is resolved only if it is not configured
+    if not CONF.lhfs.my_ip:
+        CONF.set_cli('my_ip', get_my_ip(), group='lhfs')
 
 
 CONF.register_opts(default_options)
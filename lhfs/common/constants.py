@@ -20,5 +20,21 @@ RPC_CLASS_MAPPING = {
 FOLDER = 'folder'
 FILE = 'file'
 
+SENDFILE_BLOCK_SIZE = 8 * Unit.MB.value
+UPLOAD_TEMP_PREFIX = '.lhfs-upload-'
+DATA_TOKEN_HEADER = 'X-Lhfs-Data-Token'
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+# send an empty line if no record is ready in this interval
+NDJSON_KEEPALIVE_INTERVAL = 1
+# the seconds to wait for the search replies of nodes after timeout
+SEARCH_RPC_GRACE = 2
+# the record sessions of remote nodes are stopped if they are not fetched
+# in this interval
+RECORD_SESSION_TTL = 60
+# the seconds to wait for the records of remote session in each fetch
+RECORD_FETCH_WAIT = 0.5
+# the max number of context lines before and after the grep matches
+GREP_MAX_CONTEXT = 10
+
 ACTIVE = 'active'
 DOWN = 'down'
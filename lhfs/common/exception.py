@@ -13,6 +13,10 @@ class FileNotExists(exceptions.BaseException):
     _msg = 'File {path} is not exists'
 
 
+class InvalidFileName(exceptions.BaseException):
+    _msg = 'Invalid file name: {name}'
+
+
 class NodeNotExists(exceptions.BaseException):
     _msg = 'Node {node} not exists'
 
@@ -23,3 +27,51 @@ class NodeInactive(exceptions.BaseException):
 
 class ConflictNode(exceptions.BaseException):
     _msg = 'Node {node} is conflict with {exists}'
+
+
+class RangeNotSatisfiable(exceptions.BaseException):
+    _msg = 'Range {range} not satisfiable, file size is {size}'
+
+
+class UploadSessionNotExists(exceptions.BaseException):
+    _msg = 'Upload session {session} not exists'
+
+
+class InvalidUploadRange(exceptions.BaseException):
+    _msg = 'Invalid range {start}-{end} for upload session {session}'
+
+
+class InvalidSortField(exceptions.BaseException):
+    _msg = 'Invalid sort field {sort}, valid fields: {fields}'
+
+
+class InvalidCursor(exceptions.BaseException):
+    _msg = 'Invalid cursor {cursor}'
+
+
+class ThumbnailNotSupported(exceptions.BaseException):
+    _msg = 'Thumbnail of {path} is not supported'
+
+
+class ThumbnailFailed(exceptions.BaseException):
+    _msg = 'Make thumbnail of {path} failed'
+
+
+class InvalidThumbnailSize(exceptions.BaseException):
+    _msg = 'Invalid thumbnail size {size}, valid sizes: {sizes}'
+
+
+class InvalidSearchMode(exceptions.BaseException):
+    _msg = 'Invalid search mode {mode}, valid modes: {modes}'
+
+
+class InvalidGrepPattern(exceptions.BaseException):
+    _msg = 'Invalid grep pattern {pattern}, reason: {reason}'
+
+
+class RecordSessionNotExists(exceptions.BaseException):
+    _msg = 'Record session {session} not exists'
+
+
+class RemoteRecordsFailed(exceptions.BaseException):
+    _msg = 'Get records from node {node} failed: {reason}'
@@ -0,0 +1,246 @@
+import collections
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+
+LOG = logging.getLogger(__name__)
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_UNMOUNT = 0x00002000
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0o2000000)
+
+DIR_EVENTS = IN_MODIFY | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | \
+    IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+EVENT_HEADER = struct.Struct('iIII')
+EVENTS_BUFFER_SIZE = 64 * 1024
+# the seconds to wait before reading again after a failure, it is doubled
+# for each failure in a row
+READ_RETRY_INTERVAL = 0.1
+MAX_READ_RETRY_INTERVAL = 5
+# the watcher stops after so many failures in a row
+MAX_READ_FAILURES = 10
+
+Event = collections.namedtuple('Event', ['wd', 'mask', 'cookie', 'name'])
+
+
+def _load_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                           ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+_LIBC = _load_libc()
+
+
+def is_supported():
+    return _LIBC is not None
+
+
+def _raise_errno(message):
+    error = ctypes.get_errno()
+    raise OSError(error, f'{message}: {os.strerror(error)}')
+
+
+class Inotify(object):
+    """Minimal inotify binding based on ctypes, only available on linux
+    """
+
+    def __init__(self):
+        if not is_supported():
+            raise OSError(errno.ENOSYS, 'inotify is not supported')
+        self.fd = _LIBC.inotify_init1(IN_CLOEXEC | IN_NONBLOCK)
+        if self.fd < 0:
+            _raise_errno('inotify_init1 failed')
+        # select() can not wait for the fds greater than 1024
+        self._poll = select.poll()
+        self._poll.register(self.fd, select.POLLIN)
+
+    def add_watch(self, path, mask):
+        wd = _LIBC.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            _raise_errno(f'watch {path} failed')
+        return wd
+
+    def rm_watch(self, wd):
+        if _LIBC.inotify_rm_watch(self.fd, wd) < 0:
+            _raise_errno(f'remove watch {wd} failed')
+
+    def read_events(self, timeout=None):
+        if not self._poll.poll(None if timeout is None else timeout * 1000):
+            return []
+        try:
+            data = os.read(self.fd, EVENTS_BUFFER_SIZE)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            events.append(Event(wd, mask, cookie, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class Watcher(object):
+    """Watch directories in a background thread
+
+    callback(path, name, mask) is called for each event, path is the watched
+    directory and name is the child of it. If the event queue overflowed,
+    callback is called with path None, which means that any event may be
+    lost.
+
+    If the events can not be read after MAX_READ_FAILURES retries, the
+    watcher is failed: it stops watching, callback is called with path None
+    and watch() always returns False.
+    """
+
+    def __init__(self, callback, mask=DIR_EVENTS):
+        self.callback = callback
+        self.mask = mask | IN_ONLYDIR | IN_DONT_FOLLOW
+        self._inotify = None
+        self._thread = None
+        self._wds = {}
+        self._pathes = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self.failed = False
+
+    def _ensure_started(self):
+        if self._inotify:
+            return
+        self._inotify = Inotify()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='inotify-watcher')
+        self._thread.start()
+
+    def watch(self, path):
+        """Watch directory, return False if it can not be watched
+        """
+        with self._lock:
+            if path in self._wds:
+                return True
+            if self.failed:
+                return False
+            try:
+                self._ensure_started()
+                wd = self._inotify.add_watch(path, self.mask)
+            except OSError as e:
+                LOG.debug('watch %s failed: %s', path, e)
+                return False
+            self._wds[path] = wd
+            self._pathes[wd] = path
+        return True
+
+    def unwatch(self, path):
+        with self._lock:
+            wd = self._wds.pop(path, None)
+            if wd is None:
+                return
+            self._pathes.pop(wd, None)
+            try:
+                self._inotify.rm_watch(wd)
+            except OSError as e:
+                LOG.debug('unwatch %s failed: %s', path, e)
+
+    def is_watching(self, path):
+        return path in self._wds
+
+    def watching(self):
+        return list(self._wds)
+
+    def _handle(self, event):
+        if event.mask & IN_Q_OVERFLOW:
+            LOG.warning('inotify event queue overflowed')
+            self.callback(None, None, event.mask)
+            return
+        with self._lock:
+            path = self._pathes.get(event.wd)
+            if event.mask & IN_IGNORED and path is not None:
+                self._pathes.pop(event.wd, None)
+                self._wds.pop(path, None)
+        if path is not None:
+            self.callback(path, event.name, event.mask)
+
+    def _fail(self):
+        with self._lock:
+            self.failed = True
+            self._inotify.close()
+            self._inotify = None
+            self._wds = {}
+            self._pathes = {}
+        self.callback(None, None, IN_Q_OVERFLOW)
+
+    def _run(self):
+        failures = 0
+        while not self._stopped.is_set():
+            try:
+                events = self._inotify.read_events(timeout=1)
+            except (OSError, ValueError) as e:
+                if self._stopped.is_set():
+                    break
+                failures += 1
+                if failures >= MAX_READ_FAILURES:
+                    LOG.error('read inotify events failed %s times, stop '
+                              'watching: %s', failures, e)
+                    self._fail()
+                    break
+                LOG.error('read inotify events failed: %s', e)
+                self._stopped.wait(min(READ_RETRY_INTERVAL * 2 ** failures,
+                                       MAX_READ_RETRY_INTERVAL))
+                continue
+            failures = 0
+            for event in events:
+                try:
+                    self._handle(event)
+                except Exception as e:
+                    LOG.exception('handle inotify event failed: %s', e)
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            if self._inotify:
+                self._inotify.close()
+                self._inotify = None
+            self._wds = {}
+            self._pathes = {}
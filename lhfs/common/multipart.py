@@ -0,0 +1,191 @@
+import email.message
+import logging
+import os
+import tempfile
+
+from tornado import httputil
+
+from lhfs.common import constants
+
+LOG = logging.getLogger(__name__)
+
+
+def get_header_param(header, value, param):
+    """Get param from header value
+    E.g. get_header_param('Content-Type',
+                          'multipart/form-data; boundary=xxx', 'boundary')
+    """
+    msg = email.message.Message()
+    msg[header] = value
+    return msg.get_param(param, header=header)
+
+
+def get_filename(content_disposition):
+    msg = email.message.Message()
+    msg['Content-Disposition'] = content_disposition
+    return msg.get_filename()
+
+
+class MultipartParser(object):
+    """Incremental parser of multipart/form-data body
+
+    The body is fed with feed() chunk by chunk, the parts are passed to the
+    handler, which must implement start_part(headers), part_data(data) and
+    end_part(). Only the data which may be a part of the delimiter is kept
+    in memory.
+    """
+    PREAMBLE = 'preamble'
+    DELIMITER = 'delimiter'
+    HEADERS = 'headers'
+    BODY = 'body'
+    END = 'end'
+    MAX_HEADERS_SIZE = 16 * 1024
+
+    def __init__(self, boundary, handler):
+        if isinstance(boundary, str):
+            boundary = boundary.encode()
+        self.delimiter = b'\r\n--' + boundary
+        self.handler = handler
+        # the first delimiter is not preceded by CRLF
+        self._buffer = bytearray(b'\r\n')
+        self._state = self.PREAMBLE
+
+    @property
+    def done(self):
+        return self._state == self.END
+
+    def feed(self, data):
+        if self.done:
+            return
+        self._buffer.extend(data)
+        while self._process():
+            pass
+
+    def _process(self):
+        if self._state == self.PREAMBLE:
+            index = self._buffer.find(self.delimiter)
+            if index < 0:
+                del self._buffer[:-len(self.delimiter)]
+                return False
+            del self._buffer[:index + len(self.delimiter)]
+            self._state = self.DELIMITER
+            return True
+
+        if self._state == self.DELIMITER:
+            if len(self._buffer) < 2:
+                return False
+            if self._buffer.startswith(b'--'):
+                self._state = self.END
+                self._buffer.clear()
+                return False
+            if not self._buffer.startswith(b'\r\n'):
+                raise ValueError('invalid multipart delimiter')
+            del self._buffer[:2]
+            self._state = self.HEADERS
+            return True
+
+        if self._state == self.HEADERS:
+            if self._buffer.startswith(b'\r\n'):
+                index, headers = 0, httputil.HTTPHeaders()
+            else:
+                index = self._buffer.find(b'\r\n\r\n')
+                if index < 0:
+                    if len(self._buffer) > self.MAX_HEADERS_SIZE:
+                        raise ValueError('multipart headers too long')
+                    return False
+                headers = httputil.HTTPHeaders.parse(
+                    self._buffer[:index].decode('utf-8'))
+                index += 2
+            del self._buffer[:index + 2]
+            self.handler.start_part(headers)
+            self._state = self.BODY
+            return True
+
+        if self._state == self.BODY:
+            index = self._buffer.find(self.delimiter)
+            if index < 0:
+                keep = len(self.delimiter) - 1
+                if len(self._buffer) > keep:
+                    self.handler.part_data(bytes(self._buffer[:-keep]))
+                    del self._buffer[:-keep]
+                return False
+            if index:
+                self.handler.part_data(bytes(self._buffer[:index]))
+            del self._buffer[:index + len(self.delimiter)]
+            self.handler.end_part()
+            self._state = self.DELIMITER
+            return True
+
+        return False
+
+
+class FileReceiver(object):
+    """Handler of MultipartParser which writes file parts to temp files
+
+    get_temp_dir is a function with the filename of part as argument, it
+    returns the directory where the temp file is created. The temp files
+    are flushed and fsynced when the part ends, use cleanup() to remove
+    them if they are not moved away.
+    """
+    MAX_FIELD_SIZE = 64 * 1024
+
+    def __init__(self, get_temp_dir):
+        self.get_temp_dir = get_temp_dir
+        self.files = []
+        self.arguments = {}
+        self._name = None
+        self._filename = None
+        self._file = None
+        self._temp_path = None
+        self._size = 0
+        self._value = None
+
+    def start_part(self, headers):
+        disposition = headers.get('Content-Disposition', '')
+        self._name = get_header_param('Content-Disposition', disposition,
+                                      'name')
+        self._filename = get_filename(disposition)
+        self._size = 0
+        if self._filename is None:
+            self._value = bytearray()
+            return
+        fd, self._temp_path = tempfile.mkstemp(
+            prefix=constants.UPLOAD_TEMP_PREFIX,
+            dir=self.get_temp_dir(self._filename))
+        self._file = os.fdopen(fd, 'wb')
+
+    def part_data(self, data):
+        self._size += len(data)
+        if self._file:
+            self._file.write(data)
+            return
+        if self._size > self.MAX_FIELD_SIZE:
+            raise ValueError(f'field {self._name} too large')
+        self._value.extend(data)
+
+    def end_part(self):
+        if not self._file:
+            self.arguments.setdefault(self._name, []).append(
+                self._value.decode('utf-8'))
+            self._value = None
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        self.files.append({'name': self._name, 'filename': self._filename,
+                           'temp_path': self._temp_path,
+                           'size': self._size})
+        self._temp_path = None
+
+    def cleanup(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+        temp_pathes = [f['temp_path'] for f in self.files]
+        if self._temp_path:
+            temp_pathes.append(self._temp_path)
+        for temp_path in temp_pathes:
+            if os.path.exists(temp_path):
+                LOG.debug('remove temp file %s', temp_path)
+                os.remove(temp_path)
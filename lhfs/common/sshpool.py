@@ -0,0 +1,160 @@
+import contextlib
+import logging
+import threading
+import time
+
+from lhfs.common import conf
+
+CONF = conf.CONF
+LOG = logging.getLogger(__name__)
+
+
+class SSHConnection(object):
+    """A ssh connection to node, sftp channels are opened on it
+    """
+
+    def __init__(self, node):
+        # paramiko is slow to import, import it only if ssh is used
+        from easy2use.pysshpass import ssh
+
+        self.key = (node.ip, node.ssh_user)
+        self.sshclient = ssh.SSHClient(node.ip, node.ssh_user,
+                                       node.ssh_password)
+        self.sshclient._connect()
+        self.active = 0
+        self.idle_channels = []
+        self.last_used = time.time()
+
+    def is_alive(self):
+        transport = self.sshclient.client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def take_idle_channel(self):
+        """Pop an idle sftp channel which is still open, None if there is
+        not any, it must be called with the lock of pool.
+        """
+        while self.idle_channels:
+            sftp = self.idle_channels.pop()
+            if not sftp.get_channel().closed:
+                return sftp
+        return None
+
+    def open_sftp(self):
+        return self.sshclient.client.open_sftp()
+
+    def close(self):
+        for sftp in self.idle_channels:
+            sftp.close()
+        self.idle_channels = []
+        self.sshclient.client.close()
+
+
+class SFTPPool(object):
+    """Pool of ssh connections and sftp channels, keyed by (ip, ssh_user)
+
+    A connection is reused if it is alive and the number of its active
+    channels is less than max_channels, the idle connections are closed
+    after idle_timeout seconds.
+    """
+
+    def __init__(self, max_channels=None, idle_timeout=None):
+        self.max_channels = max_channels
+        self.idle_timeout = idle_timeout
+        self.connections = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def _get_max_channels(self):
+        return self.max_channels or CONF.lhfs.sftp_max_channels
+
+    def _get_idle_timeout(self):
+        return self.idle_timeout or CONF.lhfs.sftp_idle_timeout
+
+    def _evict(self):
+        now = time.time()
+        for key, connections in list(self.connections.items()):
+            for connection in list(connections):
+                if connection.active > 0:
+                    continue
+                if connection.is_alive() and \
+                   now - connection.last_used < self._get_idle_timeout():
+                    continue
+                LOG.debug('evict ssh connection %s', connection.key)
+                connections.remove(connection)
+                connection.close()
+                self.evictions += 1
+            if not connections:
+                del self.connections[key]
+
+    def _acquire(self, node):
+        """Return (connection, sftp), sftp is an idle channel of connection
+        or None if a new one must be opened.
+        """
+        key = (node.ip, node.ssh_user)
+        with self._lock:
+            self._evict()
+            for connection in self.connections.get(key, []):
+                if connection.active < self._get_max_channels() and \
+                   connection.is_alive():
+                    connection.active += 1
+                    self.hits += 1
+                    return connection, connection.take_idle_channel()
+            self.misses += 1
+        LOG.info('create ssh connection to %s@%s', node.ssh_user, node.ip)
+        connection = SSHConnection(node)
+        with self._lock:
+            connection.active += 1
+            self.connections.setdefault(key, []).append(connection)
+        return connection, None
+
+    def _release(self, connection, sftp, broken=False):
+        with self._lock:
+            connection.active -= 1
+            connection.last_used = time.time()
+            if sftp and not broken:
+                connection.idle_channels.append(sftp)
+        if sftp and broken:
+            sftp.close()
+
+    @contextlib.contextmanager
+    def sftp(self, node):
+        """Get sftp client of node
+        E.g.
+            with SFTP_POOL.sftp(node) as sftp:
+                sftp.stat(path)
+        """
+        connection, sftp = self._acquire(node)
+        broken = False
+        try:
+            # opening a channel is slow, so it is not done with the lock
+            sftp = sftp or connection.open_sftp()
+            yield sftp
+        except Exception:
+            broken = True
+            raise
+        finally:
+            self._release(connection, sftp, broken=broken)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'connections': sum(len(c) for c in self.connections.values()),
+                'active_channels': sum(conn.active
+                                       for c in self.connections.values()
+                                       for conn in c),
+            }
+
+    def close(self):
+        with self._lock:
+            for connections in self.connections.values():
+                for connection in connections:
+                    connection.close()
+            self.connections = {}
+
+
+SFTP_POOL = SFTPPool()
@@ -1,14 +1,19 @@
+import contextlib
 import logging
+import os
+import queue
+import threading
 import time
 import functools
+import uuid
 from threading import Timer
 
 from easy2use.common import pkg
-from easy2use.pysshpass import ssh
 
 from lhfs.common import conf
 from lhfs.common import constants
 from lhfs.common import exception
+from lhfs.common import sshpool
 
 CONF = conf.CONF
 
@@ -39,27 +44,30 @@ def get_rpc_server(manager, host='0.0.0.0', port=8080):
     return driver_cls(manager, host=host, port=port)
 
 
-def get_rpc_client(transport=None):
+def get_rpc_client(transport=None, timeout=None):
     driver_cls = pkg.import_class(
         constants.RPC_CLASS_MAPPING.get(CONF.lhfs.rpc_driver)[1])
-    return driver_cls(transport)
+    return driver_cls(transport, timeout=timeout)
 
 
 def remotable(func):
     """Execute func on local or remote with rpc.
+    The remote call fails if there is no reply in rpc_timeout seconds.
     """
     @functools.wraps(func)
     def wrapper(self, *args, **kwargs):
         host = kwargs.pop('host', None)
+        rpc_timeout = kwargs.pop('rpc_timeout', None)
         if not host or (hasattr(self, 'node') and self.node.hostname == host):
             return func(self, *args, **kwargs)
         elif hasattr(self, 'nodes'):
             if host not in self.nodes:
                 raise exception.NodeNotExists(node=host)
             node = self.nodes.get(host)
-            if time.time() - node.get('heartbeat') >= CONF.heartbeat_alive:
+            if time.time() - node.heartbeat >= CONF.heartbeat_alive:
                 raise exception.NodeInactive(node=host)
-            client = get_rpc_client(transport=node.get('transport'))
+            client = get_rpc_client(transport=node.transport,
+                                    timeout=rpc_timeout)
             return getattr(client, func.__name__)(*args, **kwargs)
 
     return wrapper
@@ -75,20 +83,99 @@ def get_reqeust_arg(flask_req, arg, default=None):
     return value
 
 
-def stream_generator(remote_node, abs_path):
-    sshclient = ssh.SSHClient(remote_node['ip'], remote_node['ssh_user'],
-                              remote_node['ssh_password'])
-    sshclient._connect()
-    sftp = sshclient.client.open_sftp()
-    file_size = sftp.stat(abs_path).st_size
+def parse_range_header(range_header, size):
+    """Parse the value of http header Range
+    Return a list of (start, end) ranges, the end is exclusive, overlapping
+    ranges are merged. Return None if the header is invalid and should be
+    ignored, raise RangeNotSatisfiable if no range can be satisfied.
+    E.g. parse_range_header('bytes=0-99,-100', 1000)
+    """
+    unit, _, ranges_spec = (range_header or '').partition('=')
+    if unit.strip().lower() != 'bytes' or not ranges_spec:
+        return None
+    ranges = []
+    for spec in ranges_spec.split(','):
+        start, sep, end = spec.strip().partition('-')
+        if not sep:
+            return None
+        try:
+            start = int(start) if start.strip() else None
+            end = int(end) if end.strip() else None
+        except ValueError:
+            return None
+        if start is None:
+            # suffix range, the last N bytes
+            if end is None:
+                return None
+            start, end = max(size - end, 0), size
+        elif end is None or end >= size:
+            end = size
+        elif end < start:
+            return None
+        else:
+            end += 1
+        if start >= end or start >= size:
+            continue
+        ranges.append((start, end))
+    if not ranges:
+        raise exception.RangeNotSatisfiable(range=range_header, size=size)
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        if start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def stream_generator(remote_node, abs_path, chunk_size=32768, offset=0,
+                     length=None):
+    with sshpool.SFTP_POOL.sftp(remote_node) as sftp:
+        end = sftp.stat(abs_path).st_size
+        if length is not None:
+            end = min(end, offset + length)
+
+        with sftp.open(abs_path, "rb") as fr:
+            fr.seek(offset)
+            fr.prefetch(end)
+            while offset < end:
+                data = fr.read(min(chunk_size, end - offset))
+                if not data:
+                    break
+                offset += len(data)
+                yield data
 
-    with sftp.open(abs_path, "rb") as fr:
-        fr.prefetch(file_size)
-        while True:
-            data = fr.read(32768)
-            if not data:
-                break
-            yield data
+
+def put_file(remote_node, local_path, abs_path):
+    """Upload local file to remote node
+    The file is uploaded to a temp file first, and then renamed to abs_path.
+    """
+    temp_path = os.path.join(
+        os.path.dirname(abs_path),
+        f'{constants.UPLOAD_TEMP_PREFIX}{uuid.uuid4().hex}')
+    with sshpool.SFTP_POOL.sftp(remote_node) as sftp:
+        try:
+            sftp.put(local_path, temp_path)
+            sftp.posix_rename(temp_path, abs_path)
+        except Exception:
+            sftp.remove(temp_path)
+            raise
+
+
+def fadvise(fd, offset, length, advice):
+    """Give the kernel a hint about file access, advice is the suffix of
+    os.POSIX_FADV_*, e.g. SEQUENTIAL, DONTNEED.
+    Do nothing if posix_fadvise is not supported.
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        os.posix_fadvise(fd, offset, length,
+                         getattr(os, f'POSIX_FADV_{advice}'))
+    except OSError as e:
+        LOG.debug('fadvise %s failed: %s', advice, e)
 
 
 def human_size(size):
@@ -102,3 +189,150 @@ def human_size(size):
         return f'{size / constants.Unit.KB.value:.2f} KB'
     else:
         return f'{size:.2f}  B'
+
+
+class RecordPump(object):
+    """Consume the records in a thread, so that they can be sent once found
+
+    The thread stops when cancel is set, and the records are closed in it.
+    """
+    END = object()
+
+    def __init__(self, records, cancel, max_size):
+        self.records = iter(records)
+        self.cancel = cancel
+        self.error = None
+        self._queue = queue.Queue(maxsize=max_size)
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='record-pump')
+
+    def start(self):
+        self._thread.start()
+
+    def _put(self, item):
+        while not self.cancel.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self):
+        try:
+            for record in self.records:
+                if not self._put(record):
+                    break
+        except Exception as e:
+            self.error = e
+        finally:
+            if hasattr(self.records, 'close'):
+                self.records.close()
+        self._put(self.END)
+
+    def get_batch(self, size, timeout):
+        """Get the records which are ready, wait timeout for the first one
+        """
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=timeout))
+            while len(batch) < size and batch[-1] is not self.END:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+
+class RecordSessions(object):
+    """The sessions to stream records from remote nodes, e.g. the items
+    found by find or grep
+
+    The records of a session are consumed in a thread, the master fetches
+    them in batches with rpc, so that they are streamed. The sessions which
+    are not fetched for RECORD_SESSION_TTL seconds are stopped.
+    """
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _expire(self):
+        now = time.time()
+        for session_id, (_, _, fetched) in list(self._sessions.items()):
+            if now - fetched > constants.RECORD_SESSION_TTL:
+                LOG.warning('record session %s expired', session_id)
+                self._stop(session_id)
+
+    def _stop(self, session_id):
+        pump, timer, _ = self._sessions.pop(session_id, (None, None, None))
+        if pump:
+            pump.cancel.set()
+            timer.cancel()
+
+    def start(self, records, cancel, timeout=None):
+        """Start to consume records, the threading.Event cancel is set after
+        timeout seconds or when the session is stopped.
+        Return the session id.
+        """
+        pump = RecordPump(records, cancel, CONF.api.ndjson_batch_size * 4)
+        timer = Timer(timeout or CONF.api.search_timeout, cancel.set)
+        timer.daemon = True
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self._expire()
+            self._sessions[session_id] = (pump, timer, time.time())
+        timer.start()
+        pump.start()
+        return session_id
+
+    def fetch(self, session_id, size, timeout):
+        """Get the records which are ready, wait timeout for the first one
+        Return {'records': [...], 'done': bool, 'error': None}
+        """
+        with self._lock:
+            self._expire()
+            if session_id not in self._sessions:
+                raise exception.RecordSessionNotExists(session=session_id)
+            pump, timer, _ = self._sessions[session_id]
+            self._sessions[session_id] = (pump, timer, time.time())
+        records = pump.get_batch(size, timeout)
+        done = bool(records) and records[-1] is RecordPump.END
+        if done:
+            records.pop()
+        elif not records and pump.cancel.is_set():
+            # timed out, the pump thread stopped
+            done = True
+        if done:
+            with self._lock:
+                self._stop(session_id)
+        return {'records': records, 'done': done,
+                'error': done and pump.error and str(pump.error) or None}
+
+    def stop(self, session_id):
+        with self._lock:
+            self._stop(session_id)
+
+    def close(self):
+        with self._lock:
+            for session_id in list(self._sessions):
+                self._stop(session_id)
+
+
+@contextlib.contextmanager
+def cancel_after(timeout=None):
+    """Get a threading.Event which is set after timeout seconds
+    E.g.
+        with cancel_after(10) as cancel:
+            walk(cancel=cancel)
+    """
+    cancel = threading.Event()
+    t = None
+    if timeout:
+        t = Timer(timeout, cancel.set)
+        t.daemon = True
+        t.start()
+    try:
+        yield cancel
+    finally:
+        if t:
+            t.cancel()
@@ -0,0 +1,159 @@
+import collections
+import logging
+import os
+import sys
+import threading
+
+from lhfs.common import inotify
+
+LOG = logging.getLogger(__name__)
+
+# the estimated size of an entry of listing, except its name
+ENTRY_OVERHEAD = 160
+
+
+def entries_size(entries):
+    return sum(ENTRY_OVERHEAD + sys.getsizeof(entry[0]) for entry in entries)
+
+
+class ListingCache(object):
+    """LRU cache of directory listings, keyed by (dir path, show_all)
+
+    The listings are the entries generated by LogicPath.scan(). The cached
+    directories are watched with inotify, the entries are invalidated when
+    the directory or its children changed. A listing is cached only if the
+    directory is watched, so the cache is disabled where inotify is not
+    supported.
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._listings = collections.OrderedDict()
+        # the version of directory is increased when it is invalidated, so
+        # that the listing scanned before that is not cached
+        self._versions = collections.defaultdict(int)
+        self._lock = threading.Lock()
+        self._watcher = None
+        if self.enabled:
+            self._watcher = inotify.Watcher(self._on_event)
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.max_bytes > 0 and \
+            inotify.is_supported()
+
+    def get(self, path, show_all, scan):
+        """Get the listing of path, scan() is called if it is not cached
+        """
+        key = (path, show_all)
+        with self._lock:
+            entries = self._lookup(key)
+            if entries is not None:
+                return entries
+            self.misses += 1
+            version = self._versions[path]
+        # watch before scanning, so that no change is missed
+        if not self._watcher or not self._watcher.watch(path):
+            return list(scan())
+        entries = tuple(scan())
+        size = entries_size(entries)
+        if size > self.max_bytes:
+            return entries
+        with self._lock:
+            if self._versions[path] != version or \
+               not self._watcher.is_watching(path):
+                return entries
+            self._pop(key)
+            self._listings[key] = (entries, size)
+            self.bytes += size
+            self._evict()
+        return entries
+
+    def _lookup(self, key):
+        if key not in self._listings:
+            return None
+        self._listings.move_to_end(key)
+        self.hits += 1
+        return self._listings[key][0]
+
+    def lookup(self, path, show_all):
+        """Get the cached listing of path, return None if it is not cached
+        """
+        with self._lock:
+            return self._lookup((path, show_all))
+
+    def _pop(self, key):
+        if key not in self._listings:
+            return
+        _, size = self._listings.pop(key)
+        self.bytes -= size
+
+    def _evict(self):
+        while self._listings and (len(self._listings) > self.max_entries or
+                                  self.bytes > self.max_bytes):
+            (path, show_all), (_, size) = self._listings.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+            if (path, not show_all) not in self._listings:
+                self._versions[path] += 1
+                self._watcher.unwatch(path)
+
+    def _drop(self, path):
+        self._versions[path] += 1
+        for show_all in (False, True):
+            if (path, show_all) in self._listings:
+                self._pop((path, show_all))
+                self.invalidations += 1
+
+    def invalidate(self, path, recursive=False):
+        """Invalidate the listing of path and its parent
+
+        The parent is invalidated too, because the size and mtime of path
+        are changed. If recursive is True, the listings of all sub
+        directories are invalidated.
+        """
+        path = path.rstrip(os.sep) or os.sep
+        with self._lock:
+            self._drop(path)
+            self._drop(os.path.dirname(path))
+            if recursive:
+                prefix = path.rstrip(os.sep) + os.sep
+                for cached_path, _ in list(self._listings):
+                    if cached_path.startswith(prefix):
+                        self._drop(cached_path)
+
+    def clear(self):
+        with self._lock:
+            for path in list(self._versions):
+                self._versions[path] += 1
+            self._listings.clear()
+            self.bytes = 0
+
+    def _on_event(self, path, name, mask):
+        if path is None:
+            self.clear()
+            return
+        self.invalidate(path)
+        if mask & inotify.IN_ISDIR and name and \
+           mask & (inotify.IN_DELETE | inotify.IN_MOVED_FROM):
+            self.invalidate(os.path.join(path, name), recursive=True)
+
+    def stats(self):
+        with self._lock:
+            return {'listings': len(self._listings), 'bytes': self.bytes,
+                    'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions,
+                    'invalidations': self.invalidations,
+                    'watches': len(self._watcher.watching())
+                    if self._watcher else 0}
+
+    def close(self):
+        if self._watcher:
+            self._watcher.stop()
+        self.clear()
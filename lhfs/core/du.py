@@ -0,0 +1,150 @@
+import collections
+import logging
+import os
+import stat
+import threading
+import time
+
+from lhfs.common import conf
+from lhfs.core import walker
+
+CONF = conf.CONF
+LOG = logging.getLogger(__name__)
+
+# the stats of the directory itself and its files, not including the sub
+# directories
+DirStat = collections.namedtuple(
+    'DirStat', ['mtime_ns', 'size', 'allocated', 'files', 'subdirs',
+                'errors', 'expires'])
+
+
+class DuEngine(object):
+    """Compute the recursive size of directories
+
+    The directories are scanned in parallel with the tree walker. The stats
+    of each directory are cached and keyed by the mtime of it, so only the
+    changed directories are scanned again, the others need only one stat
+    call. The mtime of directory is not changed if a file in it is
+    modified in place, so the cached stats expire after cache_ttl seconds.
+    """
+
+    def __init__(self, workers=None, cache_entries=None, cache_ttl=None):
+        self.workers = workers or CONF.lhfs.du_workers
+        self.cache_entries = cache_entries or CONF.lhfs.du_cache_entries
+        self.cache_ttl = cache_ttl or CONF.lhfs.du_cache_ttl
+        self.hits = 0
+        self.misses = 0
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.walker = walker.TreeWalker(workers=self.workers)
+
+    def _get_cached(self, path, mtime_ns):
+        with self._lock:
+            cached = self._cache.get(path)
+            if cached and cached.mtime_ns == mtime_ns and \
+               cached.expires > time.time():
+                self._cache.move_to_end(path)
+                self.hits += 1
+                return cached
+            self.misses += 1
+        return None
+
+    def _set_cached(self, path, dir_stat):
+        with self._lock:
+            self._cache[path] = dir_stat
+            self._cache.move_to_end(path)
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+
+    def scan_dir(self, path):
+        """Get the DirStat of directory, return None if it is not a dir
+        """
+        try:
+            path_stat = os.stat(path, follow_symlinks=False)
+        except OSError as e:
+            LOG.debug('stat %s failed: %s', path, e)
+            return None
+        if not stat.S_ISDIR(path_stat.st_mode):
+            return None
+        cached = self._get_cached(path, path_stat.st_mtime_ns)
+        if cached:
+            return cached
+
+        size, allocated = path_stat.st_size, path_stat.st_blocks * 512
+        files, errors, subdirs = 0, 0, []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        entry_stat = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        errors += 1
+                        continue
+                    if stat.S_ISDIR(entry_stat.st_mode):
+                        subdirs.append(entry.name)
+                        continue
+                    files += 1
+                    size += entry_stat.st_size
+                    allocated += entry_stat.st_blocks * 512
+        except OSError as e:
+            LOG.debug('scan %s failed: %s', path, e)
+            errors += 1
+        dir_stat = DirStat(path_stat.st_mtime_ns, size, allocated, files,
+                           tuple(subdirs), errors,
+                           time.time() + self.cache_ttl)
+        self._set_cached(path, dir_stat)
+        return dir_stat
+
+    def _scan(self, path):
+        dir_stat = self.scan_dir(path)
+        if dir_stat is None:
+            return None
+        return dir_stat, [os.path.join(path, name)
+                          for name in dir_stat.subdirs]
+
+    def du(self, path):
+        """Compute the recursive size of path and its sub directories
+
+        Return a dict with keys size, allocated, files, dirs and errors,
+        key children is the list of the sub directories with the same keys,
+        sorted by size.
+        """
+        hits, misses = self.hits, self.misses
+        stats = {}
+        depths = []
+        for dir_path, depth, dir_stat in self.walker.walk(path,
+                                                          scan=self._scan):
+            stats[dir_path] = dir_stat
+            depths.append((depth, dir_path))
+
+        # the sub directories are summed before their parents
+        depths.sort(reverse=True)
+        totals = {}
+        for _, dir_path in depths:
+            dir_stat = stats[dir_path]
+            total = {'size': dir_stat.size, 'allocated': dir_stat.allocated,
+                     'files': dir_stat.files, 'dirs': 0,
+                     'errors': dir_stat.errors}
+            for name in dir_stat.subdirs:
+                sub_total = totals.get(os.path.join(dir_path, name))
+                if not sub_total:
+                    continue
+                for key in ['size', 'allocated', 'files', 'errors']:
+                    total[key] += sub_total[key]
+                total['dirs'] += sub_total['dirs'] + 1
+            totals[dir_path] = total
+
+        result = totals.get(path) or {'size': 0, 'allocated': 0, 'files': 0,
+                                      'dirs': 0, 'errors': 1}
+        result['children'] = sorted(
+            [dict(totals[os.path.join(path, name)], name=name)
+             for name in (path in stats and stats[path].subdirs or [])
+             if os.path.join(path, name) in totals],
+            key=lambda child: child['size'], reverse=True)
+        result['scanned'] = self.misses - misses
+        result['cached'] = self.hits - hits
+        return result
+
+    def close(self):
+        with self._lock:
+            self._cache.clear()
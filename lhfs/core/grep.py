@@ -0,0 +1,252 @@
+import concurrent.futures
+import fnmatch
+import logging
+import mmap
+import multiprocessing
+import os
+import re
+import threading
+
+from lhfs.common import conf
+from lhfs.common import exception
+from lhfs.core import walker
+
+CONF = conf.CONF
+LOG = logging.getLogger(__name__)
+
+# the file is binary if there is NUL in the first bytes
+BINARY_CHECK_BYTES = 8192
+# the long lines are truncated
+MAX_LINE_BYTES = 1024
+# the files are sent to the workers in batches of at most these files or
+# bytes, so that small files do not cost one task each
+BATCH_FILES = 64
+BATCH_BYTES = 8 * 1024 * 1024
+
+
+def _decode(line):
+    return line[:MAX_LINE_BYTES].decode('utf-8', 'replace').rstrip('\r')
+
+
+def _lines_before(mm, start, count):
+    lines = []
+    end = start - 1
+    while len(lines) < count and end >= 0:
+        begin = mm.rfind(b'\n', 0, end) + 1
+        lines.append(_decode(mm[begin:end]))
+        end = begin - 1
+    lines.reverse()
+    return lines
+
+
+def _lines_after(mm, end, count):
+    lines = []
+    begin = end + 1
+    while len(lines) < count and begin < len(mm):
+        end = mm.find(b'\n', begin)
+        if end < 0:
+            end = len(mm)
+        lines.append(_decode(mm[begin:end]))
+        begin = end + 1
+    return lines
+
+
+def grep_file(path, regex, context=0, max_matches=None):
+    """Search the lines of file which match regex, the file is mapped into
+    memory, so it is not copied. The binary files are skipped.
+
+    Return the list of {'line': 1, 'text': ..., 'before': [], 'after': []}
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm.find(b'\0', 0, BINARY_CHECK_BYTES) >= 0:
+                return []
+            matches = []
+            line_no, counted, pos = 1, 0, 0
+            while pos <= len(mm):
+                found = regex.search(mm, pos)
+                if not found:
+                    break
+                start = mm.rfind(b'\n', 0, found.start()) + 1
+                end = mm.find(b'\n', found.start())
+                if end < 0:
+                    end = len(mm)
+                if found.end() > end:
+                    # the match must not join lines, e.g. with \s+, so
+                    # search in the line only
+                    found = regex.search(mm, max(pos, start), end)
+                    if not found:
+                        pos = end + 1
+                        continue
+                line_no += mm[counted:start].count(b'\n')
+                counted = start
+                matches.append({
+                    'line': line_no, 'text': _decode(mm[start:end]),
+                    'before': _lines_before(mm, start, context),
+                    'after': _lines_after(mm, end, context)})
+                if max_matches and len(matches) >= max_matches:
+                    break
+                # one match for each line
+                pos = end + 1
+            return matches
+
+
+def grep_files(paths, pattern, flags, context, max_matches):
+    """Grep the files in the worker process
+
+    Return the list of (path, matches) of the matched files.
+    """
+    regex = re.compile(pattern, flags)
+    results = []
+    for path in paths:
+        try:
+            matches = grep_file(path, regex, context=context,
+                                max_matches=max_matches)
+        except (OSError, ValueError) as e:
+            LOG.debug('grep %s failed: %s', path, e)
+            continue
+        if matches:
+            results.append((path, matches))
+    return results
+
+
+class GrepEngine(object):
+    """Search the content of files with a process pool
+
+    The files are found with the tree walker and grepped in batches by the
+    worker processes, so that the searching is not limited by the GIL.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or CONF.lhfs.grep_workers
+        self.walker = walker.TreeWalker()
+        self._executor = None
+        self._futures = set()
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if not self._executor:
+                # the server has threads, so the workers are not forked
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    @staticmethod
+    def compile(pattern, regex=False, ignore_case=False):
+        """Return (pattern, flags) of the bytes regex"""
+        pattern = pattern.encode()
+        if not regex:
+            pattern = re.escape(pattern)
+        # the file is searched as a whole, ^ and $ match at each line
+        flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+        try:
+            re.compile(pattern, flags)
+        except re.error as e:
+            raise exception.InvalidGrepPattern(pattern=pattern.decode(),
+                                               reason=e)
+        return pattern, flags
+
+    def _iter_files(self, path, glob, max_size, cancel):
+        """Generate (path, size) of the regular files to grep"""
+
+        def scan(dir_path):
+            entries, sub_dirs = walker.scan_entries(dir_path)
+            files = []
+            for entry in entries:
+                if glob and not fnmatch.fnmatch(entry.name, glob):
+                    continue
+                try:
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    size = entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    continue
+                if size <= max_size:
+                    files.append((entry.path, size))
+            return files, sub_dirs
+
+        if os.path.isfile(path):
+            yield path, os.path.getsize(path)
+            return
+        for _, _, files in self.walker.walk(path, scan=scan, cancel=cancel):
+            yield from files
+
+    def _iter_batches(self, files):
+        batch, batch_bytes = [], 0
+        for file_path, size in files:
+            batch.append(file_path)
+            batch_bytes += size
+            if len(batch) >= BATCH_FILES or batch_bytes >= BATCH_BYTES:
+                yield batch
+                batch, batch_bytes = [], 0
+        if batch:
+            yield batch
+
+    def grep(self, path, pattern, regex=False, ignore_case=False, glob=None,
+             max_size=None, context=0, max_matches=None, cancel=None):
+        """Get the generator of (path, matches) of the files under path
+
+        The lines which contain pattern, or match it if regex is True, are
+        matches, see grep_file(). The files bigger than max_size and the
+        files whose name does not match glob are skipped. The results are
+        generated once they are found, and the search stops when the
+        threading.Event cancel is set.
+        """
+        pattern, flags = self.compile(pattern, regex=regex,
+                                      ignore_case=ignore_case)
+        cancel = cancel or threading.Event()
+        files = self._iter_files(
+            path, glob, max_size or CONF.lhfs.grep_max_size, cancel)
+        return self._grep(files, (pattern, flags, context, max_matches),
+                          cancel)
+
+    def _submit(self, executor, *args):
+        future = executor.submit(grep_files, *args)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._discard)
+        return future
+
+    def _discard(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def _grep(self, files, args, cancel):
+        executor = self._get_executor()
+        pending = set()
+        try:
+            for batch in self._iter_batches(files):
+                if cancel.is_set():
+                    return
+                pending.add(self._submit(executor, batch, *args))
+                # keep the workers busy, but not read the whole tree ahead
+                while len(pending) >= self.workers * 2:
+                    done, pending = concurrent.futures.wait(
+                        pending,
+                        return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        yield from future.result()
+            while pending and not cancel.is_set():
+                done, pending = concurrent.futures.wait(
+                    pending, timeout=walker.IDLE_TIMEOUT,
+                    return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+        finally:
+            for future in pending:
+                future.cancel()
+            files.close()
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            futures, self._futures = self._futures, set()
+        # shutdown(cancel_futures=True) requires python>=3.9
+        for future in futures:
+            future.cancel()
+        if executor:
+            executor.shutdown(wait=False)
@@ -0,0 +1,630 @@
+import contextlib
+import functools
+import hashlib
+import itertools
+import logging
+import os
+import sqlite3
+import stat
+import threading
+import time
+
+from lhfs.common import inotify
+from lhfs.core import walker
+
+LOG = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 1
+SEARCH_MODES = ('glob', 'substring')
+INSERT_BATCH_SIZE = 5000
+# the progress handler which checks cancel is called every N steps
+PROGRESS_STEPS = 10000
+# the interval to retry if the index is not built
+RETRY_INTERVAL = 60
+# the directories which have events in this window are rescanned if the
+# inotify event queue overflowed
+OVERFLOW_WINDOW = 10
+# the seconds to rebuild the index after the inotify watcher failed
+FALLBACK_REBUILD_INTERVAL = 600
+
+WATCH_EVENTS = inotify.DIR_EVENTS | inotify.IN_CLOSE_WRITE
+# the events after which the sub directories must be scanned again
+TREE_EVENTS = inotify.IN_CREATE | inotify.IN_MOVED_TO | \
+    inotify.IN_MOVED_FROM | inotify.IN_DELETE
+
+ENTRIES_TABLE = 'CREATE TABLE entries (' \
+    'id INTEGER PRIMARY KEY, parent TEXT NOT NULL, name TEXT NOT NULL, ' \
+    'size INTEGER, mtime REAL, is_dir INTEGER, UNIQUE (parent, name))'
+NAMES_TABLE = "CREATE VIRTUAL TABLE names USING fts5(" \
+    "name, tokenize='trigram', detail='none')"
+META_TABLE = 'CREATE TABLE meta (key TEXT PRIMARY KEY, value)'
+
+
+@functools.lru_cache(maxsize=None)
+def has_trigram():
+    """Check if the trigram tokenizer of fts5 is supported, SQLite>=3.34
+    """
+    with contextlib.closing(sqlite3.connect(':memory:')) as conn:
+        try:
+            conn.execute(NAMES_TABLE)
+        except sqlite3.OperationalError:
+            return False
+    return True
+
+
+def glob_to_sqlite(partern):
+    """fnmatch uses [!...] for negation, but GLOB of SQLite uses [^...]
+    """
+    return partern.replace('[!', '[^')
+
+
+def escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def coalesce(pending):
+    """Convert the dict {abs_path: recursive} to the list of
+    (abs_path, recursive), the pathes under a recursive one are dropped.
+    """
+    pathes = []
+    covered = None
+    # the sub pathes are just after their parent in this order
+    for abs_path in sorted(pending, key=lambda p: p.split(os.sep)):
+        if covered and abs_path.startswith(covered):
+            continue
+        recursive = pending[abs_path]
+        pathes.append((abs_path, recursive))
+        covered = recursive and abs_path.rstrip(os.sep) + os.sep
+    return pathes
+
+
+class FilenameIndex(object):
+    """Index of the names of files under root, saved in a SQLite database
+
+    Each entry is (parent, name, size, mtime, is_dir), parent is the logic
+    path of the directory. The names are indexed by a trigram fts5 table if
+    it is supported, so GLOB and LIKE queries which have three or more
+    literal characters need not scan all names.
+
+    The index is rebuilt by walking the tree into a new database file, which
+    replaces the old one when it is done, the changes refreshed while
+    rebuilding are applied to the new database before that.
+    """
+
+    def __init__(self, root, index_dir):
+        self.root = os.path.abspath(root)
+        root_hash = hashlib.sha1(self.root.encode()).hexdigest()[:16]
+        self.db_path = os.path.join(index_dir, f'{root_hash}.db')
+        self.fts = has_trigram()
+        self.walker = walker.TreeWalker()
+        self.rebuilding = False
+        self._ready = None
+        self._changed = set()
+        self._write_lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._queued = {}
+        self._queue_lock = threading.Lock()
+        self._queue_wakeup = threading.Event()
+        self._refresher = None
+
+    def _connect(self, db_path=None):
+        return sqlite3.connect(db_path or self.db_path, timeout=30,
+                               check_same_thread=False)
+
+    def _logic(self, abs_path):
+        logic_path = abs_path[len(self.root):]
+        return logic_path.replace(os.sep, '/') if os.sep != '/' else \
+            logic_path
+
+    def _split(self, abs_path):
+        abs_path = abs_path.rstrip(os.sep) or os.sep
+        return (self._logic(os.path.dirname(abs_path)),
+                os.path.basename(abs_path))
+
+    def _get_meta(self):
+        if not os.path.exists(self.db_path):
+            return {}
+        try:
+            with contextlib.closing(self._connect()) as conn:
+                return dict(conn.execute('SELECT key, value FROM meta'))
+        except sqlite3.Error as e:
+            LOG.warning('read filename index %s failed: %s', self.db_path, e)
+            return {}
+
+    def ready(self):
+        """The index is ready if it is built for root with current schema
+        """
+        if self._ready is None:
+            meta = self._get_meta()
+            self._ready = meta.get('root') == self.root and \
+                meta.get('version') == SCHEMA_VERSION and \
+                meta.get('fts') == int(self.fts) and \
+                bool(meta.get('built_at'))
+        return self._ready
+
+    def age(self):
+        """Seconds since the index was built, None if it is not ready"""
+        if not self.ready():
+            return None
+        return time.time() - self._get_meta().get('built_at', 0)
+
+    def status(self):
+        status = {'ready': self.ready(), 'rebuilding': self.rebuilding,
+                  'fts': self.fts, 'entries': 0, 'built_at': None}
+        if status['ready']:
+            meta = self._get_meta()
+            status.update(entries=meta.get('entries', 0),
+                          built_at=meta.get('built_at'))
+        return status
+
+    def _scan(self, dir_path):
+        """Scan the rows of the children of directory in walker threads
+        """
+        parent = self._logic(dir_path)
+        entries, sub_dirs = walker.scan_entries(dir_path)
+        rows = []
+        for entry in entries:
+            try:
+                entry_stat = walker.entry_stat(entry)
+            except OSError as e:
+                LOG.debug('stat %s failed: %s', entry.path, e)
+                continue
+            rows.append((parent, entry.name, entry_stat.st_size,
+                         entry_stat.st_mtime,
+                         int(stat.S_ISDIR(entry_stat.st_mode))))
+        return rows, sub_dirs
+
+    def _walk(self, abs_path):
+        """Generate the rows of the children of abs_path, recursively
+        """
+        for _, _, rows in self.walker.walk(abs_path, scan=self._scan):
+            if self._stopped.is_set():
+                break
+            yield from rows
+
+    def _insert(self, conn, rows):
+        """Insert the rows, update those which exist"""
+        last_id = conn.execute('SELECT max(id) FROM entries').fetchone()[0]
+        conn.executemany(
+            'INSERT INTO entries (parent, name, size, mtime, is_dir) '
+            'VALUES (?, ?, ?, ?, ?) ON CONFLICT (parent, name) DO UPDATE '
+            'SET size=excluded.size, mtime=excluded.mtime, '
+            'is_dir=excluded.is_dir', rows)
+        if self.fts:
+            # the ids of new entries are greater than the max id before
+            conn.execute('INSERT INTO names (rowid, name) '
+                         'SELECT id, name FROM entries WHERE id > ?',
+                         (last_id or 0,))
+
+    def _bulk_insert(self, conn, rows, first_id):
+        ids = range(first_id, first_id + len(rows))
+        conn.executemany(
+            'INSERT INTO entries (id, parent, name, size, mtime, is_dir) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            ((entry_id,) + row for entry_id, row in zip(ids, rows)))
+        if self.fts:
+            conn.executemany('INSERT INTO names (rowid, name) VALUES (?, ?)',
+                             ((entry_id, row[1])
+                              for entry_id, row in zip(ids, rows)))
+
+    def _delete(self, conn, parent, name):
+        """Delete the entry and the entries under it"""
+        logic_path = f'{parent}/{name}'
+        where = '(parent=? AND name=?) OR parent=? OR ' \
+                '(parent>=? AND parent<?)'
+        args = (parent, name, logic_path, logic_path + '/', logic_path + '0')
+        if self.fts:
+            conn.execute('DELETE FROM names WHERE rowid IN '
+                         f'(SELECT id FROM entries WHERE {where})', args)
+        conn.execute(f'DELETE FROM entries WHERE {where}', args)
+
+    def _refresh(self, conn, abs_path, recursive):
+        parent, name = self._split(abs_path)
+        try:
+            path_stat = os.stat(abs_path)
+        except OSError:
+            self._delete(conn, parent, name)
+            return
+        if recursive:
+            self._delete(conn, parent, name)
+        self._insert(conn, [(parent, name, path_stat.st_size,
+                             path_stat.st_mtime,
+                             int(stat.S_ISDIR(path_stat.st_mode)))])
+        if recursive and stat.S_ISDIR(path_stat.st_mode) and \
+           not os.path.islink(abs_path):
+            rows = self._walk(abs_path)
+            while True:
+                batch = list(itertools.islice(rows, INSERT_BATCH_SIZE))
+                if not batch:
+                    break
+                self._insert(conn, batch)
+
+    def refresh(self, abs_path, recursive=False):
+        """Update the entry of abs_path, delete it if it does not exist
+
+        If recursive is True, the entries under abs_path are updated too.
+        """
+        self.refresh_many([(abs_path, recursive)])
+
+    def refresh_many(self, pathes):
+        """Refresh the list of (abs_path, recursive) in one transaction
+        """
+        prefix = self.root.rstrip(os.sep) + os.sep
+        pathes = [(os.path.abspath(abs_path), recursive)
+                  for abs_path, recursive in pathes]
+        pathes = [(abs_path, recursive) for abs_path, recursive in pathes
+                  if abs_path.startswith(prefix)]
+        if not pathes:
+            return
+        with self._write_lock:
+            if self.rebuilding:
+                self._changed.update(pathes)
+            if not self.ready():
+                return
+            with contextlib.closing(self._connect()) as conn, conn:
+                for abs_path, recursive in pathes:
+                    self._refresh(conn, abs_path, recursive)
+
+    def refresh_later(self, pathes):
+        """Queue the list of (abs_path, recursive) to refresh in background
+        """
+        with self._queue_lock:
+            for abs_path, recursive in pathes:
+                self._queued[abs_path] = self._queued.get(abs_path) or \
+                    recursive
+            if not (self._refresher and self._refresher.is_alive()):
+                self._refresher = threading.Thread(
+                    target=self._run_refresher, daemon=True,
+                    name='filename-index-refresh')
+                self._refresher.start()
+        self._queue_wakeup.set()
+
+    def _run_refresher(self):
+        while not self._stopped.is_set():
+            self._queue_wakeup.wait()
+            self._queue_wakeup.clear()
+            with self._queue_lock:
+                queued, self._queued = self._queued, {}
+            if not queued or self._stopped.is_set():
+                continue
+            try:
+                self.refresh_many(coalesce(queued))
+            except Exception as e:
+                LOG.exception('refresh filename index failed: %s', e)
+
+    def rebuild(self):
+        """Rebuild the index by walking the tree
+
+        Return False if it is being rebuilt by another thread.
+        """
+        if not self._rebuild_lock.acquire(blocking=False):
+            return False
+        try:
+            self.rebuilding = True
+            self._rebuild()
+        finally:
+            self.rebuilding = False
+            self._rebuild_lock.release()
+        return True
+
+    def _rebuild(self):
+        LOG.info('rebuild filename index of %s', self.root)
+        started = time.time()
+        temp_path = self.db_path + '.new'
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        count = 0
+        with contextlib.closing(self._connect(temp_path)) as conn:
+            # the file is thrown away if it is not completed
+            conn.execute('PRAGMA journal_mode=OFF')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute(ENTRIES_TABLE)
+            conn.execute('CREATE INDEX entries_parent ON entries (parent)')
+            if self.fts:
+                conn.execute(NAMES_TABLE)
+            conn.execute(META_TABLE)
+            rows = self._walk(self.root)
+            while True:
+                batch = list(itertools.islice(rows, INSERT_BATCH_SIZE))
+                if not batch:
+                    break
+                self._bulk_insert(conn, batch, count + 1)
+                count += len(batch)
+            if self._stopped.is_set():
+                conn.close()
+                os.remove(temp_path)
+                LOG.info('rebuild filename index of %s is stopped', self.root)
+                return
+            conn.executemany(
+                'INSERT INTO meta (key, value) VALUES (?, ?)',
+                [('root', self.root), ('version', SCHEMA_VERSION),
+                 ('fts', int(self.fts)), ('built_at', started),
+                 ('entries', count)])
+            conn.commit()
+            with self._write_lock:
+                for abs_path, recursive in self._changed:
+                    self._refresh(conn, abs_path, recursive)
+                conn.commit()
+                self._changed = set()
+                conn.close()
+                os.replace(temp_path, self.db_path)
+                self._ready = True
+        LOG.info('rebuilt filename index of %s, %s entries in %.1fs',
+                 self.root, count, time.time() - started)
+
+    def search(self, partern, mode='glob', cancel=None):
+        """Generate (parent, name, size, mtime, is_dir) of matched entries
+
+        With mode glob, partern is matched like fnmatch and case sensitive,
+        with mode substring, the names contain partern ignoring case. The
+        query is interrupted when the threading.Event cancel is set.
+        """
+        if mode == 'substring' and escape_like(partern) == partern:
+            where, arg = 'name LIKE ?', f'%{partern}%'
+        elif mode == 'substring':
+            # LIKE with ESCAPE is not accelerated by the trigram index
+            where, arg = "name LIKE ? ESCAPE '\\'", f'%{escape_like(partern)}%'
+        else:
+            where, arg = 'name GLOB ?', glob_to_sqlite(partern)
+        if self.fts:
+            sql = 'SELECT e.parent, e.name, e.size, e.mtime, e.is_dir ' \
+                  'FROM names JOIN entries AS e ON e.id = names.rowid ' \
+                  f'WHERE names.{where}'
+        else:
+            sql = 'SELECT parent, name, size, mtime, is_dir FROM entries ' \
+                  f'WHERE {where}'
+        with contextlib.closing(self._connect()) as conn:
+            if cancel:
+                # a query which matches few names may scan for a long time
+                conn.set_progress_handler(cancel.is_set, PROGRESS_STEPS)
+            try:
+                # the rows are generated once they are found
+                for row in conn.execute(sql, (arg,)):
+                    yield row
+                    if cancel and cancel.is_set():
+                        break
+            except sqlite3.OperationalError:
+                if not (cancel and cancel.is_set()):
+                    raise
+
+    def _run(self, rebuild_interval, rebuild):
+        while not self._stopped.is_set():
+            age = self.age()
+            if rebuild or age is None or 0 < rebuild_interval <= age:
+                rebuild = False
+                try:
+                    self.rebuild()
+                except Exception as e:
+                    LOG.exception('rebuild filename index failed: %s', e)
+                age = self.age()
+            if age is not None and rebuild_interval <= 0:
+                return
+            self._stopped.wait(
+                RETRY_INTERVAL if age is None else
+                max(rebuild_interval - age, 1))
+
+    def start(self, rebuild_interval=0, rebuild=False):
+        """Build the index in background if it is not ready
+
+        It is rebuilt every rebuild_interval seconds if that is greater
+        than 0, and at once if rebuild is True.
+        """
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        args=(rebuild_interval, rebuild),
+                                        daemon=True, name='filename-index')
+        self._thread.start()
+
+    def rebuild_in_background(self):
+        if self.rebuilding:
+            return
+        threading.Thread(target=self.rebuild, daemon=True,
+                         name='filename-index-rebuild').start()
+
+    def stop(self):
+        self._stopped.set()
+        self._queue_wakeup.set()
+        for thread in [self._thread, self._refresher]:
+            if thread:
+                thread.join()
+        self._thread = self._refresher = None
+
+
+class IndexWatcher(object):
+    """Apply the changes of the tree to the filename index with inotify
+
+    All directories under root are watched. The events are coalesced for
+    delay seconds, then the changed pathes are refreshed in one
+    transaction, a created or moved directory is refreshed recursively and
+    its sub directories are watched.
+
+    If the event queue overflowed, the lost events are most likely in the
+    directories of the recent burst, so only the subtree which contains the
+    directories having events in the last OVERFLOW_WINDOW seconds is
+    rescanned, it is the whole tree if there were no events.
+
+    If the inotify watcher failed, the index is rebuilt every
+    FALLBACK_REBUILD_INTERVAL seconds instead.
+    """
+
+    def __init__(self, filename_index, delay=0.2):
+        self.index = filename_index
+        self.root = filename_index.root
+        self.delay = delay
+        self.rebuild_interval = 0
+        self.failed_watches = 0
+        self.overflows = 0
+        self._watcher = inotify.Watcher(self._on_event, mask=WATCH_EVENTS)
+        self._pending = {}
+        self._recent = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def watch_tree(self, abs_path):
+        """Watch abs_path and its sub directories, return the failures
+        """
+        failed = 0
+        dirs = [abs_path]
+        while dirs and not self._stopped.is_set():
+            dir_path = dirs.pop()
+            # watch before listing, so that no new sub directory is missed
+            if not self._watcher.watch(dir_path):
+                failed += 1
+                continue
+            try:
+                with os.scandir(dir_path) as entries:
+                    dirs.extend(entry.path for entry in entries
+                                if entry.is_dir(follow_symlinks=False))
+            except OSError as e:
+                LOG.debug('scan %s failed: %s', dir_path, e)
+        if failed:
+            self.failed_watches += failed
+            LOG.warning('watch %s directories under %s failed, check '
+                        'fs.inotify.max_user_watches', failed, abs_path)
+        return failed
+
+    def _unwatch_tree(self, abs_path):
+        prefix = abs_path + os.sep
+        for path in self._watcher.watching():
+            if path == abs_path or path.startswith(prefix):
+                self._watcher.unwatch(path)
+
+    def _on_event(self, path, name, mask):
+        if path is None:
+            if self._watcher.failed:
+                self._wakeup.set()
+            else:
+                self._on_overflow()
+            return
+        if not name:
+            # the event of watched directory itself, its parent has the
+            # event of it too
+            return
+        abs_path = os.path.join(path, name)
+        tree_changed = bool(mask & inotify.IN_ISDIR and mask & TREE_EVENTS)
+        if tree_changed and mask & (inotify.IN_MOVED_FROM |
+                                    inotify.IN_DELETE):
+            # the watches of moved directories have stale pathes
+            self._unwatch_tree(abs_path)
+        with self._lock:
+            self._pending[abs_path] = self._pending.get(abs_path) or \
+                tree_changed
+            self._recent[path] = time.time()
+        self._wakeup.set()
+
+    def _on_overflow(self):
+        self.overflows += 1
+        now = time.time()
+        with self._lock:
+            dirs = [path for path, changed_at in self._recent.items()
+                    if now - changed_at < OVERFLOW_WINDOW]
+            subtree = os.path.commonpath(dirs) if dirs else self.root
+            self._pending[subtree] = True
+        LOG.warning('inotify event queue overflowed, rescan %s', subtree)
+        self._wakeup.set()
+
+    def _take_pending(self):
+        """Take the pending pathes, except those in the recursive ones"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            expired = time.time() - OVERFLOW_WINDOW
+            self._recent = {path: changed_at
+                            for path, changed_at in self._recent.items()
+                            if changed_at > expired}
+        return coalesce(pending)
+
+    def flush(self):
+        pathes = self._take_pending()
+        if not pathes:
+            return
+        if pathes[0] == (self.root, True):
+            self.watch_tree(self.root)
+            self.index.rebuild_in_background()
+            return
+        for abs_path, recursive in pathes:
+            if recursive and os.path.isdir(abs_path) and \
+               not os.path.islink(abs_path):
+                self.watch_tree(abs_path)
+        self.index.refresh_many(pathes)
+        LOG.debug('refreshed %s pathes in filename index', len(pathes))
+
+    def _run(self):
+        if self.watch_tree(self.root):
+            # some changes can not be watched, so rebuild it periodically
+            self.index.start(self.rebuild_interval)
+        else:
+            # the changes while not watching are unknown, rebuild it once
+            self.index.start(rebuild=True)
+        while not self._stopped.is_set():
+            self._wakeup.wait()
+            if self._stopped.is_set():
+                break
+            if self._watcher.failed:
+                self._rebuild_periodically()
+                break
+            # coalesce the events of a burst
+            time.sleep(self.delay)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                LOG.exception('update filename index failed: %s', e)
+
+    def _rebuild_periodically(self):
+        LOG.warning('inotify watcher failed, rebuild filename index every '
+                    '%s seconds', FALLBACK_REBUILD_INTERVAL)
+        while True:
+            try:
+                self.index.rebuild()
+            except Exception as e:
+                LOG.exception('rebuild filename index failed: %s', e)
+            if self._stopped.wait(FALLBACK_REBUILD_INTERVAL):
+                return
+
+    def start(self, rebuild_interval=0):
+        """Watch the tree and start the index in background
+
+        If some directories can not be watched, the index is rebuilt every
+        rebuild_interval seconds.
+        """
+        if not inotify.is_supported():
+            return False
+        if self._thread and self._thread.is_alive():
+            return True
+        self.rebuild_interval = rebuild_interval
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='filename-index-watcher')
+        self._thread.start()
+        return True
+
+    def watching_all(self):
+        """All the changes are found if it is running and no directory
+        failed to watch.
+        """
+        return bool(self._thread and self._thread.is_alive()) and \
+            not self._stopped.is_set() and not self.failed_watches and \
+            not self._watcher.failed
+
+    def stats(self):
+        return {'watches': len(self._watcher.watching()),
+                'failed_watches': self.failed_watches,
+                'overflows': self.overflows,
+                'failed': self._watcher.failed,
+                'pending': len(self._pending)}
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self._watcher.stop()
+        self.index.stop()
@@ -1,6 +1,10 @@
+import concurrent.futures
+import fnmatch
 import os
+import re
+import stat
+import threading
 import time
-import mimetypes
 import abc
 
 import logging
@@ -14,7 +18,13 @@ from lhfs.common import conf
 from lhfs.common import constants
 from lhfs.common import exception
 from lhfs.common import utils
+from lhfs.core import cache
+from lhfs.core import du
+from lhfs.core import grep
+from lhfs.core import index
 from lhfs.core import objects
+from lhfs.core import thumb
+from lhfs.core import walker
 
 CONF = conf.CONF
 
@@ -29,11 +39,53 @@ rpc_class = {
 }
 
 
+def search_rank_key(partern, mode='glob'):
+    """Make the key function to sort the found items by relevance
+
+    The items whose name is the partern come first, then the names which
+    start with it (the text before the first wildcard in glob mode), the
+    shallower items come before the deeper ones.
+    """
+    if mode == 'glob':
+        prefix = re.split(r'[*?\[]', partern, maxsplit=1)[0].lower()
+    else:
+        prefix = partern.lower()
+
+    def key(item):
+        name = item['name'].lower()
+        if item['name'] == partern:
+            relevance = 0
+        elif name == prefix:
+            relevance = 1
+        elif name.startswith(prefix):
+            relevance = 2
+        else:
+            relevance = 3
+        pardir = (item.get('pardir') or '').strip('/')
+        return (relevance, pardir.count('/') + bool(pardir), name,
+                item.get('node') or '')
+
+    return key
+
+
 class FSManager(object):
 
     def __init__(self, root):
         self.root = os.path.abspath(root)
         self.search_history = structure.LastNList(10)
+        self.listing_cache = cache.ListingCache(
+            CONF.lhfs.listing_cache_entries, CONF.lhfs.listing_cache_bytes)
+        self.du_engine = du.DuEngine()
+        self.walker = walker.TreeWalker()
+        self._stat_executor = None
+        self.thumbnail_cache = thumb.ThumbnailCache(
+            os.path.join(CONF.lhfs.data_dir, 'thumbs'))
+        self.filename_index = index.FilenameIndex(
+            self.root, os.path.join(CONF.lhfs.data_dir, 'index'))
+        self.index_watcher = index.IndexWatcher(
+            self.filename_index, delay=CONF.lhfs.index_watch_delay / 1000)
+        self.grep_engine = grep.GrepEngine()
+        self.record_sessions = utils.RecordSessions()
         LOG.info('root path is %s', self.root)
 
     def make_path_obj(self, logic_path):
@@ -52,17 +104,49 @@ class FSManager(object):
     def path_exists(self, path):
         return os.path.exists(self.get_abs_path(path))
 
-    def get_path_dict(self, path):
+    @utils.remotable
+    def get_path_dict(self, path, etag=False):
         lp = objects.LogicPath(self.root, path)
-        return lp.dict_info()
+        item = lp.dict_info()
+        if etag:
+            item.etag = lp.etag()
+        return item
+
+    def _stat_path(self, path, etag=False):
+        lp = objects.LogicPath(self.root, path)
+        try:
+            item = lp.dict_info()
+            if etag:
+                item.etag = lp.etag()
+        except OSError as e:
+            LOG.debug('stat %s failed: %s', path, e)
+            return None
+        return item
+
+    @utils.remotable
+    def stat_many(self, paths, etag=False):
+        """Get DirItem of paths, None if the path not exists
+        The paths are stat concurrently with a thread pool.
+        """
+        if len(paths) <= 1:
+            return [self._stat_path(path, etag=etag) for path in paths]
+        if not self._stat_executor:
+            self._stat_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=CONF.lhfs.stat_workers,
+                thread_name_prefix='stat')
+        return list(self._stat_executor.map(
+            lambda path: self._stat_path(path, etag=etag), paths))
 
     def editable(self, path):
-        abs_path = self.get_abs_path(path)
-        if os.path.isfile(abs_path):
-            t, _ = mimetypes.guess_type(abs_path)
-            if t in ['text/plain', 'application/x-sh']:
-                return True
-        return False
+        lp = objects.LogicPath(self.root, path)
+        return lp.editable()
+
+    def _refresh_index(self, *pathes):
+        """Refresh the (abs_path, recursive) pathes of filename index in
+        background, it is not needed if the watcher finds all changes.
+        """
+        if not self.index_watcher.watching_all():
+            self.filename_index.refresh_later(pathes)
 
     @utils.remotable
     def mkdir(self, path):
@@ -70,6 +154,8 @@ class FSManager(object):
         if lp.exists():
             raise exception.FileExists(path=path)
         lp.mkdir()
+        self.listing_cache.invalidate(lp.abs_parent_path())
+        self._refresh_index((lp.abs_path(), False))
 
     @utils.remotable
     def ensure_parent_dir(self, path):
@@ -81,12 +167,18 @@ class FSManager(object):
         LOG.info('rename: %s to %s', path, new_name)
         lp = objects.LogicPath(self.root, path)
         lp.rename(new_name)
+        self.listing_cache.invalidate(lp.abs_path(), recursive=True)
+        self._refresh_index(
+            (lp.abs_path(), True),
+            (os.path.join(lp.abs_parent_path(), new_name), True))
 
     @utils.remotable
     def rm(self, path, force):
         LOG.info('rm(recursive=%s): %s', force, path)
         lp = objects.LogicPath(self.root, path)
         lp.delete(recursive=force)
+        self.listing_cache.invalidate(lp.abs_path(), recursive=True)
+        self._refresh_index((lp.abs_path(), True))
         LOG.debug('rm success: %s', path)
 
     def listdir(self, path):
@@ -103,24 +195,78 @@ class FSManager(object):
             return path[1:]
         return path
 
+    def _scan(self, lp, show_all):
+        """Get the entries of directory from listing cache"""
+        return self.listing_cache.get(
+            lp.abs_path(), show_all, lambda: lp.scan(show_all=show_all))
+
     @utils.remotable
     def ls(self, path, show_all):
         lp = objects.LogicPath(self.root, path)
-        return lp.ls(show_all=show_all)
+        if not lp.is_dir():
+            return [lp.dict_info()]
+        return [objects.DirItem(*entry) for entry in self._scan(lp, show_all)]
+
+    def iter_ls(self, path, show_all=False):
+        """Generate DirItem of the children while scanning the directory
+        The cached listing is used if exists.
+        """
+        lp = objects.LogicPath(self.root, path)
+        if not lp.is_dir():
+            yield lp.dict_info()
+            return
+        entries = self.listing_cache.lookup(lp.abs_path(), show_all)
+        if entries is None:
+            entries = lp.scan(show_all=show_all)
+        for entry in entries:
+            yield objects.DirItem(*entry)
+
+    @utils.remotable
+    def ls_page(self, path, show_all=False, sort='name', reverse=False,
+                limit=None, cursor=None, columnar=False):
+        lp = objects.LogicPath(self.root, path)
+        if lp.is_dir():
+            items, next_cursor, total = objects.page_entries(
+                self._scan(lp, show_all), sort=sort, reverse=reverse,
+                limit=limit, cursor=cursor)
+        else:
+            items, next_cursor, total = [lp.dict_info()], None, 1
+        if columnar:
+            return {'columns': objects.to_columns(items),
+                    'next_cursor': next_cursor, 'total': total}
+        return {'children': items, 'next_cursor': next_cursor,
+                'total': total}
 
     @utils.remotable
     def get_file_content(self, path):
         lp = objects.LogicPath(self.root, path)
         return lp.file_content()
 
-    def save_file(self, path, fo):
-        save_path = f'{path}/{fo.filename}'
-        save_dir = f'{path}/{os.path.dirname(fo.filename)}'
-        dir_lp = objects.LogicPath(self.root, save_dir)
-        if not dir_lp.exists():
-            dir_lp.mkdir()
-        file_lp = objects.LogicPath(self.root, save_path)
-        file_lp.save(fo)
+    def get_save_path(self, path, filename):
+        """Get the logic path to save the uploaded file
+        The filename may contains sub directories, e.g. dir1/foo.txt
+        """
+        parts = [p for p in filename.replace('\\', '/').split('/')
+                 if p not in ('', '.')]
+        if not parts or '..' in parts:
+            raise exception.InvalidFileName(name=filename)
+        return '/'.join([path.rstrip('/')] + parts)
+
+    def get_upload_temp_dir(self, path, filename):
+        """Get the directory to save the temp file of uploading
+        """
+        file_lp = objects.LogicPath(self.root,
+                                    self.get_save_path(path, filename))
+        file_lp.ensure_parent_dir()
+        return file_lp.abs_parent_path()
+
+    def save_file(self, path, filename, temp_path):
+        file_lp = objects.LogicPath(self.root,
+                                    self.get_save_path(path, filename))
+        file_lp.ensure_parent_dir()
+        file_lp.save(temp_path)
+        self.listing_cache.invalidate(file_lp.abs_parent_path())
+        self._refresh_index((file_lp.abs_path(), False))
 
     @utils.remotable
     def disk_usage(self):
@@ -132,6 +278,31 @@ class FSManager(object):
             free=sdiskusage.free / constants.Unit.KB.value,
             percent=sdiskusage.percent)
 
+    @utils.remotable
+    def thumbnail(self, path, size):
+        """Get the jpeg thumbnail of image or video"""
+        thumb.check_size(size)
+        lp = objects.LogicPath(self.root, path)
+        if not lp.exists():
+            raise exception.FileNotExists(path=path)
+        return self.thumbnail_cache.get(lp.abs_path(), size)
+
+    @utils.remotable
+    def du(self, path):
+        """Get the recursive size and count of files of path
+        """
+        lp = objects.LogicPath(self.root, path)
+        if not lp.exists():
+            raise exception.FileNotExists(path=path)
+        if not lp.is_dir():
+            item = lp.dict_info()
+            return {'path': path, 'size': item.size,
+                    'allocated': lp.stat().st_blocks * 512, 'files': 1,
+                    'dirs': 0, 'errors': 0, 'children': []}
+        result = self.du_engine.du(lp.abs_path())
+        result['path'] = path
+        return result
+
     def abs_to_logic(self, abs_path):
         logic_path = abs_path[len(self.root):]
         return '/'.join(logic_path.split('\\')) if OS.is_windows() else \
@@ -143,21 +314,209 @@ class FSManager(object):
         return path_string.split('\\') if OS.is_windows() else \
             path_string.split('/')
 
+    def iter_find(self, partern, mode='glob', use_index=True, limit=None,
+                  cancel=None, timeout=None, host=None):
+        """Get the generator of the matched items
+
+        The items are found in the filename index if it is ready, otherwise
+        they are generated while walking the directories. The search stops
+        after limit items, or when the threading.Event cancel is set.
+        The items of remote node are fetched in batches with rpc, and it
+        stops after timeout seconds.
+        """
+        if not self._is_local(host):
+            session_id = self.find_start(partern, mode, use_index, limit,
+                                         timeout, host=host)
+            # the large sizes are marshalled as float
+            return (objects.DirItem.from_dict(item).to_dict()
+                    for item in self._fetch_records(session_id, cancel, host))
+        if mode not in index.SEARCH_MODES:
+            raise exception.InvalidSearchMode(mode=mode,
+                                              modes=list(index.SEARCH_MODES))
+        if partern not in self.search_history.all():
+            self.search_history.append(partern)
+        if use_index and self.filename_index.ready():
+            items = self._find_in_index(partern, mode, cancel)
+        else:
+            items = self._walk_find(partern, mode, cancel)
+        return self._limit_items(items, limit) if limit else items
+
+    @staticmethod
+    def _limit_items(items, limit):
+        try:
+            for count, item in enumerate(items, 1):
+                yield item
+                if count >= limit:
+                    break
+        finally:
+            # stop the walk at once
+            items.close()
+
+    def _find_in_index(self, partern, mode, cancel):
+        for parent, name, size, mtime, is_dir in \
+                self.filename_index.search(partern, mode=mode,
+                                           cancel=cancel):
+            yield objects.DirItem(name, size, bool(is_dir), mtime,
+                                  pardir=parent).to_dict()
+
+    def _walk_find(self, partern, mode, cancel):
+        if mode == 'substring':
+            substring = partern.lower()
+
+            def match(name):
+                return substring in name.lower()
+        else:
+            def match(name):
+                return fnmatch.fnmatch(name, partern)
+
+        for dir_path, _, matched in self.walker.walk(
+                self.root, scan=walker.match_scan(match), cancel=cancel):
+            logic_dir = self.abs_to_logic(dir_path)
+            for entry, entry_stat in matched:
+                yield objects.DirItem(
+                    entry.name, entry_stat.st_size,
+                    stat.S_ISDIR(entry_stat.st_mode), entry_stat.st_mtime,
+                    pardir=logic_dir).to_dict()
+
     @utils.remotable
-    def find(self, partern):
+    def find(self, partern, mode='glob', use_index=True, limit=None,
+             timeout=None):
         """Find files by partern name
         E.g. *.py, setup.py
+        With mode substring, find the files whose name contains partern.
+        Return the items found in timeout seconds if it is set.
         """
-        matched_pathes = []
-        for dirPath, name in fs.find(self.root, partern):
-            logic_dir = self.abs_to_logic(dirPath)
-            lp = objects.LogicPath(self.root, f'{logic_dir}/{name}')
-            item = lp.dict_info()
-            item.pardir = logic_dir
-            matched_pathes.append(item.to_dict())
-        if partern not in self.search_history.all():
-            self.search_history.append(partern)
-        return matched_pathes
+        with utils.cancel_after(timeout) as cancel:
+            return list(self.iter_find(partern, mode=mode,
+                                       use_index=use_index, limit=limit,
+                                       cancel=cancel))
+
+    def _is_local(self, host):
+        return not host or \
+            (hasattr(self, 'node') and self.node.hostname == host)
+
+    def iter_grep(self, pattern, path='/', glob=None, regex=False,
+                  ignore_case=False, max_size=None, context=0, limit=None,
+                  timeout=None, cancel=None, host=None):
+        """Get the generator of the lines which contain pattern
+
+        The lines match pattern if regex is True. The files under path whose
+        name matches glob and size is not bigger than max_size are searched,
+        the items are {'path', 'line', 'text', 'before', 'after'}, before and
+        after are the context lines. The search stops after limit items,
+        timeout seconds or when the threading.Event cancel is set.
+        The items of remote node are fetched in batches with rpc.
+        """
+        if not self._is_local(host):
+            session_id = self.grep_start(
+                pattern, path, glob, regex, ignore_case, max_size, context,
+                limit, timeout, host=host)
+            return self._fetch_records(session_id, cancel, host)
+        lp = objects.LogicPath(self.root, path)
+        if not lp.exists():
+            raise exception.FileNotExists(path=path)
+        matched = self.grep_engine.grep(
+            lp.abs_path(), pattern, regex=regex, ignore_case=ignore_case,
+            glob=glob, max_size=max_size, context=context,
+            max_matches=limit, cancel=cancel)
+        items = self._iter_grep_items(matched)
+        return self._limit_items(items, limit) if limit else items
+
+    def _iter_grep_items(self, matched):
+        try:
+            for file_path, matches in matched:
+                logic_path = self.abs_to_logic(file_path)
+                for match in matches:
+                    yield dict(match, path=logic_path)
+        finally:
+            matched.close()
+
+    def _fetch_records(self, session_id, cancel, host):
+        """Generate the records of the session on remote node, the session
+        is stopped when it is closed or cancel is set.
+        """
+        try:
+            while not (cancel and cancel.is_set()):
+                batch = self.fetch_records(session_id,
+                                           CONF.api.ndjson_batch_size,
+                                           constants.RECORD_FETCH_WAIT,
+                                           host=host)
+                yield from batch['records']
+                if batch['error']:
+                    raise exception.RemoteRecordsFailed(
+                        node=host, reason=batch['error'])
+                if batch['done']:
+                    return
+        finally:
+            try:
+                self.stop_records(session_id, host=host)
+            except Exception as e:
+                LOG.warning('stop record session %s failed: %s',
+                            session_id, e)
+
+    def grep(self, pattern, path='/', glob=None, regex=False,
+             ignore_case=False, max_size=None, context=0, limit=None,
+             timeout=None, host=None):
+        """Get the list of the lines which contain pattern, see iter_grep()
+        """
+        with utils.cancel_after(timeout) as cancel:
+            return list(self.iter_grep(
+                pattern, path=path, glob=glob, regex=regex,
+                ignore_case=ignore_case, max_size=max_size, context=context,
+                limit=limit, timeout=timeout, cancel=cancel, host=host))
+
+    @utils.remotable
+    def grep_start(self, pattern, path='/', glob=None, regex=False,
+                   ignore_case=False, max_size=None, context=0, limit=None,
+                   timeout=None):
+        """Start a grep session, the items are fetched with fetch_records()
+        Return the session id.
+        """
+        cancel = threading.Event()
+        items = self.iter_grep(pattern, path=path, glob=glob, regex=regex,
+                               ignore_case=ignore_case, max_size=max_size,
+                               context=context, limit=limit, cancel=cancel)
+        return self.record_sessions.start(items, cancel, timeout=timeout)
+
+    @utils.remotable
+    def find_start(self, partern, mode='glob', use_index=True, limit=None,
+                   timeout=None):
+        """Start a find session, the items are fetched with fetch_records()
+        Return the session id.
+        """
+        cancel = threading.Event()
+        items = self.iter_find(partern, mode=mode, use_index=use_index,
+                               limit=limit, cancel=cancel)
+        return self.record_sessions.start(items, cancel, timeout=timeout)
+
+    @utils.remotable
+    def fetch_records(self, session_id, size, timeout):
+        return self.record_sessions.fetch(session_id, size, timeout)
+
+    @utils.remotable
+    def stop_records(self, session_id):
+        self.record_sessions.stop(session_id)
+
+    @utils.remotable
+    def index_status(self):
+        status = self.filename_index.status()
+        status['watcher'] = self.index_watcher.stats()
+        return status
+
+    @utils.remotable
+    def rebuild_index(self):
+        """Rebuild the filename index in background"""
+        self.filename_index.rebuild_in_background()
+        return self.filename_index.status()
+
+    def close(self):
+        """Stop the sessions and the worker pools"""
+        self.record_sessions.close()
+        self.grep_engine.close()
+        self.thumbnail_cache.close()
+        if self._stat_executor:
+            self._stat_executor.shutdown(wait=False)
+            self._stat_executor = None
 
     @utils.remotable
     def get_search_history(self):
@@ -182,11 +541,12 @@ class BaseNodeManager(FSManager):
     RUN_RPC_SERVER_AS_DAEMON = False
 
     def __init__(self, root, node_type, rpc_server=None,
-                 ssh_user=None, ssh_password=None):
+                 ssh_user=None, ssh_password=None, data_transport=None):
         super(BaseNodeManager, self).__init__(root)
         self.node = objects.Node(
             type=node_type,
             transport=rpc_server and rpc_server.transport or None,
+            data_transport=data_transport,
             ssh_user=ssh_user, ssh_password=ssh_password)
         self.rpc_server = rpc_server
         LOG.info('inited %s', self.node.type)
@@ -195,6 +555,30 @@ class BaseNodeManager(FSManager):
     def heartbeat(self):
         pass
 
+    def sample_disk_usage(self):
+        """Sample disk usage of node, it is sent with heartbeat"""
+        try:
+            self.node.disk_usage = self.disk_usage().to_dict()
+        except Exception as e:
+            LOG.warning('sample disk usage failed: %s', e)
+
+    def start_index(self):
+        """Build the filename index in background
+
+        The index is updated by the watcher if inotify is supported,
+        otherwise it is rebuilt periodically.
+        """
+        if not CONF.lhfs.index_enabled:
+            return
+        if CONF.lhfs.index_watch and \
+           self.index_watcher.start(CONF.lhfs.index_rebuild_interval):
+            return
+        self.filename_index.start(CONF.lhfs.index_rebuild_interval)
+
+    def stop_index(self):
+        self.index_watcher.stop()
+        self.filename_index.stop()
+
     def start_rpc(self):
         if not self.rpc_server:
             return
@@ -218,22 +602,52 @@ class MasterManager(BaseNodeManager):
             **kwargs)
         self.nodes = {}
         self.heartbeats = {}
+        self._search_executor = None
         self.heartbeat()
 
     def node_update(self, node_dict):
         node = objects.Node.from_dict(node_dict)
         exited_node = self.nodes.get(node.hostname)
         if exited_node and node.ip != exited_node.ip:
-            raise exception.ConflictNode(node=node.get('hostname'),
+            raise exception.ConflictNode(node=node.hostname,
                                          exists=exited_node.ip)
 
         LOG.debug('update node: %s', node)
         node.heartbeat = time.time()
+        if node.disk_usage is not None:
+            node.disk_usage_at = node.heartbeat
+        elif exited_node:
+            node.disk_usage = exited_node.disk_usage
+            node.disk_usage_at = exited_node.disk_usage_at
         self.nodes[node.hostname] = node
 
+    def get_disk_usage(self, hostname):
+        """Get disk usage of node from memory
+
+        The disk usage is sent with heartbeat, it is refreshed with rpc if
+        it is older than disk_usage_max_age or invalidated.
+        """
+        node = self.nodes.get(hostname)
+        if not node:
+            raise exception.NodeNotExists(node=hostname)
+        if node.disk_usage is None or node.disk_usage_at is None or \
+           time.time() - node.disk_usage_at > CONF.disk_usage_max_age:
+            usage = self.disk_usage(host=hostname)
+            node.disk_usage = usage.to_dict()
+            node.disk_usage_at = time.time()
+            return usage
+        return objects.DiskUsageKB.from_dict(node.disk_usage)
+
+    def invalidate_disk_usage(self, hostname):
+        """Invalidate disk usage of node after files changed"""
+        node = self.nodes.get(hostname)
+        if node:
+            node.disk_usage_at = None
+
     @utils.timer(interval=CONF.heartbeat_interval)
     def heartbeat(self):
         LOG.debug('node %s heartbeat', self.node.hostname)
+        self.sample_disk_usage()
         self.node_update(self.node.to_dict())
 
     def list_nodes(self):
@@ -251,6 +665,77 @@ class MasterManager(BaseNodeManager):
     def get_node(self, hostname):
         return self.nodes.get(hostname)
 
+    def close(self):
+        super(MasterManager, self).close()
+        if self._search_executor:
+            self._search_executor.shutdown(wait=False)
+            self._search_executor = None
+
+    def _get_search_executor(self):
+        if not self._search_executor:
+            self._search_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=CONF.lhfs.search_fanout_workers,
+                thread_name_prefix='search')
+        return self._search_executor
+
+    def _find_on_node(self, hostname, partern, mode, use_index, limit,
+                      timeout):
+        started = time.time()
+        # the abandoned call frees its worker after the socket timeout
+        items = self.find(partern, mode=mode, use_index=use_index,
+                          limit=limit, timeout=timeout, host=hostname,
+                          rpc_timeout=timeout and
+                          timeout + constants.SEARCH_RPC_GRACE)
+        return items, time.time() - started
+
+    def find_all(self, partern, mode='glob', use_index=True, limit=None,
+                 timeout=None):
+        """Find files on all the active nodes concurrently
+
+        Each node searches for timeout seconds at most and returns the items
+        found, the nodes which do not reply in time are skipped, so the
+        result may be partial. Return (items, nodes), the items are tagged
+        with the node name and ranked by search_rank_key(), nodes is the
+        search status of each node.
+        """
+        if mode not in index.SEARCH_MODES:
+            raise exception.InvalidSearchMode(mode=mode,
+                                              modes=list(index.SEARCH_MODES))
+        executor = self._get_search_executor()
+        futures = {
+            executor.submit(self._find_on_node, node.hostname, partern, mode,
+                            use_index, limit, timeout): node.hostname
+            for node in list(self.nodes.values()) if self.is_node_active(node)
+        }
+        # wait a little longer than timeout for the replies
+        done, not_done = concurrent.futures.wait(
+            futures, timeout=timeout and timeout + constants.SEARCH_RPC_GRACE)
+
+        items, nodes = [], {}
+        for future in done:
+            hostname = futures[future]
+            try:
+                node_items, elapsed = future.result()
+            except Exception as e:
+                LOG.warning('search on node %s failed: %s', hostname, e)
+                nodes[hostname] = {'status': 'error', 'error': str(e)}
+                continue
+            nodes[hostname] = {
+                'status': 'ok', 'count': len(node_items),
+                'elapsed': round(elapsed, 3),
+                'truncated': bool(limit) and len(node_items) >= limit,
+                'timed_out': bool(timeout) and elapsed >= timeout}
+            for item in node_items:
+                item['node'] = hostname
+            items.extend(node_items)
+        for future in not_done:
+            future.cancel()
+            LOG.warning('search on node %s timed out', futures[future])
+            nodes[futures[future]] = {'status': 'timeout'}
+
+        items.sort(key=search_rank_key(partern, mode))
+        return items[:limit] if limit else items, nodes
+
     def is_node_active(self, node):
         if node.heartbeat is None:
             return False
@@ -270,4 +755,5 @@ class SlaveManager(BaseNodeManager):
     @utils.timer(interval=CONF.heartbeat_interval)
     def heartbeat(self):
         LOG.debug('node %s heartbeat', self.node.hostname)
+        self.sample_disk_usage()
         self.master.node_update(self.node.to_dict())
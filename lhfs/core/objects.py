@@ -1,20 +1,159 @@
+import base64
 import dataclasses
+import functools
+import heapq
+import json
 import logging
+import operator
 import os
 import stat
 import socket
+import sys
 import mimetypes
 
 from easy2use import fs
 from easy2use import date
 
+from lhfs.common import conf
 from lhfs.common import exception
 from lhfs.common import utils
 
 LOG = logging.getLogger(__name__)
 
 
+EDITABLE_TYPES = ['text/plain', 'application/x-sh']
+# the fields of entry generated by LogicPath.scan()
+ENTRY_NAME, ENTRY_SIZE, ENTRY_FOLDER, ENTRY_MTIME, ENTRY_EDITABLE = range(5)
+SORT_FIELDS = {
+    'name': lambda entry: entry[ENTRY_NAME],
+    'size': lambda entry: entry[ENTRY_SIZE],
+    'mtime': lambda entry: entry[ENTRY_MTIME],
+    'type': lambda entry: os.path.splitext(entry[ENTRY_NAME])[1][1:].lower(),
+}
+
+
+@functools.lru_cache(maxsize=1024)
+def is_editable_suffix(suffix):
+    mime_type, _ = mimetypes.guess_type(f'file{suffix.lower()}')
+    return mime_type in EDITABLE_TYPES
+
+
+@functools.total_ordering
+class Descending(object):
+    """Wrap a value to compare in descending order"""
+    __slots__ = ('value', )
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise exception.InvalidCursor(cursor=cursor)
+    if not isinstance(values, list) or len(values) != 3:
+        raise exception.InvalidCursor(cursor=cursor)
+    return values
+
+
+def page_entries(entries, sort='name', reverse=False, limit=None,
+                 cursor=None):
+    """Get one page of entries generated by LogicPath.scan()
+
+    The entries are sorted by sort field and the folders are always listed
+    before files. The cursor is the position after the last item of
+    previous page, only the entries of requested page are kept in memory and
+    converted to DirItem.
+    Return (items, next_cursor, total).
+    """
+    if sort not in SORT_FIELDS:
+        raise exception.InvalidSortField(sort=sort, fields=list(SORT_FIELDS))
+    field = SORT_FIELDS[sort]
+    wrap = Descending if reverse else (lambda value: value)
+
+    def sort_key(entry):
+        return (not entry[ENTRY_FOLDER], wrap(field(entry)),
+                wrap(entry[ENTRY_NAME]))
+
+    def cursor_values(entry):
+        return [not entry[ENTRY_FOLDER], field(entry), entry[ENTRY_NAME]]
+
+    total, after = 0, None
+    if cursor:
+        files_first, value, name = decode_cursor(cursor)
+        after = (files_first, wrap(value), wrap(name))
+
+    def candidates():
+        nonlocal total
+        for entry in entries:
+            total += 1
+            if after is None or sort_key(entry) > after:
+                yield entry
+
+    if limit is None:
+        page = sorted(candidates(), key=sort_key)
+        matched = len(page)
+    else:
+        # one more entry is fetched to know whether there are more
+        page = heapq.nsmallest(limit + 1, candidates(), key=sort_key)
+        matched = len(page)
+        page = page[:limit]
+    next_cursor = encode_cursor(cursor_values(page[-1])) \
+        if page and matched > len(page) else None
+    return [DirItem(*entry) for entry in page], next_cursor, total
+
+
+def file_type(name):
+    """Same as os.path.splitext(name)[1][1:], but faster"""
+    index = name.rfind('.')
+    # the leading dots are not the separator of suffix
+    if index <= 0 or not name[:index].strip('.'):
+        return ''
+    return name[index + 1:]
+
+
+def compile_serializer(cls):
+    """Set to_dict() of dataclass
+
+    The fields and the formatters _human_<field> are resolved once for the
+    class, so that no reflection is needed to serialize each object.
+    """
+    fields = tuple(field.name for field in dataclasses.fields(cls))
+    get_values = operator.attrgetter(*fields)
+    formatters = tuple((index, getattr(cls, f'_human_{name}'))
+                       for index, name in enumerate(fields)
+                       if hasattr(cls, f'_human_{name}'))
+
+    def to_dict(self, human=False):
+        values = get_values(self)
+        if human:
+            values = list(values)
+            for index, formatter in formatters:
+                values[index] = formatter(self)
+        return dict(zip(fields, values))
+
+    cls.FIELDS = fields
+    cls.to_dict = to_dict
+    return cls
+
+
+# use __slots__ layouts for the objects which are created in large numbers
+DATACLASS_OPTIONS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+
 class BaseDataClass:
+    __slots__ = ()
 
     @classmethod
     def from_dict(cls, dict_obj):
@@ -30,8 +169,9 @@ class BaseDataClass:
         return dict_obj
 
 
-@dataclasses.dataclass
-class DirItem:
+@compile_serializer
+@dataclasses.dataclass(**DATACLASS_OPTIONS)
+class DirItem(BaseDataClass):
     name: str = None
     size: int = None
     folder: bool = False
@@ -39,9 +179,18 @@ class DirItem:
     editable: bool = False
     type: str = None
     pardir: str = None
+    etag: str = None
 
     def __post_init__(self):
-        self.type = os.path.splitext(self.name)[1][1:]
+        if self.type is None:
+            self.type = file_type(self.name)
+
+    @classmethod
+    def from_dict(cls, dict_obj):
+        # the large sizes are sent as float with xmlrpc
+        if isinstance(dict_obj.get('size'), float):
+            dict_obj = dict(dict_obj, size=int(dict_obj['size']))
+        return cls(**dict_obj)
 
     def _human_size(self):
         return utils.human_size(self.size)
@@ -49,24 +198,25 @@ class DirItem:
     def _human_mtime(self):
         if not self.mtime:
             return self.mtime
-        from easy2use import date
         return date.parse_timestamp2str(self.mtime, '%Y/%m/%d %H:%M')
 
-    def to_dict(self, human=False):
-        dict_obj = dataclasses.asdict(self)
-        if human:
-            for k in dict_obj:
-                if not hasattr(self, f'_human_{k}'):
-                    continue
-                dict_obj[k] = getattr(self, f'_human_{k}')()
-        return dict_obj
 
-    @classmethod
-    def from_dict(cls, dict_obj):
-        return cls(**dict_obj)
+# the columns of listing in columnar format
+DIR_ITEM_COLUMNS = ('name', 'size', 'folder', 'mtime', 'editable', 'type')
+
+
+def to_columns(items):
+    """Convert DirItems to parallel arrays
+    E.g. {'name': ['a', 'b'], 'size': [1, 2], 'folder': [False, False], ...}
+    """
+    get_values = operator.attrgetter(*DIR_ITEM_COLUMNS)
+    columns = list(zip(*map(get_values, items))) or \
+        [()] * len(DIR_ITEM_COLUMNS)
+    return dict(zip(DIR_ITEM_COLUMNS, map(list, columns)))
 
 
-@dataclasses.dataclass
+@compile_serializer
+@dataclasses.dataclass(**DATACLASS_OPTIONS)
 class DiskUsageKB(BaseDataClass):
     total: int = 0
     used: int = 0
@@ -86,16 +236,21 @@ class DiskUsageKB(BaseDataClass):
         return f'{self.percent} %'
 
 
-@dataclasses.dataclass
+@compile_serializer
+@dataclasses.dataclass(**DATACLASS_OPTIONS)
 class Node(BaseDataClass):
     type: str = None
-    hostname: str = socket.gethostname()
-    ip: str = socket.gethostbyname(socket.gethostname())
+    # resolved when the node is created, not when this module is imported
+    hostname: str = dataclasses.field(default_factory=socket.gethostname)
+    ip: str = dataclasses.field(default_factory=conf.get_my_ip)
     transport: str = None
+    data_transport: str = None
     ssh_user: str = None
     ssh_password: str = None
     heartbeat: str = None
     status: str = None
+    disk_usage: dict = None
+    disk_usage_at: float = None
 
 
 class LogicPath(object):
@@ -144,9 +299,17 @@ class LogicPath(object):
         pathstat = self.stat()
         return human and utils.human_size(pathstat.st_size) or pathstat.st_size
 
+    def etag(self):
+        pathstat = self.stat()
+        return f'{pathstat.st_ino:x}-{pathstat.st_size:x}-' \
+               f'{pathstat.st_mtime_ns:x}'
+
     def dict_info(self):
-        return DirItem(os.path.basename(self.logic), self.size(),
-                       self.is_dir(), self.stat().st_atime)
+        pathstat = self.stat()
+        return DirItem(os.path.basename(self.logic), pathstat.st_size,
+                       stat.S_ISDIR(pathstat.st_mode), pathstat.st_mtime,
+                       stat.S_ISREG(pathstat.st_mode) and
+                       is_editable_suffix(os.path.splitext(self.logic)[1]))
 
     def modify_time(self):
         pathstat = self.stat()
@@ -189,35 +352,52 @@ class LogicPath(object):
         return 'file'
 
     def editable(self):
-        abs_path = self.abs_path()
-        if os.path.isfile(abs_path):
-            t, _ = mimetypes.guess_type(abs_path)
-            if t in ['text/plain', 'application/x-sh']:
-                return True
-        return False
+        return os.path.isfile(self.abs_path()) and \
+            is_editable_suffix(os.path.splitext(self.logic)[1])
 
     def name(self):
         return os.path.basename(self.logic)
 
+    def scan(self, show_all=False):
+        """Generate (name, size, folder, mtime, editable) of the children
+        The stat result of os.DirEntry is reused, so only one stat call is
+        needed for each child.
+        """
+        LOG.debug('scan: %s', self.abs_path())
+        with os.scandir(self.abs_path()) as entries:
+            for entry in entries:
+                if not show_all and entry.name.startswith('.'):
+                    continue
+                try:
+                    entry_stat = entry.stat()
+                except OSError:
+                    # broken symlink
+                    entry_stat = entry.stat(follow_symlinks=False)
+                yield (entry.name, entry_stat.st_size,
+                       stat.S_ISDIR(entry_stat.st_mode), entry_stat.st_mtime,
+                       stat.S_ISREG(entry_stat.st_mode) and
+                       is_editable_suffix(os.path.splitext(entry.name)[1]))
+
     def ls(self, show_all=False):
+        """Generate DirItem of the children"""
         if not self.is_dir():
-            return [self.dict_info()]
-        dirs = []
-        LOG.debug('ls: %s', self.abs_path())
-        for child in os.listdir(self.abs_path()):
-            child_path = f'{self.logic}/{child}'
-            child_lp = LogicPath(self.root, child_path)
-            if not show_all and child.startswith('.'):
-                continue
-            path_dict = child_lp.dict_info()
-            path_dict.editable = child_lp.editable()
-            dirs.append(path_dict)
-        return dirs
-
-    def save(self, fo):
-        LOG.debug('fo %s', fo)
-        LOG.debug('save file %s', self.abs_path())
-        fo.save(self.abs_path())
+            yield self.dict_info()
+            return
+        for entry in self.scan(show_all=show_all):
+            yield DirItem(*entry)
+
+    def ls_page(self, show_all=False, sort='name', reverse=False, limit=None,
+                cursor=None):
+        """List one page of the children, see page_entries()
+        """
+        if not self.is_dir():
+            return [self.dict_info()], None, 1
+        return page_entries(self.scan(show_all=show_all), sort=sort,
+                            reverse=reverse, limit=limit, cursor=cursor)
+
+    def save(self, temp_path):
+        LOG.debug('save file %s to %s', temp_path, self.abs_path())
+        os.replace(temp_path, self.abs_path())
 
     def ensure_parent_dir(self):
         parent_path = os.path.dirname(self.abs_path())
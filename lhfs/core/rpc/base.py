@@ -1,11 +1,29 @@
 import abc
 import logging
 
-import gevent
-
 from lhfs.core import objects
 
 LOG = logging.getLogger(__name__)
+# the max int of xmlrpc
+MAXINT = 2 ** 31 - 1
+
+
+def to_primitive(value):
+    """Convert the data objects in value to dict, so that they can be
+    marshalled, the data objects have __slots__ and no __dict__.
+    The ints which are too large for xmlrpc, e.g. file size, are converted
+    to float.
+    """
+    if isinstance(value, objects.BaseDataClass):
+        return to_primitive(value.to_dict())
+    if isinstance(value, int) and not isinstance(value, bool) and \
+       not -MAXINT - 1 <= value <= MAXINT:
+        return float(value)
+    if isinstance(value, (list, tuple)):
+        return [to_primitive(item) for item in value]
+    if isinstance(value, dict):
+        return {key: to_primitive(item) for key, item in value.items()}
+    return value
 
 
 class BaseRpcServer(object):
@@ -24,6 +42,8 @@ class BaseRpcServer(object):
     def start(self, daemon=False):
         LOG.info('starting xmlrpc server with daemon: %s', daemon)
         if daemon:
+            import gevent
+
             gevent.spawn(self._start)
         else:
             self._start()
@@ -48,8 +68,10 @@ class BaseRpcServer(object):
 
 class BaseRpcClient(object):
 
-    def __init__(self, transport):
+    def __init__(self, transport, timeout=None):
         self.transport = transport
+        # the seconds to wait for the reply, None means the default
+        self.timeout = timeout
         self.client = self.init_client()
 
     @abc.abstractmethod
@@ -72,6 +94,19 @@ class BaseRpcClient(object):
         items = self.client.ls(path, show_all)
         return [objects.DirItem.from_dict(item) for item in items]
 
+    def ls_page(self, path, show_all=False, sort='name', reverse=False,
+                limit=None, cursor=None, columnar=False):
+        page = self.client.ls_page(path, show_all, sort, reverse, limit,
+                                   cursor, columnar)
+        if 'children' in page:
+            page['children'] = [objects.DirItem.from_dict(item)
+                                for item in page['children']]
+        if 'columns' in page:
+            page['columns']['size'] = [
+                size if size is None else int(size)
+                for size in page['columns']['size']]
+        return page
+
     def mkdir(self, path):
         return self.client.mkdir(path)
 
@@ -87,8 +122,34 @@ class BaseRpcClient(object):
     def node_update(self, node):
         return self.client.node_update(node)
 
-    def find(self, partern):
-        return self.client.find(partern)
+    def find(self, partern, mode='glob', use_index=True, limit=None,
+             timeout=None):
+        items = self.client.find(partern, mode, use_index, limit, timeout)
+        return [objects.DirItem.from_dict(item).to_dict() for item in items]
+
+    def grep_start(self, pattern, path='/', glob=None, regex=False,
+                   ignore_case=False, max_size=None, context=0, limit=None,
+                   timeout=None):
+        return self.client.grep_start(pattern, path, glob, regex,
+                                      ignore_case, max_size, context, limit,
+                                      timeout)
+
+    def find_start(self, partern, mode='glob', use_index=True, limit=None,
+                   timeout=None):
+        return self.client.find_start(partern, mode, use_index, limit,
+                                      timeout)
+
+    def fetch_records(self, session_id, size, timeout):
+        return self.client.fetch_records(session_id, size, timeout)
+
+    def stop_records(self, session_id):
+        return self.client.stop_records(session_id)
+
+    def index_status(self):
+        return self.client.index_status()
+
+    def rebuild_index(self):
+        return self.client.rebuild_index()
 
     def get_search_history(self):
         return self.client.get_search_history()
@@ -96,8 +157,28 @@ class BaseRpcClient(object):
     def get_abs_path(self, path):
         return self.client.get_abs_path(path)
 
+    def get_path_dict(self, path, etag=False):
+        return objects.DirItem.from_dict(self.client.get_path_dict(path,
+                                                                   etag))
+
     def file_size(self, path):
-        return self.client.file_size(path)
+        return int(self.client.file_size(path))
+
+    def stat_many(self, paths, etag=False):
+        return [item and objects.DirItem.from_dict(item)
+                for item in self.client.stat_many(paths, etag)]
+
+    def thumbnail(self, path, size):
+        # bytes is returned as xmlrpc.client.Binary
+        data = self.client.thumbnail(path, size)
+        return getattr(data, 'data', data)
+
+    def du(self, path):
+        result = self.client.du(path)
+        for item in [result] + result['children']:
+            for key in ['size', 'allocated']:
+                item[key] = int(item[key])
+        return result
 
     def ensure_parent_dir(self, path):
         return self.client.ensure_parent_dir(path)
@@ -1,3 +1,4 @@
+import functools
 import inspect
 import logging
 
@@ -19,20 +20,53 @@ class XMLRpcServer(base.BaseRpcServer):
                                              predicate=inspect.ismethod):
             if name.startswith('_'):
                 continue
-            self._server.register_function(func)
+            self._server.register_function(self._marshallable(func))
+
+    @staticmethod
+    def _marshallable(func):
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return base.to_primitive(func(*args, **kwargs))
+
+        return wrapper
 
     @property
     def transport(self):
         return f'http://{self.host}:{self.port}'
 
     def _start(self):
-        self._server.serve_forever()
+        self._serving = True
+        try:
+            self._server.serve_forever()
+        finally:
+            self._serving = False
 
     def _stop(self):
-        self._server.shutdown()
+        # shutdown() waits forever if it is not serving
+        if getattr(self, '_serving', False):
+            self._server.shutdown()
+        self._server.server_close()
+
+
+class TimeoutTransport(client.Transport):
+    """The transport whose connections have socket timeout"""
+
+    def __init__(self, timeout, **kwargs):
+        super(TimeoutTransport, self).__init__(**kwargs)
+        self.timeout = timeout
+
+    def make_connection(self, host):
+        connection = super(TimeoutTransport, self).make_connection(host)
+        connection.timeout = self.timeout
+        return connection
 
 
 class XMLRpcClient(base.BaseRpcClient):
 
     def init_client(self):
+        if self.timeout:
+            return client.ServerProxy(
+                self.transport, allow_none=True,
+                transport=TimeoutTransport(self.timeout))
         return client.ServerProxy(self.transport, allow_none=True)
@@ -25,4 +25,6 @@ class ZeroRpcServer(base.BaseRpcServer):
 class ZeroRpcClient(base.BaseRpcClient):
 
     def init_client(self):
+        if self.timeout:
+            return zerorpc.Client(self.transport, timeout=self.timeout)
         return zerorpc.Client(self.transport)
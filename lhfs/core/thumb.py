@@ -0,0 +1,228 @@
+import collections
+import concurrent.futures
+import hashlib
+import logging
+import mimetypes
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+
+from lhfs.common import conf
+from lhfs.common import exception
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+CONF = conf.CONF
+LOG = logging.getLogger(__name__)
+
+THUMB_SUFFIX = '.jpg'
+THUMB_CONTENT_TYPE = 'image/jpeg'
+JPEG_QUALITY = 85
+
+
+def make_image_thumbnail(src_path, size, dest_path):
+    with Image.open(src_path) as image:
+        image.draft('RGB', (size, size))
+        image.thumbnail((size, size))
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.save(dest_path, 'JPEG', quality=JPEG_QUALITY)
+
+
+def make_video_thumbnail(src_path, size, dest_path):
+    subprocess.run(
+        ['ffmpeg', '-v', 'error', '-y', '-ss', '1', '-i', src_path,
+         '-frames:v', '1',
+         '-vf', f'scale={size}:{size}:force_original_aspect_ratio=decrease',
+         '-f', 'image2', dest_path],
+        check=True, stdin=subprocess.DEVNULL, timeout=60)
+    if not os.path.exists(dest_path):
+        # the video is shorter than the seek position
+        subprocess.run(
+            ['ffmpeg', '-v', 'error', '-y', '-i', src_path,
+             '-frames:v', '1',
+             '-vf',
+             f'scale={size}:{size}:force_original_aspect_ratio=decrease',
+             '-f', 'image2', dest_path],
+            check=True, stdin=subprocess.DEVNULL, timeout=60)
+
+
+def check_size(size):
+    sizes = [int(s) for s in CONF.api.thumb_sizes.split(',')]
+    if size not in sizes:
+        raise exception.InvalidThumbnailSize(size=size, sizes=sizes)
+
+
+def get_thumbnail_maker(path):
+    """Get the function to make thumbnail of path, None if not supported
+    """
+    mime_type = mimetypes.guess_type(path)[0] or ''
+    if mime_type.startswith('image/') and Image:
+        return make_image_thumbnail
+    if mime_type.startswith('video/') and shutil.which('ffmpeg'):
+        return make_video_thumbnail
+    return None
+
+
+def make_thumbnail(src_path, size, dest_path):
+    """Make thumbnail in the worker process"""
+    get_thumbnail_maker(src_path)(src_path, size, dest_path)
+
+
+class ThumbnailCache(object):
+    """Content-addressed cache of thumbnails
+
+    The thumbnails are made in a process pool and saved in cache dir, the
+    name of the file is the hash of (inode, mtime, size, dimensions) of the
+    source file, so a modified file gets a new thumbnail. The least recently
+    used thumbnails are removed when the total bytes exceed max_bytes.
+    """
+
+    def __init__(self, cache_dir, max_bytes=None, workers=None):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes or CONF.api.thumb_cache_bytes
+        self.workers = workers or CONF.api.thumb_workers
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._thumbs = None
+        self._pending = {}
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """Load the cached thumbnails, ordered by last access time"""
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        thumbs = []
+        for dir_path, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if not name.endswith(THUMB_SUFFIX):
+                    continue
+                thumb_stat = os.stat(os.path.join(dir_path, name))
+                thumbs.append((thumb_stat.st_mtime, name[:-len(THUMB_SUFFIX)],
+                               thumb_stat.st_size))
+        self._thumbs = collections.OrderedDict(
+            (key, size) for _, key, size in sorted(thumbs))
+        self.bytes = sum(self._thumbs.values())
+        LOG.info('loaded %s thumbnails, %s bytes', len(self._thumbs),
+                 self.bytes)
+
+    def _thumb_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + THUMB_SUFFIX)
+
+    @staticmethod
+    def make_key(src_stat, size):
+        return hashlib.sha1(
+            f'{src_stat.st_ino}-{src_stat.st_mtime_ns}-{src_stat.st_size}-'
+            f'{size}'.encode()).hexdigest()
+
+    def _get_executor(self):
+        if not self._executor:
+            # the server has threads, so the workers are not forked
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def _read(self, key):
+        thumb_path = self._thumb_path(key)
+        try:
+            with open(thumb_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        # the mtime of thumbnail is its last access time
+        os.utime(thumb_path)
+        return data
+
+    def _add(self, key, size):
+        with self._lock:
+            self._thumbs[key] = size
+            self.bytes += size
+            while self.bytes > self.max_bytes and len(self._thumbs) > 1:
+                evicted, evicted_size = self._thumbs.popitem(last=False)
+                self.bytes -= evicted_size
+                try:
+                    os.remove(self._thumb_path(evicted))
+                except FileNotFoundError:
+                    pass
+                LOG.debug('evicted thumbnail %s', evicted)
+
+    def _make(self, key, src_path, size):
+        thumb_path = self._thumb_path(key)
+        os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(suffix=THUMB_SUFFIX,
+                                         dir=os.path.dirname(thumb_path))
+        os.close(fd)
+        try:
+            self._get_executor().submit(
+                make_thumbnail, src_path, size, temp_path).result()
+            os.replace(temp_path, thumb_path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self._add(key, os.path.getsize(thumb_path))
+
+    def get(self, src_path, size):
+        """Get the thumbnail of src_path, it is made if not cached
+        """
+        if not get_thumbnail_maker(src_path):
+            raise exception.ThumbnailNotSupported(
+                path=os.path.basename(src_path))
+        key = self.make_key(os.stat(src_path), size)
+        event = None
+        with self._lock:
+            if self._thumbs is None:
+                self._load()
+            if key in self._thumbs:
+                self._thumbs.move_to_end(key)
+                self.hits += 1
+                cached = True
+            else:
+                self.misses += 1
+                cached = False
+                # the same thumbnail is made only once
+                event = self._pending.get(key)
+                if event is None:
+                    self._pending[key] = threading.Event()
+        if cached:
+            data = self._read(key)
+            if data is not None:
+                return data
+            with self._lock:
+                self.bytes -= self._thumbs.pop(key, 0)
+            return self.get(src_path, size)
+        if event is not None:
+            event.wait()
+            data = self._read(key)
+            if data is not None:
+                return data
+            raise exception.ThumbnailFailed(path=os.path.basename(src_path))
+        try:
+            self._make(key, src_path, size)
+        except Exception as e:
+            LOG.error('make thumbnail of %s failed: %s', src_path, e)
+            raise exception.ThumbnailFailed(path=os.path.basename(src_path))
+        finally:
+            with self._lock:
+                self._pending.pop(key).set()
+        return self._read(key)
+
+    def stats(self):
+        with self._lock:
+            return {'thumbnails': len(self._thumbs or {}),
+                    'bytes': self.bytes, 'hits': self.hits,
+                    'misses': self.misses}
+
+    def close(self):
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,146 @@
+import dataclasses
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from lhfs.common import conf
+from lhfs.common import constants
+from lhfs.common import exception
+from lhfs.common import utils
+from lhfs.core import objects
+
+CONF = conf.CONF
+LOG = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class UploadSession(objects.BaseDataClass):
+    id: str = None
+    node: str = None
+    path: str = None
+    filename: str = None
+    size: int = 0
+    data_path: str = None
+    ranges: list = dataclasses.field(default_factory=list)
+    created_at: float = None
+    updated_at: float = None
+
+    def received(self):
+        return sum(end - start for start, end in self.ranges)
+
+    def is_completed(self):
+        return self.ranges == [[0, self.size]] or self.size == 0
+
+    def add_range(self, start, end):
+        ranges = sorted(self.ranges + [[start, end]])
+        merged = [ranges[0]]
+        for start, end in ranges[1:]:
+            if start <= merged[-1][1]:
+                merged[-1][1] = max(end, merged[-1][1])
+            else:
+                merged.append([start, end])
+        self.ranges = merged
+
+
+class UploadManager(object):
+    """Manage the sessions of resumable uploading
+
+    The sessions are saved as json files in the session dir, so that they
+    are still available after restart. The data of session is written to
+    data_path, for local node it is a temp file in the target directory.
+    """
+
+    def __init__(self, session_dir):
+        self.session_dir = os.path.abspath(session_dir)
+        self.sessions = {}
+        self._lock = threading.Lock()
+        if not os.path.exists(self.session_dir):
+            os.makedirs(self.session_dir)
+        self.load_sessions()
+
+    def _session_file(self, session_id):
+        return os.path.join(self.session_dir, f'{session_id}.json')
+
+    def load_sessions(self):
+        for name in os.listdir(self.session_dir):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.session_dir, name)) as f:
+                    session = UploadSession.from_dict(json.load(f))
+            except (OSError, ValueError, TypeError) as e:
+                LOG.warning('load upload session %s failed: %s', name, e)
+                continue
+            self.sessions[session.id] = session
+        LOG.info('loaded %s upload sessions', len(self.sessions))
+
+    def save_session(self, session):
+        session.updated_at = time.time()
+        session_file = self._session_file(session.id)
+        temp_file = f'{session_file}.tmp'
+        with open(temp_file, 'w') as f:
+            json.dump(session.to_dict(), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, session_file)
+
+    def create(self, node, path, filename, size, data_dir):
+        session_id = uuid.uuid4().hex
+        session = UploadSession(
+            id=session_id, node=node, path=path, filename=filename,
+            size=size, created_at=time.time(),
+            data_path=os.path.join(
+                data_dir, f'{constants.UPLOAD_TEMP_PREFIX}{session_id}'))
+        with open(session.data_path, 'wb') as f:
+            f.truncate(size)
+        with self._lock:
+            self.save_session(session)
+            self.sessions[session_id] = session
+        LOG.info('created upload session %s for %s/%s', session_id, path,
+                 filename)
+        return session
+
+    def get(self, session_id):
+        session = self.sessions.get(session_id)
+        if not session:
+            raise exception.UploadSessionNotExists(session=session_id)
+        return session
+
+    def write(self, session_id, offset, data):
+        session = self.get(session_id)
+        if offset < 0 or offset + len(data) > session.size:
+            raise exception.InvalidUploadRange(
+                session=session_id, start=offset, end=offset + len(data))
+        fd = os.open(session.data_path, os.O_WRONLY)
+        try:
+            os.pwrite(fd, data, offset)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        if not data:
+            return session
+        with self._lock:
+            session.add_range(offset, offset + len(data))
+            self.save_session(session)
+        return session
+
+    def remove(self, session_id):
+        with self._lock:
+            session = self.sessions.pop(session_id, None)
+            if not session:
+                return
+            for path in [self._session_file(session_id), session.data_path]:
+                if os.path.exists(path):
+                    os.remove(path)
+        LOG.info('removed upload session %s', session_id)
+
+    @utils.timer(interval=CONF.api.upload_cleanup_interval)
+    def cleanup_expired(self):
+        deadline = time.time() - CONF.api.upload_session_ttl
+        for session in list(self.sessions.values()):
+            if session.updated_at < deadline:
+                LOG.info('upload session %s expired', session.id)
+                self.remove(session.id)
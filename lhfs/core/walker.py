@@ -0,0 +1,261 @@
+import collections
+import logging
+import os
+import queue
+import threading
+
+from lhfs.common import conf
+
+CONF = conf.CONF
+LOG = logging.getLogger(__name__)
+
+# the max number of scanned directories waiting to be consumed
+RESULTS_SIZE = 1024
+# idle workers check the queues again after this timeout
+IDLE_TIMEOUT = 0.05
+
+_DONE = object()
+_SKIPPED = object()
+
+
+def scan_entries(dir_path):
+    """Scan directory, the result is the list of os.DirEntry
+
+    The sub directories are not followed if they are symlinks, like
+    os.walk().
+    """
+    with os.scandir(dir_path) as entries:
+        entries = list(entries)
+    return entries, [entry.path for entry in entries
+                     if entry.is_dir(follow_symlinks=False)]
+
+
+def entry_stat(entry):
+    try:
+        return entry.stat()
+    except OSError:
+        # broken symlink
+        return entry.stat(follow_symlinks=False)
+
+
+def match_scan(match):
+    """Make scan function, the result is the list of (entry, stat) whose
+    name is matched, they are stat in the walker threads.
+    """
+
+    def scan(dir_path):
+        entries, sub_dirs = scan_entries(dir_path)
+        matched = []
+        for entry in entries:
+            if not match(entry.name):
+                continue
+            try:
+                matched.append((entry, entry_stat(entry)))
+            except OSError as e:
+                LOG.debug('stat %s failed: %s', entry.path, e)
+        return matched, sub_dirs
+
+    return scan
+
+
+class _Walk(object):
+    """The state of one walk, each worker has its own queue of directories
+
+    A worker pops the last directory of its own queue, so that it walks
+    depth first and the directories it scanned are hot in cache, if its
+    queue is empty, it steals the first directory of the others, which is
+    the nearest to the top, so that it gets a big subtree.
+    """
+
+    def __init__(self, root, scan, workers, max_depth, ordered, cancel):
+        self.root = root
+        self.scan = scan
+        self.max_depth = max_depth
+        self.ordered = ordered
+        self.cancel = cancel or threading.Event()
+        self.queues = [collections.deque() for _ in range(workers)]
+        self.queues[0].append((root, 0))
+        self.outstanding = 1
+        self.idle = 0
+        self.error = None
+        self._stopped = False
+        self._finished = False
+        self.results = queue.Queue(maxsize=RESULTS_SIZE)
+        self.scanned = {}
+        self.lock = threading.Lock()
+        self.work_cond = threading.Condition(self.lock)
+        self.result_cond = threading.Condition()
+
+    @property
+    def stopped(self):
+        return self._stopped or self.cancel.is_set()
+
+    def _take(self, index):
+        try:
+            return self.queues[index].pop()
+        except IndexError:
+            pass
+        for offset in range(1, len(self.queues)):
+            try:
+                return self.queues[(index + offset) % len(self.queues)] \
+                    .popleft()
+            except IndexError:
+                continue
+        return None
+
+    def _scan(self, dir_path, depth):
+        try:
+            scanned = self.scan(dir_path)
+        except OSError as e:
+            LOG.debug('scan %s failed: %s', dir_path, e)
+            scanned = None
+        if scanned is None:
+            return _SKIPPED, []
+        result, sub_dirs = scanned
+        if self.max_depth is not None and depth >= self.max_depth:
+            sub_dirs = []
+        return result, list(sub_dirs)
+
+    def _put(self, item):
+        while not self.stopped:
+            try:
+                self.results.put(item, timeout=IDLE_TIMEOUT)
+                return
+            except queue.Full:
+                continue
+
+    def _emit(self, dir_path, depth, result, sub_dirs):
+        if self.ordered:
+            with self.result_cond:
+                self.scanned[dir_path] = (depth, result, sub_dirs)
+                self.result_cond.notify()
+        elif result is not _SKIPPED:
+            self._put((dir_path, depth, result))
+
+    def _finish(self, error=None):
+        with self.lock:
+            if self._finished:
+                return
+            self._finished = True
+            self.error = error
+            self._stopped = self._stopped or error is not None
+            self.work_cond.notify_all()
+        with self.result_cond:
+            self.result_cond.notify_all()
+        if not self.ordered and error is None:
+            self._put(_DONE)
+
+    def work(self, index):
+        own = self.queues[index]
+        while not self.stopped:
+            item = self._take(index)
+            if item is None:
+                with self.work_cond:
+                    if self.outstanding == 0 or self.stopped:
+                        return
+                    self.idle += 1
+                    self.work_cond.wait(IDLE_TIMEOUT)
+                    self.idle -= 1
+                continue
+            dir_path, depth = item
+            try:
+                result, sub_dirs = self._scan(dir_path, depth)
+            except Exception as e:
+                self._finish(error=e)
+                return
+            # count the sub directories before they can be stolen, so that
+            # outstanding is not 0 until all of them are done
+            with self.work_cond:
+                self.outstanding += len(sub_dirs)
+            # the first sub directory is popped first
+            own.extend((sub_dir, depth + 1) for sub_dir in reversed(sub_dirs))
+            self._emit(dir_path, depth, result, sub_dirs)
+            with self.work_cond:
+                self.outstanding -= 1
+                finished = self.outstanding == 0
+                if sub_dirs and self.idle:
+                    self.work_cond.notify(len(sub_dirs))
+            if finished:
+                self._finish()
+
+    def _iter_unordered(self):
+        while not self.stopped:
+            try:
+                item = self.results.get(timeout=IDLE_TIMEOUT)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                break
+            yield item
+
+    def _wait_scanned(self, dir_path):
+        with self.result_cond:
+            while dir_path not in self.scanned and not self.stopped:
+                self.result_cond.wait(IDLE_TIMEOUT)
+            if self.stopped:
+                return None
+            return self.scanned.pop(dir_path)
+
+    def _iter_ordered(self):
+        """Generate the results in pre-order, the results scanned before
+        their turn are kept in memory.
+        """
+        stack = [iter([self.root])]
+        while stack:
+            dir_path = next(stack[-1], None)
+            if dir_path is None:
+                stack.pop()
+                continue
+            scanned = self._wait_scanned(dir_path)
+            if scanned is None:
+                break
+            depth, result, sub_dirs = scanned
+            if result is not _SKIPPED:
+                yield dir_path, depth, result
+            stack.append(iter(sub_dirs))
+
+    def iter_results(self):
+        yield from self._iter_ordered() if self.ordered else \
+            self._iter_unordered()
+        if self.error:
+            raise self.error
+
+    def stop(self):
+        with self.lock:
+            self._stopped = True
+            self.work_cond.notify_all()
+
+
+class TreeWalker(object):
+    """Walk directory trees with a work-stealing pool of threads
+
+    scan(dir_path) is called in the worker threads for each directory, it
+    returns (result, sub_dirs) or None to skip the directory, the result is
+    generated by walk() and the sub directories are scanned next, the
+    default scan is scan_entries(). The directories that can not be scanned
+    because of OSError are skipped.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or CONF.lhfs.walk_workers
+
+    def walk(self, root, scan=scan_entries, max_depth=None, ordered=False,
+             cancel=None):
+        """Generate (dir_path, depth, result) of root and its sub directories
+
+        The depth of root is 0, the sub directories deeper than max_depth
+        are not scanned. If ordered is True, the results are generated in
+        the order of a depth first walk, like os.walk(), otherwise they are
+        generated once they are scanned. The walk stops when the
+        threading.Event cancel is set.
+        """
+        state = _Walk(root, scan, self.workers, max_depth, ordered, cancel)
+        threads = [threading.Thread(target=state.work, args=(index,),
+                                    daemon=True, name=f'walker-{index}')
+                   for index in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            yield from state.iter_results()
+        finally:
+            state.stop()
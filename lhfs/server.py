@@ -1,4 +1,6 @@
+import asyncio
 import os
+import threading
 
 from tornado import ioloop
 from tornado import httpserver
@@ -12,7 +14,9 @@ import logging
 # from easy2use.server import httpserver
 
 from lhfs import views
+from lhfs.common import compress
 from lhfs.common import conf
+from lhfs.common import sshpool
 from lhfs.core import manager
 
 LOG = logging.getLogger(__name__)
@@ -37,9 +41,18 @@ class LightHttpFS(object):
         (r'/index.html', views.IndexView),
         (r'/v1/file/(?P<node>[^/]+)(?P<dir_path>.*)', views.FileViewV1),
         (r'/v1/fs/(?P<node>[^/]+)(?P<dir_path>.*)', views.FSViewV1),
-        (r'/v1/search/<node>', views.SearchViewV1),
+        (r'/v1/upload/(?P<node>[^/]+)(?P<dir_path>.*)', views.UploadViewV1),
+        (r'/v1/uploads/(?P<session_id>[0-9a-f]+)',
+         views.UploadSessionViewV1),
+        (r'/v1/search', views.ClusterSearchViewV1),
+        (r'/v1/search/(?P<node>[^/]+)', views.SearchViewV1),
+        (r'/v1/grep/(?P<node>[^/]+)', views.GrepViewV1),
+        (r'/v1/du/(?P<node>[^/]+)(?P<dir_path>.*)', views.DuViewV1),
+        (r'/v1/stat/(?P<node>[^/]+)', views.StatViewV1),
+        (r'/v1/thumb/(?P<node>[^/]+)(?P<dir_path>.*)', views.ThumbViewV1),
         (r'/nodes', views.NodesView),
         (r'/nodes/<hostname>', views.NodeView),
+        (r'/v1/sftp-pool', views.SFTPPoolView),
         (r'/action', views.FsActionView),
     ]
 
@@ -63,6 +76,7 @@ class LightHttpFS(object):
         self.fs_root = fs_root or '.'
         # self.app.config['admin_password'] = password
         views.set_fs_manager(self.fs_root, node_type='master')
+        views.set_upload_manager(os.path.join(CONF.lhfs.data_dir, 'uploads'))
         views.set_auth_manager(password)
 
     # def auth_all_request(self):
@@ -76,12 +90,17 @@ class LightHttpFS(object):
 
     def start(self, develop=False, host=None, port=None):
         from gevent import monkey
-        monkey.patch_all()
+        # the walker, index and stat threads must be native threads, so
+        # that the blocking file system calls run in parallel
+        monkey.patch_all(thread=False)
 
         views.NODE_MANAGER.heartbeat()
+        views.NODE_MANAGER.start_index()
         views.NODE_MANAGER.start_rpc()
+        views.UPLOAD_MANAGER.cleanup_expired()
 
         app = web.Application(self.RULES, debug=develop,
+                              transforms=[compress.CompressContentEncoding],
                               template_path=self.template_folder,
                               static_path=self.static_folder)
         LOG.info('Starting server %s', port or CONF.api.port)
@@ -96,16 +115,51 @@ class LightHttpFS(object):
 
     def stop(self):
         views.NODE_MANAGER.stop_rpc()
+        views.NODE_MANAGER.stop_index()
+        views.NODE_MANAGER.close()
+        sshpool.SFTP_POOL.close()
 
 
 class LightHttpFSSlave(object):
 
+    DATA_RULES = [
+        (r'/data/file(?P<dir_path>/.*)', views.DataViewV1),
+    ]
+
     def __init__(self, fs_root=None, **kwargs):
+        # the data server reads and writes all files, so it is never
+        # started without token
+        self.data_enabled = bool(CONF.lhfs.data_port)
+        if self.data_enabled and not CONF.lhfs.data_token:
+            LOG.warning('data_token is not set, data server is disabled')
+            self.data_enabled = False
+        if self.data_enabled:
+            kwargs.setdefault(
+                'data_transport',
+                f'http://{CONF.lhfs.data_host}:{CONF.lhfs.data_port}')
         self.manager = manager.SlaveManager(fs_root or '.', **kwargs)
+        views.set_node_manager(self.manager)
+        self._data_loop = None
+
+    def _run_data_server(self):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        app = web.Application(self.DATA_RULES)
+        app.listen(CONF.lhfs.data_port, address=CONF.lhfs.data_host)
+        LOG.info('Starting data server %s', self.manager.node.data_transport)
+        self._data_loop = ioloop.IOLoop.current()
+        self._data_loop.start()
 
     def start(self):
         self.manager.heartbeat()
+        if self.data_enabled:
+            threading.Thread(target=self._run_data_server,
+                             daemon=True).start()
+        self.manager.start_index()
         self.manager.start_rpc()
 
     def stop(self):
         self.manager.stop_rpc()
+        self.manager.stop_index()
+        self.manager.close()
+        if self._data_loop:
+            self._data_loop.add_callback(self._data_loop.stop)
@@ -55,6 +55,8 @@ const MESSAGES = {
         getSearchHistoryFailed: 'get search history failed',
         searchFailed: 'search faild',
         uploadFailed: 'file upload failed',
+        resume: 'resume',
+        loadMore: 'load more',
         createDirSuccess: 'create directory success',
         createDirFailed: 'create directory failed',
         renameSuccess: 'rename success',
@@ -142,6 +144,8 @@ const MESSAGES = {
         getSearchHistoryFailed: '无法获取搜索历史',
         searchFailed: '搜索失败',
         uploadFailed: '文件上传失败',
+        resume: '继续',
+        loadMore: '加载更多',
         createDirSuccess: '目录创建成功',
         createDirFailed: '目录创建失败',
         renameSuccess: '重命名成功',
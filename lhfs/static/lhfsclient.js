@@ -81,6 +81,7 @@ class LHFSClient {
         }
         this.getFsUrl = function (dirPath) { return `/v1/fs${this._safe_path(dirPath)}` }
         this.getDownloadUrl = function (node, dirPath) { return `/v1/file/${node}${this._safe_path(dirPath)}` }
+        this.getThumbUrl = function (node, dirPath, size = 64) { return `/v1/thumb/${node}${this._safe_path(dirPath)}?size=${size}` }
 
         this.fsGet = function (path, showAll = false) {
             // path like: /dir1/dir2
@@ -98,9 +99,20 @@ class LHFSClient {
             this.put(`/fs${tmp_path}`, req_params);
         }
 
-        this.ls = async function (node, path, showAll = false) {
+        this.ls = async function (node, path, showAll = false, params = {}) {
             return (await this.get(`/v1/fs/${node}${this._safe_path(path)}`,
-                { showAll: showAll, sort: true })).dir
+                Object.assign({ showAll: showAll, sort: true }, params))).dir
+        };
+        this.lsStream = async function (node, path, showAll = false, params = {}, onItems = null) {
+            // the items are passed to onItems while receiving, the trailer is returned
+            return await this.getNdjson(`/v1/fs/${node}${this._safe_path(path)}`,
+                Object.assign({ showAll: showAll, sort: true }, params), onItems);
+        };
+        this.statMany = async function (node, paths, etag = false) {
+            // get the metadata of many paths in one request
+            let resp = await axios.post(`/v1/stat/${node}`,
+                { stat: { paths: paths, etag: etag } });
+            return resp.data.stat;
         };
         this.rm = async function (node, path, force = false) {
             let safe_path = this._safe_path(path);
@@ -118,27 +130,116 @@ class LHFSClient {
             let safePath = this._safe_path(file);
             return axios.get(`/v1/file/${node}${safePath}`)
         };
+        this.uploadChunkSize = 8 * 1024 * 1024;
+        this.uploadConcurrency = 3;
+        this._uploadKey = function (node, path, file) {
+            // the key to save upload session id in localStorage
+            let name = file.webkitRelativePath || file.name;
+            return `lhfs-upload:${node}:${path}:${name}:${file.size}:${file.lastModified}`
+        };
+        this._getUploadSession = async function (node, path, file) {
+            let sessionId = localStorage.getItem(this._uploadKey(node, path, file));
+            if (sessionId) {
+                try {
+                    return (await this.get(`/v1/uploads/${sessionId}`)).upload;
+                } catch (error) {
+                    console.warn(`upload session ${sessionId} is not available`);
+                }
+            }
+            let resp = await axios.post(
+                `/v1/upload/${node}${this._safe_path(path)}`,
+                { upload: { filename: file.webkitRelativePath || file.name, size: file.size } });
+            localStorage.setItem(this._uploadKey(node, path, file), resp.data.upload.id);
+            return resp.data.upload;
+        };
+        this._missingChunks = function (session) {
+            // split the ranges which are not uploaded into chunks
+            let chunks = [];
+            let start = 0;
+            for (let range of session.ranges.concat([[session.size, session.size]])) {
+                for (let offset = start; offset < range[0]; offset += this.uploadChunkSize) {
+                    chunks.push([offset, Math.min(offset + this.uploadChunkSize, range[0])]);
+                }
+                start = range[1];
+            }
+            return chunks;
+        };
         this.upload = async function (node, path, file, uploadCallback = null) {
-            let formData = new FormData();
-            formData.append('file', file);
-            let safe_path = this._safe_path(path);
-            return axios({
-                url: `/v1/file/${node}${safe_path}`,
-                method: 'POST',
-                data: formData,
-                headers: { 'Content-Type': 'multipart/form-data' },
-                onUploadProgress: function (progressEvent) {
-                    if (uploadCallback) {
-                        uploadCallback(progressEvent)
-                    }
-                },
-            });
+            // resumable upload, the chunks which were uploaded are skipped
+            let session = await this._getUploadSession(node, path, file);
+            let chunks = this._missingChunks(session);
+            let loaded = file.size - chunks.reduce((sum, chunk) => sum + chunk[1] - chunk[0], 0);
+            let chunksLoaded = {};
+            let report = function () {
+                if (uploadCallback) {
+                    let inflight = Object.values(chunksLoaded).reduce((sum, value) => sum + value, 0);
+                    uploadCallback({ loaded: loaded + inflight, total: file.size });
+                }
+            };
+            let worker = async () => {
+                while (chunks.length > 0) {
+                    let [start, end] = chunks.shift();
+                    await axios.put(`/v1/uploads/${session.id}?offset=${start}`, file.slice(start, end), {
+                        headers: { 'Content-Type': 'application/octet-stream' },
+                        onUploadProgress: function (progressEvent) {
+                            chunksLoaded[start] = progressEvent.loaded;
+                            report();
+                        },
+                    });
+                    delete chunksLoaded[start];
+                    loaded += end - start;
+                    report();
+                }
+            };
+            report();
+            let workers = [];
+            for (let i = 0; i < this.uploadConcurrency; i++) {
+                workers.push(worker());
+            }
+            await Promise.all(workers);
+            let resp = await axios.post(`/v1/uploads/${session.id}`);
+            localStorage.removeItem(this._uploadKey(node, path, file));
+            return resp;
         };
         this.find = function (name) {
             // find files by specified name, e.g. *.py, *.js
             return axios.post(`/v1/search/${this.context.node}`,
                 { 'search': { 'partern': name } })
         };
+        this.findStream = async function (name, params = {}, onItems = null) {
+            // the items are passed to onItems once found, the previous search
+            // is aborted, the trailer is returned
+            if (this._findController) {
+                this._findController.abort();
+            }
+            let controller = new AbortController();
+            this._findController = controller;
+            try {
+                return await this.fetchNdjson(`/v1/search/${this.context.node}`, {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ search: Object.assign({ partern: name }, params) }),
+                    signal: controller.signal,
+                }, onItems);
+            } finally {
+                if (this._findController === controller) {
+                    this._findController = null;
+                }
+            }
+        };
+        this.findAll = function (name, params = {}) {
+            // find files on all the active nodes, the items have key node
+            return axios.post('/v1/search',
+                { search: Object.assign({ partern: name }, params) })
+        };
+        this.grep = async function (node, pattern, params = {}, onItems = null) {
+            // the matched lines are passed to onItems once found, the trailer is returned
+            return await this.fetchNdjson(`/v1/grep/${node}`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ grep: Object.assign({ pattern: pattern }, params) }),
+            }, onItems);
+        };
         this.findHistory = function () {
             return axios.get(`/v1/search/${this.context.node}`);
         };
@@ -162,6 +263,47 @@ class LHFSClient {
         let resp = await axios.get(url, { params: params });
         return resp.data
     }
+    async getNdjson(url, params = {}, onRecords = null) {
+        let query = new URLSearchParams(params).toString();
+        return await this.fetchNdjson(query ? `${url}?${query}` : url, {}, onRecords);
+    }
+    async fetchNdjson(url, init = {}, onRecords = null) {
+        // read the NDJSON response line by line, onRecords is called with the
+        // records of each received chunk, the trailer record is returned
+        let headers = Object.assign({ Accept: 'application/x-ndjson' }, init.headers);
+        let resp = await fetch(url, Object.assign({}, init, { headers: headers }));
+        if (!resp.ok) {
+            throw await resp.json();
+        }
+        let reader = resp.body.getReader();
+        let decoder = new TextDecoder();
+        let buffer = '', trailer = null;
+        while (true) {
+            let { done, value } = await reader.read();
+            buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+            let lines = buffer.split('\n');
+            buffer = done ? '' : lines.pop();
+            let records = [];
+            for (let line of lines) {
+                if (line == '') { continue; }
+                let record = JSON.parse(line);
+                if (record.error) {
+                    throw record;
+                } else if (record.trailer) {
+                    trailer = record.trailer;
+                } else {
+                    records.push(record);
+                }
+            }
+            if (records.length > 0 && onRecords) {
+                onRecords(records);
+            }
+            if (done) {
+                break;
+            }
+        }
+        return trailer;
+    }
     async delete(url) {
         let resp = await axios.delete(url);
         return resp.data;
@@ -151,24 +151,34 @@ new Vue({
             console.info(`准备上传 ${files.length} 个文件`);
             for (let index = 0; index < files.length; index++) {
                 let file = files[index];
-                let progress = { file: file.name, loaded: 0, total: 100, status: 'waiting', target: this.filesTable.node };
+                let progress = {
+                    file: file.name, loaded: 0, total: file.size, status: 'waiting',
+                    target: this.filesTable.node, path: this.filesTable.pathList.join('/'),
+                    source: file,
+                };
                 self.uploadQueue.tasks.push(progress);
-                self.filesTable.upload(
-                    file, 
-                    uploadEvent => {
-                        progress.loaded = uploadEvent.loaded;
-                        progress.total = uploadEvent.total;
-                    }
-                ).then(success => {
-                    self.refreshChildren()
-                    self.uploadQueue.completed += 1;
-                    progress.status = 'completed';
-                }).catch(error => {
-                    progress.status = 'failed';
-                    self.log.error(`${I18N.t('uploadFailed')}, ${error}`, 5000)
-                });
+                self.runUploadTask(progress);
             }
         },
+        runUploadTask: function (progress) {
+            // the upload is resumable, run it again to continue a failed task
+            var self = this;
+            progress.status = 'uploading';
+            self.filesTable.api.upload(
+                progress.target, progress.path, progress.source,
+                uploadEvent => {
+                    progress.loaded = uploadEvent.loaded;
+                    progress.total = uploadEvent.total;
+                }
+            ).then(success => {
+                self.filesTable.refresh()
+                self.uploadQueue.completed += 1;
+                progress.status = 'completed';
+            }).catch(error => {
+                progress.status = 'failed';
+                self.log.error(`${I18N.t('uploadFailed')}, ${error}`, 5000)
+            });
+        },
         clickUploadFile: function(){
             let element = document.getElementById('inputUploadFile');
             element.click();
@@ -238,11 +248,14 @@ new Vue({
             var self = this;
             self.showPardir = true;
             self.searchResult = [];
-            this.fsClient.find(this.searchPartern).then(success => {
-                self.fileSystem.dirList = [];
-                self.fileSystem.pathItems = success.data.search.dirs;
+            self.fileSystem.dirList = [];
+            self.fileSystem.pathItems = [];
+            // the items are shown once found
+            this.fsClient.findStream(this.searchPartern, {}, items => {
+                self.fileSystem.pathItems.push(...items);
             }).catch(error => {
-                self.log.error(`${I18N.t('searchFailed')}, ${error.status}`, 5000)
+                if (error.name == 'AbortError') { return; }
+                self.log.error(`${I18N.t('searchFailed')}, ${error.status || error.error}`, 5000)
             });
         },
         showQrcode: function (elemId, text) {
@@ -1,6 +1,8 @@
 import { NewDirDialog, RenameDialog } from "./dialogs.js";
 import { LHFSClient } from "./lhfsclient.js";
 
+const IMAGE_TYPES = ['jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp', 'tif', 'tiff'];
+
 export class FilesTable {
     constructor() {
         this.headers = [
@@ -25,15 +27,35 @@ export class FilesTable {
         this.newDirDialog = new NewDirDialog();
         this.renameDialog = new RenameDialog();
         this.diskUsage = {}
+        this.pageSize = 1000;
+        this.nextCursor = null;
+        this.total = 0;
+    }
+    appendItems(items){
+        // render the items incrementally while the listing is streamed
+        this.items.push(...items);
+        this.itemsPerPage = this.items.length;
     }
     async refresh(){
-        let dir = await this.api.ls(this.node, this.pathList.join('/'), this.showAll);
-        this.items = dir.children;
+        this.items = [];
+        let dir = await this.api.lsStream(this.node, this.pathList.join('/'), this.showAll,
+                                          {limit: this.pageSize}, items => this.appendItems(items));
+        this.nextCursor = dir.next_cursor;
+        this.total = dir.total;
         this.diskUsage = dir.disk_usage;
         console.debug('disk usage:', this.diskUsage.used, this.diskUsage.total)
         this.itemsPerPage = this.items.length;
         this.selected = [];
     }
+    async loadMore(){
+        if (!this.nextCursor) {
+            return;
+        }
+        let dir = await this.api.lsStream(this.node, this.pathList.join('/'), this.showAll,
+                                          {limit: this.pageSize, cursor: this.nextCursor},
+                                          items => this.appendItems(items));
+        this.nextCursor = dir.next_cursor;
+    }
     async refreshNodes() {
         var self = this;
         this.nodes_info = {};
@@ -147,6 +169,13 @@ export class FilesTable {
         let fileDir = this.pathList.concat(item.name).join('/');
         return this.api.getDownloadUrl(this.node, item.pardir ? `${item.pardir}/${item.name}` : fileDir);
     };
+    isImage(item) {
+        return !item.folder && IMAGE_TYPES.indexOf((item.type || '').toLowerCase()) >= 0;
+    };
+    getThumbUrl(item) {
+        let fileDir = this.pathList.concat(item.name).join('/');
+        return this.api.getThumbUrl(this.node, item.pardir ? `${item.pardir}/${item.name}` : fileDir);
+    };
     downloadFile(item){
         let link = document.createElement('a');
         link.href = this._getDownloadUrl(item);
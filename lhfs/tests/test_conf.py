@@ -0,0 +1,24 @@
+import subprocess
+import sys
+import unittest
+from unittest import mock
+
+from lhfs.common import conf
+
+
+class MyIpTest(unittest.TestCase):
+
+    def test_not_resolved_on_import(self):
+        code = ('from lhfs.common import conf; '
+                'print(conf.get_host_ip.cache_info().misses, '
+                'conf.CONF.lhfs.my_ip)')
+        output = subprocess.check_output([sys.executable, '-c', code])
+        self.assertEqual(output.split(), [b'0', b'None'])
+
+    @unittest.skipIf(conf.CONF.lhfs.my_ip, 'my_ip is set')
+    def test_resolved_on_load(self):
+        with mock.patch.object(conf.CONF, 'set_cli') as set_cli, \
+                mock.patch.object(conf, 'get_host_ip',
+                                  return_value='10.0.0.2'):
+            conf.load_configs()
+        set_cli.assert_called_once_with('my_ip', '10.0.0.2', group='lhfs')
@@ -0,0 +1,55 @@
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+from lhfs.core import grep
+
+
+class GrepEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        for index in range(grep.BATCH_FILES * 8):
+            with open(os.path.join(self.root, f'{index}.txt'), 'w') as f:
+                f.write(f'line\nneedle {index}\n')
+        self.engine = grep.GrepEngine(workers=1)
+        self.addCleanup(self.engine.close)
+
+    def test_grep(self):
+        matched = dict(self.engine.grep(self.root, 'NEEDLE 7',
+                                        ignore_case=True))
+        self.assertEqual(matched[os.path.join(self.root, '7.txt')],
+                         [{'line': 2, 'text': 'needle 7', 'before': [],
+                           'after': []}])
+
+    def _grep_lines(self, data, pattern, regex=True):
+        path = os.path.join(self.root, 'anchored.txt')
+        with open(path, 'wb') as f:
+            f.write(data)
+        regex = re.compile(*grep.GrepEngine.compile(pattern, regex=regex))
+        return [match['line'] for match in grep.grep_file(path, regex)]
+
+    def test_anchored(self):
+        data = b'bar\nfoo\nxfoo\n'
+        self.assertEqual(self._grep_lines(data, '^foo'), [2])
+        self.assertEqual(self._grep_lines(data, 'foo$'), [2, 3])
+        self.assertEqual(self._grep_lines(data, '^bar$'), [1])
+
+    def test_match_in_one_line(self):
+        data = b'foo\nbar\nfoo  bar\n'
+        self.assertEqual(self._grep_lines(data, r'foo\s+bar'), [3])
+        self.assertEqual(self._grep_lines(data, r'o\s'), [3])
+
+    def test_close_cancels_pending(self):
+        results = self.engine.grep(self.root, 'needle')
+        next(results)
+        futures = set(self.engine._futures)
+        self.engine.close()
+        self.assertIsNone(self.engine._executor)
+        # the running futures can not be cancelled
+        self.assertTrue(all(future.cancelled() or future.running() or
+                            future.done() for future in futures))
+        results.close()
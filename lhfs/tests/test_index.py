@@ -0,0 +1,88 @@
+import contextlib
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from lhfs.common import inotify
+from lhfs.core import index
+
+
+class FilenameIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        for name in ['a.py', 'sub/b.py', 'sub/deep/c.txt']:
+            os.makedirs(os.path.dirname(self._path(name)), exist_ok=True)
+            open(self._path(name), 'w').close()
+        index_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, index_dir)
+        self.index = index.FilenameIndex(self.root, index_dir)
+        self.addCleanup(self.index.stop)
+        self.index.rebuild()
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def _names(self, partern='*'):
+        return sorted(row[1] for row in self.index.search(partern))
+
+    def _wait(self, check, timeout=5):
+        deadline = time.time() + timeout
+        while not check() and time.time() < deadline:
+            time.sleep(0.01)
+        return check()
+
+    def test_refresh_updates_existing(self):
+        with open(self._path('a.py'), 'w') as f:
+            f.write('changed')
+        self.index.refresh(self._path('sub'), recursive=True)
+        self.index.refresh(self._path('a.py'))
+        with contextlib.closing(self.index._connect()) as conn:
+            size = conn.execute("SELECT size FROM entries WHERE name='a.py'"
+                                ).fetchone()[0]
+            counts = [conn.execute(f'SELECT count(*) FROM {table}'
+                                   ).fetchone()[0]
+                      for table in ['entries', 'names']]
+        self.assertEqual(size, 7)
+        self.assertEqual(self._names('*.py'), ['a.py', 'b.py'])
+        if self.index.fts:
+            self.assertEqual(counts[0], counts[1])
+
+    def test_refresh_later(self):
+        os.rename(self._path('sub'), self._path('moved'))
+        open(self._path('new.py'), 'w').close()
+        self.index.refresh_later([(self._path('sub'), True),
+                                  (self._path('moved'), True),
+                                  (self._path('moved/b.py'), False),
+                                  (self._path('new.py'), False)])
+        self.assertTrue(self._wait(lambda: 'new.py' in self._names()))
+        self.assertEqual(self._names(), ['a.py', 'b.py', 'c.txt', 'deep',
+                                         'moved', 'new.py'])
+        parents = {row[0] for row in self.index.search('b.py')}
+        self.assertEqual(parents, {'/moved'})
+
+    def test_coalesce(self):
+        self.assertEqual(
+            index.coalesce({'/r/a': True, '/r/a/b': False, '/r/ab': False,
+                            '/r/c': False, '/r/c/d': True}),
+            [('/r/a', True), ('/r/ab', False), ('/r/c', False),
+             ('/r/c/d', True)])
+
+    @unittest.skipUnless(inotify.is_supported(), 'inotify is not supported')
+    def test_watcher_failed(self):
+        watcher = index.IndexWatcher(self.index, delay=0.01)
+        self.addCleanup(watcher.stop)
+        self.assertTrue(watcher.start())
+        self.assertTrue(self._wait(watcher.watching_all))
+        open(self._path('new.py'), 'w').close()
+        with mock.patch.object(inotify, 'READ_RETRY_INTERVAL', 0.001), \
+                mock.patch.object(inotify.Inotify, 'read_events',
+                                  side_effect=OSError('read failed')):
+            self.assertTrue(self._wait(lambda: watcher._watcher.failed))
+        # the changes are found by rebuilding the index
+        self.assertFalse(watcher.watching_all())
+        self.assertTrue(self._wait(lambda: 'new.py' in self._names()))
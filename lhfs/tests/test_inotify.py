@@ -0,0 +1,49 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from lhfs.common import inotify
+
+
+@unittest.skipUnless(inotify.is_supported(), 'inotify is not supported')
+class WatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.events = []
+        self.received = threading.Event()
+        self.watcher = inotify.Watcher(self._callback)
+        self.addCleanup(self.watcher.stop)
+
+    def _callback(self, path, name, mask):
+        self.events.append((path, name))
+        self.received.set()
+
+    def test_large_fd(self):
+        # occupy the fds below 1024, which select() can handle
+        fds = []
+        self.addCleanup(lambda: [os.close(fd) for fd in fds])
+        while not fds or fds[-1] < 1024:
+            fds.append(os.open(os.devnull, os.O_RDONLY))
+        self.assertTrue(self.watcher.watch(self.root))
+        self.assertGreaterEqual(self.watcher._inotify.fd, 1024)
+        open(os.path.join(self.root, 'a'), 'w').close()
+        self.assertTrue(self.received.wait(5))
+        self.assertIn((self.root, 'a'), self.events)
+
+    @mock.patch.object(inotify, 'READ_RETRY_INTERVAL', 0.001)
+    def test_stop_after_failures(self):
+        self.assertTrue(self.watcher.watch(self.root))
+        with mock.patch.object(inotify.Inotify, 'read_events',
+                               side_effect=OSError('read failed')) as read:
+            self.assertTrue(self.received.wait(5))
+            self.watcher._thread.join(5)
+        self.assertEqual(read.call_count, inotify.MAX_READ_FAILURES)
+        self.assertEqual(self.events, [(None, None)])
+        self.assertTrue(self.watcher.failed)
+        self.assertFalse(self.watcher._thread.is_alive())
+        self.assertFalse(self.watcher.watch(self.root))
@@ -0,0 +1,32 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from lhfs.common import conf
+from lhfs.core import manager
+
+
+class StatTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        os.mkdir(os.path.join(self.root, 'd'))
+        for name in ['a.txt', 'b.bin']:
+            with open(os.path.join(self.root, 'd', name), 'w') as f:
+                f.write('abc')
+        with mock.patch.object(conf.CONF.lhfs, 'data_dir', self.root):
+            self.manager = manager.FSManager(self.root)
+        self.addCleanup(self.manager.close)
+
+    def test_editable(self):
+        items = self.manager.stat_many(['/d', '/d/a.txt', '/d/b.bin',
+                                        '/nope'])
+        self.assertEqual([item and item.editable for item in items],
+                         [False, True, False, None])
+        # the same as listing
+        listed = {item.name: item.editable
+                  for item in self.manager.ls('/d', False)}
+        self.assertEqual(listed, {'a.txt': True, 'b.bin': False})
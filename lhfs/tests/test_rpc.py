@@ -0,0 +1,98 @@
+import socket
+import time
+import unittest
+from xmlrpc import client
+
+from lhfs.common import utils
+from lhfs.core import objects
+from lhfs.core.rpc import base
+
+LARGE_SIZE = 3 * 1024 ** 3
+
+
+class FakeServerProxy(object):
+    """Marshal the results of manager like xmlrpc"""
+
+    def __init__(self, manager):
+        self.manager = manager
+
+    def __getattr__(self, name):
+        def call(*args):
+            result = base.to_primitive(getattr(self.manager, name)(*args))
+            return client.loads(client.dumps((result,), allow_none=True,
+                                             methodresponse=True))[0][0]
+        return call
+
+
+class FakeManager(object):
+
+    def get_path_dict(self, path, etag):
+        return objects.DirItem('big.iso', LARGE_SIZE, mtime=1.0, pardir='/')
+
+    def stat_many(self, paths, etag):
+        return [self.get_path_dict(path, etag) for path in paths] + [None]
+
+    def ls(self, path, show_all):
+        return [self.get_path_dict(path, False)]
+
+    def find(self, partern, mode, use_index, limit, timeout):
+        return [self.get_path_dict('/big.iso', False).to_dict()]
+
+    def ls_page(self, path, show_all, sort, reverse, limit, cursor,
+                columnar):
+        items = self.ls(path, show_all)
+        if columnar:
+            return {'columns': objects.to_columns(items)}
+        return {'children': items}
+
+
+class FakeRpcClient(base.BaseRpcClient):
+
+    def init_client(self):
+        return FakeServerProxy(FakeManager())
+
+
+class LargeSizeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeRpcClient('fake')
+
+    def assertSize(self, size):
+        self.assertEqual(size, LARGE_SIZE)
+        self.assertIsInstance(size, int)
+
+    def test_get_path_dict(self):
+        self.assertSize(self.client.get_path_dict('/big.iso').size)
+
+    def test_stat_many(self):
+        items = self.client.stat_many(['/big.iso'])
+        self.assertSize(items[0].size)
+        self.assertIsNone(items[1])
+
+    def test_find(self):
+        items = self.client.find('*.iso')
+        self.assertSize(items[0]['size'])
+        self.assertEqual(items[0]['name'], 'big.iso')
+
+    def test_ls(self):
+        self.assertSize(self.client.ls('/')[0].size)
+        self.assertSize(self.client.ls_page('/')['children'][0].size)
+        self.assertSize(
+            self.client.ls_page('/', columnar=True)['columns']['size'][0])
+
+
+class RpcTimeoutTest(unittest.TestCase):
+
+    def setUp(self):
+        # a hung node, it accepts the connections but never replies
+        self.server = socket.socket()
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(8)
+        self.addCleanup(self.server.close)
+        self.transport = 'http://127.0.0.1:%s' % self.server.getsockname()[1]
+
+    def test_timeout(self):
+        rpc_client = utils.get_rpc_client(self.transport, timeout=0.2)
+        started = time.time()
+        self.assertRaises(socket.timeout, rpc_client.find, '*.py')
+        self.assertLess(time.time() - started, 2)
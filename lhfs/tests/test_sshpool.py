@@ -0,0 +1,77 @@
+import threading
+import types
+import unittest
+from unittest import mock
+
+from lhfs.common import sshpool
+
+
+class FakeSFTP(object):
+
+    def __init__(self):
+        self.channel = types.SimpleNamespace(closed=False)
+        self.users = 0
+
+    def get_channel(self):
+        return self.channel
+
+    def close(self):
+        self.channel.closed = True
+
+
+class FakeSSHClient(object):
+
+    def __init__(self, *args):
+        transport = mock.Mock()
+        transport.is_active.return_value = True
+        self.client = mock.Mock()
+        self.client.get_transport.return_value = transport
+        self.client.open_sftp.side_effect = FakeSFTP
+
+    def _connect(self):
+        pass
+
+
+class SFTPPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('easy2use.pysshpass.ssh.SSHClient',
+                             FakeSSHClient, create=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool = sshpool.SFTPPool(max_channels=4, idle_timeout=100)
+        self.addCleanup(self.pool.close)
+        self.node = types.SimpleNamespace(ip='127.0.0.1', ssh_user='user',
+                                          ssh_password='password')
+
+    def test_reuse_idle_channel(self):
+        with self.pool.sftp(self.node) as first:
+            pass
+        with self.pool.sftp(self.node) as second:
+            self.assertIs(second, first)
+
+    def test_concurrent(self):
+        errors = []
+        lock = threading.Lock()
+
+        def use():
+            try:
+                for _ in range(200):
+                    with self.pool.sftp(self.node) as sftp:
+                        with lock:
+                            sftp.users += 1
+                            shared = sftp.users > 1
+                        with lock:
+                            sftp.users -= 1
+                        if shared:
+                            errors.append('channel is shared')
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=use) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(self.pool.stats()['active_channels'], 0)
@@ -0,0 +1,43 @@
+import threading
+import unittest
+
+from lhfs.common import exception
+from lhfs.common import utils
+
+
+class RecordSessionsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sessions = utils.RecordSessions()
+        self.addCleanup(self.sessions.close)
+        self.closed = threading.Event()
+
+    def records(self, cancel):
+        try:
+            count = 0
+            while not cancel.is_set():
+                yield {'index': count}
+                count += 1
+        finally:
+            self.closed.set()
+
+    def test_fetch_all(self):
+        cancel = threading.Event()
+        session_id = self.sessions.start(iter([{'index': 0}]), cancel)
+        batch = self.sessions.fetch(session_id, 10, 1)
+        self.assertEqual(batch, {'records': [{'index': 0}], 'done': True,
+                                 'error': None})
+        self.assertRaises(exception.RecordSessionNotExists,
+                          self.sessions.fetch, session_id, 10, 1)
+
+    def test_stop(self):
+        cancel = threading.Event()
+        session_id = self.sessions.start(self.records(cancel), cancel)
+        batch = self.sessions.fetch(session_id, 10, 1)
+        self.assertEqual(len(batch['records']), 10)
+        self.assertFalse(batch['done'])
+        # the fetcher stops when the stream is disconnected or it is limited
+        self.sessions.stop(session_id)
+        self.assertTrue(cancel.is_set())
+        self.assertTrue(self.closed.wait(2))
+        self.assertEqual(self.sessions._sessions, {})
@@ -0,0 +1,46 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from lhfs.core import walker
+
+
+class TreeWalkerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        # a wide and deep tree, 1 + 12 + 144 + 1728 directories
+        dirs = [self.root]
+        for _ in range(3):
+            dirs = [os.path.join(parent, f'd{index}')
+                    for parent in dirs for index in range(12)]
+        for dir_path in dirs:
+            os.makedirs(dir_path)
+
+    def _os_walk(self):
+        return [dir_path for dir_path, _, _ in os.walk(self.root)]
+
+    def _walk(self, ordered, delay):
+        dir_pathes = []
+        for dir_path, _, _ in walker.TreeWalker(workers=8).walk(
+                self.root, ordered=ordered):
+            dir_pathes.append(dir_path)
+            if len(dir_pathes) % 10 == 0:
+                # slow consumer
+                time.sleep(delay)
+        return dir_pathes
+
+    def test_unordered(self):
+        expected = sorted(self._os_walk())
+        for delay in [0, 0.001]:
+            for _ in range(5):
+                self.assertEqual(sorted(self._walk(False, delay)), expected)
+
+    def test_ordered(self):
+        expected = self._os_walk()
+        for delay in [0, 0.001]:
+            for _ in range(3):
+                self.assertEqual(self._walk(True, delay), expected)
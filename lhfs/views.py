@@ -1,16 +1,38 @@
+import asyncio
 import copy
+import email.utils
 import functools
+import hashlib
+import hmac
 import json
-import os
+import mimetypes
 import logging
+import os
+import posixpath
+import tempfile
+import threading
+import uuid
+from urllib import parse
 
 from pbr import version
+import tornado
+from tornado import http1connection
+from tornado import httpclient
+from tornado import httputil
+from tornado import ioloop
+from tornado import iostream
 from tornado import web
 
-from easy2use.pysshpass import ssh
-
 from lhfs import auth
 from lhfs.core import manager
+from lhfs.core import objects
+from lhfs.core import thumb
+from lhfs.core import upload
+from lhfs.common import compress
+from lhfs.common import constants
+from lhfs.common import exception
+from lhfs.common import multipart
+from lhfs.common import sshpool
 from lhfs.common import utils
 from lhfs.common import conf
 
@@ -19,6 +41,7 @@ LOG = logging.getLogger(__name__)
 
 NODE_MANAGER = None
 AUTH_CONTROLLER = None
+UPLOAD_MANAGER = None
 SERVER_NAME = 'lhfs'
 DEFAULT_CONTEXT = {
     'name': SERVER_NAME,
@@ -37,6 +60,7 @@ def ensure_node_exists(func):
         if node not in NODE_MANAGER.nodes:
             self.set_status(404)
             self.finish({'error': f'node {node} not exists'})
+            return
         return func(self, node, *args, **kwargs)
 
     return wrapper
@@ -51,18 +75,153 @@ def set_fs_manager(root_path, node_type='master'):
             NODE_MANAGER = manager.FSManager(root_path)
 
 
+def set_node_manager(node_manager):
+    global NODE_MANAGER
+    NODE_MANAGER = node_manager
+
+
+def set_upload_manager(session_dir):
+    global UPLOAD_MANAGER
+    if not UPLOAD_MANAGER:
+        UPLOAD_MANAGER = upload.UploadManager(session_dir)
+
+
 def set_auth_manager(password):
     global AUTH_CONTROLLER
     if not AUTH_CONTROLLER:
         AUTH_CONTROLLER = auth.AuthManager(password)
 
 
+def get_data_url(node_info, path):
+    return f'{node_info.data_transport}/data/file/' \
+           f'{parse.quote(path.lstrip("/"))}'
+
+
+def get_data_headers():
+    if not CONF.lhfs.data_token:
+        return {}
+    return {constants.DATA_TOKEN_HEADER: CONF.lhfs.data_token}
+
+
+async def put_remote_file(node, save_path, local_path):
+    """Upload local file to save_path of remote node
+    """
+    node_info = NODE_MANAGER.nodes.get(node)
+    if not node_info.data_transport:
+        abs_path = NODE_MANAGER.get_abs_path(save_path, host=node)
+        NODE_MANAGER.ensure_parent_dir(save_path, host=node)
+        await ioloop.IOLoop.current().run_in_executor(
+            None, utils.put_file, node_info, local_path, abs_path)
+        return
+
+    async def body_producer(write):
+        with open(local_path, 'rb') as f:
+            while True:
+                data = f.read(CONF.api.download_chunk_size)
+                if not data:
+                    break
+                await write(data)
+
+    headers = get_data_headers()
+    headers['Content-Length'] = str(os.path.getsize(local_path))
+    await httpclient.AsyncHTTPClient().fetch(
+        get_data_url(node_info, save_path), method='PUT', headers=headers,
+        body_producer=body_producer, request_timeout=0)
+
+
 class BaseHandler(web.RequestHandler):
+    _stream_cancel = None
+
+    def on_connection_close(self):
+        if self._stream_cancel:
+            self._stream_cancel.set()
 
     def _finish_with(self, status, data=None):
         self.set_status(status)
         self.finish(data)
 
+    def _is_not_modified(self, etag, mtime):
+        """Set the validators of response, return True if the cache of client
+        is still fresh.
+        """
+        self.set_header('Etag', etag)
+        self.set_header('Last-Modified', httputil.format_timestamp(mtime))
+        if self.request.headers.get('If-None-Match'):
+            return self.check_etag_header()
+        if_modified_since = self.request.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+            return int(mtime) <= since.timestamp()
+        return False
+
+    def _accept_ndjson(self):
+        return constants.NDJSON_CONTENT_TYPE in \
+            self.request.headers.get('Accept', '')
+
+    async def _finish_ndjson(self, records, trailer, cancel=None,
+                             timeout=None):
+        """Stream the records as NDJSON, one json object per line
+
+        The records are consumed in a thread and flushed once they are
+        ready, trailer is a function with the count of records as argument,
+        its result is sent as the last record {"trailer": {...}}.
+        The threading.Event cancel is set if the client is disconnected or
+        after timeout seconds, an empty line is sent if there is no record
+        for a while, so that the disconnection is found.
+        """
+        loop = ioloop.IOLoop.current()
+        cancel = cancel or threading.Event()
+        self._stream_cancel = cancel
+        pump = utils.RecordPump(records, cancel,
+                                CONF.api.ndjson_batch_size * 4)
+        deadline = timeout and loop.time() + timeout
+        count = 0
+        sent = False
+        self.set_header('Content-Type', constants.NDJSON_CONTENT_TYPE)
+        pump.start()
+        try:
+            while True:
+                wait = constants.NDJSON_KEEPALIVE_INTERVAL
+                if deadline:
+                    wait = min(wait, deadline - loop.time())
+                    if wait <= 0:
+                        LOG.info('stream timed out after %s records', count)
+                        cancel.set()
+                        break
+                batch = await loop.run_in_executor(
+                    None, pump.get_batch, CONF.api.ndjson_batch_size, wait)
+                ended = bool(batch) and batch[-1] is utils.RecordPump.END
+                if ended:
+                    batch.pop()
+                if batch or not ended:
+                    count += len(batch)
+                    # an empty line keeps the connection alive
+                    self.write(''.join(json.dumps(record) + '\n'
+                                       for record in batch) or '\n')
+                    await self.flush()
+                    sent = True
+                if ended:
+                    break
+            if pump.error:
+                raise pump.error
+            self.write(json.dumps({'trailer': trailer(count)}) + '\n')
+            self.finish()
+        except iostream.StreamClosedError:
+            LOG.warning('connection closed after %s records', count)
+        except Exception as e:
+            LOG.exception(e)
+            if not sent:
+                self.clear()
+                self._finish_with(400, {'error': str(e)})
+                return
+            self.write(json.dumps({'error': str(e)}) + '\n')
+            self.finish()
+        finally:
+            cancel.set()
+
     def get_context(self):
         context = copy.deepcopy(DEFAULT_CONTEXT)
         context.update({'username': self.get_cookie('username', 'guest')})
@@ -92,19 +251,77 @@ class IndexView(BaseHandler):
 class FSViewV1(BaseHandler):
 
     @ensure_node_exists
-    def get(self, node, dir_path):
-        self.request.query
+    async def get(self, node, dir_path):
+        """List directory
+        GET /fs/foo?sort=<name|size|mtime|type>&order=<asc|desc>&limit=100
+        The next page is requested with cursor=<next_cursor of this page>.
+        With header Accept: application/x-ndjson, the items are streamed.
+        With format=columnar, the items are returned as parallel arrays.
+        """
         show_all = self.get_query_argument('showAll',
                                            'false').lower() == 'true'
-        sort = self.get_query_argument('sort', 'false') == 'true'
+        sort = self.get_query_argument('sort', 'false').lower()
+        reverse = self.get_query_argument('order', 'asc').lower() == 'desc'
+        limit = self.get_query_argument('limit', None)
+        cursor = self.get_query_argument('cursor', None)
+        columnar = self.get_query_argument('format', None) == 'columnar'
+        if sort == 'true':
+            sort = 'name'
+        elif sort == 'false':
+            sort = (limit or cursor) and 'name' or None
         try:
-            items = NODE_MANAGER.ls(dir_path, show_all=show_all, host=node)
+            limit = int(limit) if limit else None
+            if limit is not None and limit <= 0:
+                raise ValueError(f'invalid limit {limit}')
+            dir_item = NODE_MANAGER.get_path_dict(dir_path, etag=True,
+                                                  host=node)
+            ndjson = self._accept_ndjson() and not columnar
+            # hash the repr of tuple, so that the different parameters,
+            # e.g. the cursors with '-', never make the same etag
+            params = (dir_item.etag, show_all, sort, reverse, limit, cursor,
+                      ndjson, columnar)
+            etag = f'W/"{hashlib.sha1(repr(params).encode()).hexdigest()}"'
+            self.set_header('Vary', 'Accept')
+            if self._is_not_modified(etag, dir_item.mtime):
+                self._finish_with(304)
+                return
             if sort:
-                items.sort(key=lambda i: (i.folder, i.name), reverse=True)
-            usage = NODE_MANAGER.disk_usage()
+                page = NODE_MANAGER.ls_page(dir_path, show_all=show_all,
+                                            sort=sort, reverse=reverse,
+                                            limit=limit, cursor=cursor,
+                                            columnar=columnar, host=node)
+            elif ndjson and node == NODE_MANAGER.node.hostname:
+                page = {'children': NODE_MANAGER.iter_ls(dir_path,
+                                                         show_all=show_all),
+                        'next_cursor': None, 'total': None}
+            else:
+                items = NODE_MANAGER.ls(dir_path, show_all=show_all,
+                                        host=node)
+                page = {'next_cursor': None, 'total': len(items)}
+                if columnar:
+                    page['columns'] = objects.to_columns(items)
+                else:
+                    page['children'] = items
+            usage = NODE_MANAGER.get_disk_usage(node)
+            if ndjson:
+                await self._finish_ndjson(
+                    (item.to_dict(human=True) for item in page['children']),
+                    lambda count: {
+                        'path': dir_path, 'count': count,
+                        'total': page['total'] or count,
+                        'next_cursor': page['next_cursor'],
+                        'disk_usage': {'total': usage.total,
+                                       'used': usage.used}})
+                return
             data = {'path': dir_path,
-                    'children': [item.to_dict(human=True) for item in items],
+                    'next_cursor': page['next_cursor'],
+                    'total': page['total'],
                     'disk_usage': {'total': usage.total, 'used': usage.used}}
+            if columnar:
+                data['columns'] = page['columns']
+            else:
+                data['children'] = [item.to_dict(human=True)
+                                    for item in page['children']]
             self._finish_with(200, {'dir': data})
         except Exception as e:
             LOG.exception(e)
@@ -115,6 +332,7 @@ class FSViewV1(BaseHandler):
         force = self.get_query_argument('force', 'false').lower() == 'true'
         try:
             NODE_MANAGER.rm(dir_path, force=force, host=node)
+            NODE_MANAGER.invalidate_disk_usage(node)
             self._finish_with(204)
         except Exception as e:
             LOG.exception(e)
@@ -150,72 +368,703 @@ class FSViewV1(BaseHandler):
             self._finish_with(400, {'error': str(e)})
 
 
+@web.stream_request_body
 class FileViewV1(BaseHandler):
 
+    def prepare(self):
+        self._receiver = None
+        self._parser = None
+        self._upload_error = None
+        if self.request.method != 'POST':
+            return
+        node = self.path_kwargs['node']
+        dir_path = self.path_kwargs['dir_path']
+        if node not in NODE_MANAGER.nodes:
+            return
+        max_size = CONF.api.upload_max_size
+        if int(self.request.headers.get('Content-Length', 0)) > max_size:
+            self._finish_with(413, {'error': f'file size exceeds {max_size}'})
+            return
+        self.request.connection.set_max_body_size(max_size)
+        boundary = multipart.get_header_param(
+            'Content-Type', self.request.headers.get('Content-Type', ''),
+            'boundary')
+        if not boundary:
+            self._finish_with(400, {'error': 'body is not multipart'})
+            return
+        if node == NODE_MANAGER.node.hostname:
+            get_temp_dir = functools.partial(
+                NODE_MANAGER.get_upload_temp_dir, dir_path)
+        else:
+            def get_temp_dir(filename):
+                return tempfile.gettempdir()
+        self._receiver = multipart.FileReceiver(get_temp_dir)
+        self._parser = multipart.MultipartParser(boundary, self._receiver)
+
+    def data_received(self, chunk):
+        if not self._parser or self._upload_error:
+            return
+        try:
+            self._parser.feed(chunk)
+        except Exception as e:
+            LOG.exception(e)
+            self._upload_error = str(e)
+            self._receiver.cleanup()
+
+    def on_finish(self):
+        if self._receiver:
+            self._receiver.cleanup()
+
+    def on_connection_close(self):
+        if self._receiver:
+            self._receiver.cleanup()
+
+    async def _write_chunks(self, chunks):
+        """Write chunks one by one and wait for each of them to be flushed
+        to the client, so that only one chunk is buffered in memory.
+        """
+        try:
+            async for data in chunks:
+                self.write(data)
+                await self.flush()
+        except iostream.StreamClosedError:
+            LOG.warning('client closed connection: %s', self.request.uri)
+            return False
+        finally:
+            await chunks.aclose()
+        return True
+
+    @staticmethod
+    async def _local_chunks(abs_path, chunk_size, offset=0, length=None):
+        with open(abs_path, 'rb') as f:
+            fd = f.fileno()
+            end = os.fstat(fd).st_size if length is None else offset + length
+            drop_cache = end - offset >= CONF.api.drop_cache_min_size
+            utils.fadvise(fd, offset, end - offset, 'SEQUENTIAL')
+            f.seek(offset)
+            dropped = offset
+            while offset < end:
+                data = f.read(min(chunk_size, end - offset))
+                if not data:
+                    break
+                offset += len(data)
+                if drop_cache and \
+                   offset - dropped >= constants.SENDFILE_BLOCK_SIZE:
+                    utils.fadvise(fd, dropped, offset - dropped, 'DONTNEED')
+                    dropped = offset
+                yield data
+
+    def _can_sendfile(self, content_type, length):
+        if not CONF.api.use_sendfile or not hasattr(os, 'sendfile'):
+            return False
+        connection = self.request.connection
+        if not isinstance(connection, http1connection.HTTP1Connection) or \
+           isinstance(connection.stream, iostream.SSLIOStream):
+            return False
+        # _sendfile() resets a private attribute of the connection, which is
+        # only known to work with tornado 6, use the chunked reading for
+        # other versions
+        if tornado.version_info[0] != 6 or \
+           not hasattr(connection, '_expected_content_remaining'):
+            return False
+        # the body must not be transformed
+        return not compress.choose_encoding(
+            self.request.headers.get('Accept-Encoding'), content_type,
+            length)
+
+    async def _sendfile(self, abs_path, offset, length):
+        """Send file with os.sendfile, the data is copied by the kernel
+        from page cache to the socket directly.
+        """
+        try:
+            # headers must be sent before the body
+            await self.flush()
+            connection = self.request.connection
+            loop = asyncio.get_running_loop()
+            with open(abs_path, 'rb') as f:
+                fd = f.fileno()
+                drop_cache = length >= CONF.api.drop_cache_min_size
+                utils.fadvise(fd, offset, length, 'SEQUENTIAL')
+                end = offset + length
+                while offset < end:
+                    sent = await loop.sock_sendfile(
+                        connection.stream.socket, f, offset,
+                        min(constants.SENDFILE_BLOCK_SIZE, end - offset))
+                    if not sent:
+                        break
+                    if drop_cache:
+                        utils.fadvise(fd, offset, sent, 'DONTNEED')
+                    offset += sent
+        except (iostream.StreamClosedError, OSError) as e:
+            LOG.warning('send file %s failed: %s', abs_path, e)
+            self.request.connection.stream.close()
+            return False
+        if offset < end:
+            # the file was truncated, the response can not be completed
+            LOG.warning('send file %s failed: %s bytes are missing',
+                        abs_path, end - offset)
+            connection.stream.close()
+            return False
+        # NOTE: the body is written bypass the connection, which counts the
+        # remaining bytes of Content-Length, and finish() raises error if it
+        # is not 0. It is safe to reset it: the headers were flushed and the
+        # write buffer was drained before sendfile, then exactly
+        # Content-Length bytes were sent.
+        connection._expected_content_remaining = 0
+        return True
+
+    @staticmethod
+    async def _remote_chunks(node_info, abs_path, chunk_size, offset=0,
+                             length=None):
+        # sftp reading is blocking, run it in the executor
+        loop = ioloop.IOLoop.current()
+        generator = utils.stream_generator(node_info, abs_path,
+                                           chunk_size=chunk_size,
+                                           offset=offset, length=length)
+        try:
+            while True:
+                data = await loop.run_in_executor(None, next, generator,
+                                                  None)
+                if not data:
+                    break
+                yield data
+        finally:
+            generator.close()
+
+    @staticmethod
+    async def _data_plane_chunks(node_info, dir_path, etag, offset, length):
+        """Read file from the data server of slave node, the file is read
+        window by window, so that the memory of proxy is bounded.
+        """
+        client = httpclient.AsyncHTTPClient()
+        end = offset + length
+        while offset < end:
+            window_end = min(end, offset + CONF.api.proxy_window_size)
+            headers = get_data_headers()
+            headers.update({'Range': f'bytes={offset}-{window_end - 1}',
+                            'If-Range': etag})
+            resp = await client.fetch(get_data_url(node_info, dir_path),
+                                      headers=headers,
+                                      request_timeout=CONF.api.proxy_timeout)
+            if resp.code != 206:
+                raise IOError(f'file {dir_path} changed while reading')
+            if not resp.body:
+                break
+            offset += len(resp.body)
+            yield resp.body
+
+    def _file_chunks(self, node, dir_path, abs_path, etag, offset, length):
+        chunk_size = CONF.api.download_chunk_size
+        if node == NODE_MANAGER.node.hostname:
+            return self._local_chunks(abs_path, chunk_size,
+                                      offset=offset, length=length)
+        node_info = NODE_MANAGER.nodes.get(node)
+        if node_info.data_transport:
+            return self._data_plane_chunks(node_info, dir_path, etag,
+                                           offset, length)
+        return self._remote_chunks(node_info, abs_path, chunk_size,
+                                   offset=offset, length=length)
+
+    async def _multipart_chunks(self, node, dir_path, abs_path, etag, parts,
+                                boundary):
+        for part_header, (start, end) in parts:
+            yield part_header
+            chunks = self._file_chunks(node, dir_path, abs_path, etag,
+                                       start, end - start)
+            try:
+                async for data in chunks:
+                    yield data
+            finally:
+                await chunks.aclose()
+        yield f'\r\n--{boundary}--\r\n'.encode()
+
+    def _get_ranges(self, size, etag, mtime):
+        """Return the ranges to send, None means the whole file
+        """
+        range_header = self.request.headers.get('Range')
+        if not range_header:
+            return None
+        if_range = self.request.headers.get('If-Range')
+        if if_range and \
+           if_range not in (etag, httputil.format_timestamp(mtime)):
+            # file changed, send the whole file
+            return None
+        return utils.parse_range_header(range_header, size)
+
     @ensure_node_exists
-    def get(self, node, dir_path):
+    async def get(self, node, dir_path):
         LOG.info('get file from %s %s', node, dir_path)
-        abs_path = NODE_MANAGER.get_abs_path(dir_path, host=node)
-        if node == NODE_MANAGER.node.hostname:
-            if not NODE_MANAGER.is_file(dir_path):
-                self._finish_with(400, {'error': 'path is not a file'})
+        await self._send_file(node, dir_path)
+
+    async def _send_file(self, node, dir_path):
+        local = node == NODE_MANAGER.node.hostname
+        if local or not NODE_MANAGER.nodes.get(node).data_transport:
+            abs_path = NODE_MANAGER.get_abs_path(dir_path, host=node)
+        else:
+            abs_path = None
+        try:
+            item = NODE_MANAGER.get_path_dict(dir_path, etag=True, host=node)
+        except FileNotFoundError:
+            self._finish_with(404, {'error': 'file not exists'})
+            return
+        if item.folder:
+            self._finish_with(400, {'error': 'path is not a file'})
+            return
+        content_type = mimetypes.guess_type(dir_path)[0] or \
+            'application/octet-stream'
+        etag = f'"{item.etag}"'
+        self.set_header('Accept-Ranges', 'bytes')
+        if self._is_not_modified(etag, item.mtime):
+            self._finish_with(304)
+            return
+        try:
+            ranges = self._get_ranges(item.size, etag, item.mtime)
+        except exception.RangeNotSatisfiable as e:
+            LOG.warning(e)
+            self.set_header('Content-Range', f'bytes */{item.size}')
+            self._finish_with(416)
+            return
+
+        if not ranges:
+            self.set_status(200)
+            self.set_header('Content-Type', content_type)
+            self.set_header('Content-Length', item.size)
+            if local and self._can_sendfile(content_type, item.size):
+                if await self._sendfile(abs_path, 0, item.size):
+                    self.finish()
                 return
-            directory = os.path.dirname(abs_path)
-            send_file = os.path.basename(abs_path)
-            with open(os.path.join(directory, send_file), 'rb') as f:
-                while True:
-                    data = f.read(1024 * 10)
-                    if not data:
-                        break
-                    self.write(data)
+            chunks = self._file_chunks(node, dir_path, abs_path, etag,
+                                       0, item.size)
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            self.set_status(206)
+            self.set_header('Content-Type', content_type)
+            self.set_header('Content-Range',
+                            f'bytes {start}-{end - 1}/{item.size}')
+            self.set_header('Content-Length', end - start)
+            if local and self._can_sendfile(None, end - start):
+                if await self._sendfile(abs_path, start, end - start):
+                    self.finish()
+                return
+            chunks = self._file_chunks(node, dir_path, abs_path, etag,
+                                       start, end - start)
         else:
-            node_info = NODE_MANAGER.nodes.get(node)
-            file_size = NODE_MANAGER.file_size(dir_path, host=node)
-            self.set_header('content-length', file_size)
-            for data in utils.stream_generator(node_info, abs_path):
-                self.write(data)
-        self.set_status(200)
-        self.finish()
+            boundary = uuid.uuid4().hex
+            parts = [
+                (f'\r\n--{boundary}\r\nContent-Type: {content_type}\r\n'
+                 f'Content-Range: bytes {start}-{end - 1}/{item.size}'
+                 '\r\n\r\n'.encode(), (start, end))
+                for start, end in ranges
+            ]
+            self.set_status(206)
+            self.set_header('Content-Type',
+                            f'multipart/byteranges; boundary={boundary}')
+            self.set_header(
+                'Content-Length',
+                sum(len(header) + end - start
+                    for header, (start, end) in parts) +
+                len(f'\r\n--{boundary}--\r\n'))
+            chunks = self._multipart_chunks(node, dir_path, abs_path, etag,
+                                            parts, boundary)
+        if await self._write_chunks(chunks):
+            self.finish()
 
     @ensure_node_exists
-    def post(self, node, dir_path):
-        f = self.request.files.get('file')
-        if not f:
+    async def post(self, node, dir_path):
+        if self._upload_error:
+            self._finish_with(400, {'error': self._upload_error})
+            return
+        if not self._parser.done:
+            self._finish_with(400, {'error': 'multipart body is incomplete'})
+            return
+        files = [f for f in self._receiver.files if f['name'] == 'file']
+        if not files:
             self._finish_with(401, {'error': 'file is null'})
             return
-        if node == NODE_MANAGER.node.hostname:
-            NODE_MANAGER.save_file(dir_path, f)
-        else:
-            node_info = NODE_MANAGER.nodes.get(node)
-            sshclient = ssh.SSHClient(node_info['ip'], node_info['ssh_user'],
-                                      node_info['ssh_password'])
-            save_path = f'{dir_path}/{f.filename}'
-            abs_path = NODE_MANAGER.get_abs_path(save_path, host=node)
-            NODE_MANAGER.ensure_parent_dir(save_path, host=node)
-            sshclient.putfo(f, abs_path, f.content_length)
+        try:
+            if node == NODE_MANAGER.node.hostname:
+                for f in files:
+                    NODE_MANAGER.save_file(dir_path, f['filename'],
+                                           f['temp_path'])
+            else:
+                for f in files:
+                    save_path = NODE_MANAGER.get_save_path(dir_path,
+                                                           f['filename'])
+                    await put_remote_file(node, save_path, f['temp_path'])
+        except Exception as e:
+            LOG.exception(e)
+            self._finish_with(400, {'error': str(e)})
+            return
+        finally:
+            NODE_MANAGER.invalidate_disk_usage(node)
         self._finish_with(200, {'files': {'result': 'file save success'}})
 
 
+class DataViewV1(FileViewV1):
+    """Serve and accept file bodies on slave node
+
+    Master reads and writes the files of slave node with it instead of
+    ssh, GET supports the same headers as FileViewV1, PUT saves the body
+    to the path atomically. The requests without the data token are
+    rejected.
+    """
+
+    def prepare(self):
+        self._receiver = None
+        self._temp_file = None
+        self._temp_path = None
+        token = self.request.headers.get(constants.DATA_TOKEN_HEADER, '')
+        if not CONF.lhfs.data_token or not hmac.compare_digest(
+                token.encode(), CONF.lhfs.data_token.encode()):
+            self._finish_with(401, {'error': 'invalid data token'})
+            return
+        if self.request.method != 'PUT':
+            return
+        self.request.connection.set_max_body_size(CONF.api.upload_max_size)
+        parent, filename = posixpath.split(self.path_kwargs['dir_path'])
+        try:
+            temp_dir = NODE_MANAGER.get_upload_temp_dir(parent, filename)
+        except exception.InvalidFileName as e:
+            self._finish_with(400, {'error': str(e)})
+            return
+        fd, self._temp_path = tempfile.mkstemp(
+            prefix=constants.UPLOAD_TEMP_PREFIX, dir=temp_dir)
+        self._temp_file = os.fdopen(fd, 'wb')
+
+    def data_received(self, chunk):
+        if self._temp_file:
+            self._temp_file.write(chunk)
+
+    async def get(self, dir_path):
+        await self._send_file(NODE_MANAGER.node.hostname, dir_path)
+
+    def post(self, dir_path):
+        self._finish_with(405, {'error': 'method not allowed'})
+
+    def put(self, dir_path):
+        self._temp_file.flush()
+        os.fsync(self._temp_file.fileno())
+        self._temp_file.close()
+        self._temp_file = None
+        parent, filename = posixpath.split(dir_path)
+        NODE_MANAGER.save_file(parent, filename, self._temp_path)
+        self._finish_with(201, {'files': {'result': 'file save success'}})
+
+    def _cleanup(self):
+        if self._temp_file:
+            self._temp_file.close()
+            self._temp_file = None
+        if self._temp_path and os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+
+    def on_finish(self):
+        self._cleanup()
+
+    def on_connection_close(self):
+        self._cleanup()
+
+
+def session_to_dict(session):
+    session_dict = session.to_dict()
+    session_dict.pop('data_path')
+    return session_dict
+
+
+class UploadViewV1(BaseHandler):
+
+    @ensure_node_exists
+    def post(self, node, dir_path):
+        """Create resumable upload session
+        POST /v1/upload/<node>/foo -d '{"upload": {"filename": "bar.zip",
+                                                   "size": 1024}}'
+        """
+        data = json.loads(self.request.body).get('upload', {})
+        filename, size = data.get('filename'), data.get('size')
+        if not filename or not isinstance(size, int) or size < 0:
+            self._finish_with(400, {'error': 'invalid filename or size'})
+            return
+        max_size = CONF.api.upload_max_size
+        if size > max_size:
+            self._finish_with(413, {'error': f'file size exceeds {max_size}'})
+            return
+        try:
+            if node == NODE_MANAGER.node.hostname:
+                data_dir = NODE_MANAGER.get_upload_temp_dir(dir_path,
+                                                            filename)
+            else:
+                NODE_MANAGER.get_save_path(dir_path, filename)
+                data_dir = UPLOAD_MANAGER.session_dir
+            session = UPLOAD_MANAGER.create(node, dir_path, filename, size,
+                                            data_dir)
+        except Exception as e:
+            LOG.exception(e)
+            self._finish_with(400, {'error': str(e)})
+            return
+        self._finish_with(201, {'upload': session_to_dict(session)})
+
+
+class UploadSessionViewV1(BaseHandler):
+
+    def get(self, session_id):
+        try:
+            session = UPLOAD_MANAGER.get(session_id)
+        except exception.UploadSessionNotExists as e:
+            self._finish_with(404, {'error': str(e)})
+            return
+        self._finish_with(200, {'upload': session_to_dict(session)})
+
+    async def put(self, session_id):
+        """Upload a chunk of file
+        PUT /v1/uploads/<session_id>?offset=1024 --data-binary @chunk
+        """
+        try:
+            offset = int(self.get_query_argument('offset'))
+            session = await ioloop.IOLoop.current().run_in_executor(
+                None, UPLOAD_MANAGER.write, session_id, offset,
+                self.request.body)
+        except exception.UploadSessionNotExists as e:
+            self._finish_with(404, {'error': str(e)})
+            return
+        except (ValueError, web.MissingArgumentError,
+                exception.InvalidUploadRange) as e:
+            self._finish_with(400, {'error': str(e)})
+            return
+        self._finish_with(200, {'upload': session_to_dict(session)})
+
+    async def post(self, session_id):
+        """Commit upload session, the file is moved to the target path
+        """
+        try:
+            session = UPLOAD_MANAGER.get(session_id)
+        except exception.UploadSessionNotExists as e:
+            self._finish_with(404, {'error': str(e)})
+            return
+        if not session.is_completed():
+            self._finish_with(409, {'error': 'upload is not completed',
+                                    'upload': session_to_dict(session)})
+            return
+        try:
+            if session.node == NODE_MANAGER.node.hostname:
+                NODE_MANAGER.save_file(session.path, session.filename,
+                                       session.data_path)
+            else:
+                save_path = NODE_MANAGER.get_save_path(session.path,
+                                                       session.filename)
+                await put_remote_file(session.node, save_path,
+                                      session.data_path)
+        except Exception as e:
+            LOG.exception(e)
+            self._finish_with(400, {'error': str(e)})
+            return
+        finally:
+            NODE_MANAGER.invalidate_disk_usage(session.node)
+        UPLOAD_MANAGER.remove(session_id)
+        self._finish_with(200, {'files': {'result': 'file save success'}})
+
+    def delete(self, session_id):
+        UPLOAD_MANAGER.remove(session_id)
+        self._finish_with(204)
+
+
+def parse_search_params(body):
+    """Parse the body of search request
+
+    Return (partern, mode, use_index, limit, timeout), limit and timeout
+    are capped by api.search_max_limit and api.search_timeout. Raise
+    ValueError if they are invalid.
+    """
+    data = json.loads(body or '{}').get('search', {})
+    partern = data.get('partern')
+    if not partern:
+        raise ValueError('partern is none')
+    try:
+        limit = min(int(data.get('limit') or CONF.api.search_max_limit),
+                    CONF.api.search_max_limit)
+        timeout = min(float(data.get('timeout') or CONF.api.search_timeout),
+                      CONF.api.search_timeout)
+    except (TypeError, ValueError):
+        raise ValueError('invalid limit or timeout')
+    return (partern, data.get('mode', 'glob'), bool(data.get('index', True)),
+            limit, timeout)
+
+
 class SearchViewV1(BaseHandler):
 
     def get(self, node):
         self._finish_with(
             200,
-            {'search': {'history': NODE_MANAGER.get_search_history(host=node)}}
+            {'search': {'history': NODE_MANAGER.get_search_history(host=node),
+                        'index': NODE_MANAGER.index_status(host=node)}}
         )
 
     @ensure_node_exists
-    def post(self, node):
+    async def post(self, node):
         """
-        params: {'search': {'partern': '*.py'}}
+        params: {'search': {'partern': '*.py', 'mode': 'glob', 'index': true,
+                            'limit': 1000, 'timeout': 10}}
+        mode is glob or substring, set index to false to walk the
+        directories instead of searching in the filename index. The search
+        stops after limit items or timeout seconds, they are capped by
+        api.search_max_limit and api.search_timeout.
+        With header Accept: application/x-ndjson, the matched items are
+        streamed once they are found, and the search stops if the client is
+        disconnected.
         """
-        data = json.loads(self.request.body)
-        partern = data.get('search', {}).get('partern')
-        if not partern:
-            self._finish_with(400, {'error': 'partern is none'})
+        try:
+            partern, mode, use_index, limit, timeout = \
+                parse_search_params(self.request.body)
+        except ValueError as e:
+            self._finish_with(400, {'error': str(e)})
+            return
+        if self._accept_ndjson():
+            await self._stream_search(node, partern, mode, use_index, limit,
+                                      timeout)
             return
-        matched_pathes = NODE_MANAGER.find(partern, host=node)
-        self._finish_with(200, {'search': {'dirs': matched_pathes}})
+        try:
+            matched_pathes = await ioloop.IOLoop.current().run_in_executor(
+                None, functools.partial(
+                    NODE_MANAGER.find, partern, mode=mode,
+                    use_index=use_index, limit=limit, timeout=timeout,
+                    host=node))
+        except exception.InvalidSearchMode as e:
+            self._finish_with(400, {'error': str(e)})
+            return
+        self._finish_with(200, {'search': {
+            'dirs': matched_pathes,
+            'truncated': len(matched_pathes) >= limit}})
+
+    async def _stream_search(self, node, partern, mode, use_index, limit,
+                             timeout):
+        cancel = threading.Event()
+        try:
+            # the search on remote node is started with rpc
+            matched_pathes = await ioloop.IOLoop.current().run_in_executor(
+                None, functools.partial(
+                    NODE_MANAGER.iter_find, partern, mode=mode,
+                    use_index=use_index, limit=limit, cancel=cancel,
+                    timeout=timeout, host=node))
+        except Exception as e:
+            LOG.exception(e)
+            self._finish_with(400, {'error': str(e)})
+            return
+        await self._finish_ndjson(
+            matched_pathes,
+            lambda count: {'partern': partern, 'count': count,
+                           'truncated': count >= limit,
+                           'timed_out': cancel.is_set()},
+            cancel=cancel, timeout=timeout)
+
+
+class GrepViewV1(BaseHandler):
+
+    @staticmethod
+    def _parse_params(body):
+        data = json.loads(body or '{}').get('grep', {})
+        pattern = data.get('pattern')
+        if not pattern or not isinstance(pattern, str):
+            raise ValueError('pattern is none')
+        try:
+            params = {
+                'path': str(data.get('path') or '/'),
+                'glob': data.get('glob') or None,
+                'regex': bool(data.get('regex', False)),
+                'ignore_case': bool(data.get('ignore_case', False)),
+                'max_size': min(int(data.get('max_size') or
+                                    CONF.lhfs.grep_max_size),
+                                CONF.lhfs.grep_max_size),
+                'context': max(0, min(int(data.get('context') or 0),
+                                      constants.GREP_MAX_CONTEXT)),
+                'limit': min(int(data.get('limit') or
+                                 CONF.api.search_max_limit),
+                             CONF.api.search_max_limit),
+                'timeout': min(float(data.get('timeout') or
+                                     CONF.api.search_timeout),
+                               CONF.api.search_timeout),
+            }
+        except (TypeError, ValueError):
+            raise ValueError('invalid max_size, context, limit or timeout')
+        return pattern, params
+
+    @ensure_node_exists
+    async def post(self, node):
+        """Search the content of files
+        params: {'grep': {'pattern': 'foo', 'path': '/', 'glob': '*.py',
+                          'regex': false, 'ignore_case': false,
+                          'max_size': 1048576, 'context': 2, 'limit': 1000,
+                          'timeout': 10}}
+        The matched lines are {'path', 'line', 'text', 'before', 'after'},
+        binary files and the files bigger than max_size are skipped.
+        With header Accept: application/x-ndjson, the matched lines are
+        streamed once they are found, and the search stops if the client is
+        disconnected.
+        """
+        try:
+            pattern, params = self._parse_params(self.request.body)
+        except ValueError as e:
+            self._finish_with(400, {'error': str(e)})
+            return
+        loop = ioloop.IOLoop.current()
+        if not self._accept_ndjson():
+            try:
+                matches = await loop.run_in_executor(
+                    None, functools.partial(NODE_MANAGER.grep, pattern,
+                                            host=node, **params))
+            except Exception as e:
+                LOG.exception(e)
+                self._finish_with(400, {'error': str(e)})
+                return
+            self._finish_with(200, {'grep': {
+                'matches': matches,
+                'truncated': len(matches) >= params['limit']}})
+            return
+
+        cancel = threading.Event()
+        try:
+            matches = await loop.run_in_executor(
+                None, functools.partial(NODE_MANAGER.iter_grep, pattern,
+                                        cancel=cancel, host=node, **params))
+        except Exception as e:
+            LOG.exception(e)
+            self._finish_with(400, {'error': str(e)})
+            return
+        await self._finish_ndjson(
+            matches,
+            lambda count: {'pattern': pattern, 'count': count,
+                           'truncated': count >= params['limit'],
+                           'timed_out': cancel.is_set()},
+            cancel=cancel, timeout=params['timeout'])
+
+
+class ClusterSearchViewV1(BaseHandler):
+
+    async def post(self):
+        """Search on all the active nodes concurrently
+        params: the same as SearchViewV1
+        timeout is the max seconds of each node, the nodes which do not
+        reply in time are marked as timeout in nodes, the items found on
+        the others are returned. The items are ranked by relevance and
+        tagged with key node.
+        """
+        try:
+            partern, mode, use_index, limit, timeout = \
+                parse_search_params(self.request.body)
+        except ValueError as e:
+            self._finish_with(400, {'error': str(e)})
+            return
+        try:
+            items, nodes = await ioloop.IOLoop.current().run_in_executor(
+                None, functools.partial(
+                    NODE_MANAGER.find_all, partern, mode=mode,
+                    use_index=use_index, limit=limit, timeout=timeout))
+        except exception.InvalidSearchMode as e:
+            self._finish_with(400, {'error': str(e)})
+            return
+        self._finish_with(200, {'search': {
+            'dirs': items, 'nodes': nodes,
+            'truncated': len(items) >= limit or
+            any(node.get('truncated') for node in nodes.values()),
+            'partial': any(node['status'] != 'ok' or node['timed_out']
+                           for node in nodes.values())}})
 
 
 class AuthView(BaseHandler):
@@ -246,6 +1095,101 @@ class NodesView(BaseHandler):
         self._finish_with(200, {'nodes': [node.to_dict() for node in nodes]})
 
 
+class StatViewV1(BaseHandler):
+
+    @ensure_node_exists
+    async def post(self, node):
+        """Get the metadata of many paths
+        params: {'stat': {'paths': ['/foo', '/bar'], 'etag': false}}
+        The items are in the same order as paths, null if path not exists.
+        """
+        data = json.loads(self.request.body)
+        paths = data.get('stat', {}).get('paths')
+        if not isinstance(paths, list) or \
+           not all(isinstance(path, str) for path in paths):
+            self._finish_with(400, {'error': 'paths must be a list'})
+            return
+        if len(paths) > CONF.api.stat_max_paths:
+            self._finish_with(
+                400, {'error': f'too many paths, the max is '
+                               f'{CONF.api.stat_max_paths}'})
+            return
+        try:
+            items = await ioloop.IOLoop.current().run_in_executor(
+                None, functools.partial(
+                    NODE_MANAGER.stat_many, paths,
+                    etag=bool(data['stat'].get('etag')), host=node))
+        except Exception as e:
+            LOG.exception(e)
+            self._finish_with(400, {'error': str(e)})
+            return
+        self._finish_with(200, {'stat': [item and item.to_dict(human=True)
+                                         for item in items]})
+
+
+class ThumbViewV1(BaseHandler):
+
+    @ensure_node_exists
+    async def get(self, node, dir_path):
+        """Get the thumbnail of image or video
+        GET /v1/thumb/<node>/foo.jpg?size=256
+        """
+        try:
+            size = int(self.get_query_argument('size', '256'))
+            thumb.check_size(size)
+        except (ValueError, exception.InvalidThumbnailSize) as e:
+            self._finish_with(400, {'error': str(e)})
+            return
+        try:
+            item = NODE_MANAGER.get_path_dict(dir_path, etag=True, host=node)
+        except FileNotFoundError:
+            self._finish_with(404, {'error': 'file not exists'})
+            return
+        if self._is_not_modified(f'"{item.etag}-{size}"', item.mtime):
+            self._finish_with(304)
+            return
+        try:
+            data = await ioloop.IOLoop.current().run_in_executor(
+                None, functools.partial(NODE_MANAGER.thumbnail, dir_path,
+                                        size, host=node))
+        except exception.ThumbnailNotSupported as e:
+            self._finish_with(415, {'error': str(e)})
+            return
+        except Exception as e:
+            LOG.exception(e)
+            self._finish_with(400, {'error': str(e)})
+            return
+        self.set_header('Content-Type', thumb.THUMB_CONTENT_TYPE)
+        self.finish(data)
+
+
+class DuViewV1(BaseHandler):
+
+    @ensure_node_exists
+    async def get(self, node, dir_path):
+        """Get the recursive size of directory
+        GET /v1/du/<node>/foo
+        """
+        try:
+            result = await ioloop.IOLoop.current().run_in_executor(
+                None, functools.partial(NODE_MANAGER.du, dir_path or '/',
+                                        host=node))
+        except exception.FileNotExists as e:
+            self._finish_with(404, {'error': str(e)})
+            return
+        except Exception as e:
+            LOG.exception(e)
+            self._finish_with(400, {'error': str(e)})
+            return
+        self._finish_with(200, {'du': result})
+
+
+class SFTPPoolView(BaseHandler):
+
+    def get(self):
+        self._finish_with(200, {'sftp_pool': sshpool.SFTP_POOL.stats()})
+
+
 class NodeView(web.RequestHandler):
 
     def get(self, hostname):
@@ -4,4 +4,19 @@ import nox
 @nox.session
 def flake8(session):
     session.install("flake8")
-    session.run("flake8", "lhfs", 'noxfile.py')
+    session.run("flake8", "lhfs", 'benchmarks', 'noxfile.py')
+
+
+@nox.session
+def import_time(session):
+    session.install("-r", "requirements.txt")
+    session.install(".")
+    session.run("python", "benchmarks/import_time.py")
+
+
+@nox.session
+def unit(session):
+    session.install("-r", "requirements.txt")
+    session.install(".")
+    session.run("python", "-m", "unittest", "discover", "-s", "lhfs/tests",
+                "-t", ".")